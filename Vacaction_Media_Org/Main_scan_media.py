@@ -4,9 +4,27 @@ import sys
 import argparse
 import logging
 import sqlite3
-from datetime import datetime               
-from metadata_extractor import MetadataExtractor
+import math
+from datetime import datetime, timezone as dt_timezone
+from bisect import bisect_left
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from metadata_extractor import MetadataExtractor, haversine_km, technical_metadata, TECHNICAL_FIELDS
+from geo_cache import GEO_CACHE_GRID
+from geo_shards import GEO_MEMORY_MB
+from exif_reader import read_exif
+from media_walker import DirectoryWalker, build_dir_cache
+from media_watcher import MediaWatcher
+from content_hash import partial_hash, full_hash, hash_files
+from video_reader import read_video_metadata
+from perceptual_hash import dhash, dhash_file, dhash_files
+from scan_profiler import profiler
+import shutil
 import subprocess
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
 
 # Optional imports for thumbnail generation
 try:
@@ -20,12 +38,134 @@ except ImportError:
 logging.basicConfig(level=logging.INFO, format=
     '%(asctime)s - %(levelname)s - %(message)s')
 
+# Map clustering: aggregates are precomputed for zoom levels 0..CLUSTER_MAX_ZOOM.
+# Each Web Mercator tile (256px) is split into 2^CLUSTER_CELL_BITS x 2^CLUSTER_CELL_BITS cells (64px).
+CLUSTER_MAX_ZOOM = 18
+CLUSTER_CELL_BITS = 2
+
+# creation_time is stored as camera wall-clock time, normally 'YYYY-MM-DD HH-MM-SS'
+CREATION_TIME_FORMATS = ('%Y-%m-%d %H-%M-%S', '%Y-%m-%d %H:%M:%S')
+
+# Scan journal: files are processed in batches, each stage of a batch is committed before the next one
+SCAN_BATCH_SIZE = 100
+SCAN_STAGE_QUEUED = 0
+SCAN_STAGE_STORED = 1        # metadata extracted, geocoded and inserted into media_files
+SCAN_STAGE_DONE = 2          # thumbnail generated
+
+# Semantic analysis (--analyze): results written per batch, torch/OpenCV/ffmpeg threads per pool worker
+ANALYZE_BATCH_SIZE = 20
+ANALYZE_WORKER_THREADS = 2
+ANALYSIS_DONE = 'done'
+ANALYSIS_PARTIAL = 'partial'     # some analysis step failed, the results of the others are stored
+ANALYSIS_FAILED = 'failed'       # the video could not be decoded, retried by every --analyze run
+
+# ffprobe/ffmpeg calls for thumbnails are aborted after this many seconds, so a broken file cannot stall a scan
+FFMPEG_TIMEOUT = 120
+
+# Geo name columns stored per place (and, before the places table existed, on every media row)
+PLACE_COLUMNS = ('city_en', 'city_zh', 'region_en', 'region_zh', 'subregion_en', 'subregion_zh',
+                 'country_code', 'country_en', 'country_zh', 'timezone')
+
+def creation_epoch(creation_time, timezone=None, utc=False):
+    """
+    Convert a stored creation_time string to (creation_ts, tz_offset):
+    creation_ts is the UTC epoch in seconds and tz_offset the UTC offset in seconds of the
+    media's timezone at that moment. Without a known timezone the wall-clock time is taken
+    as UTC and tz_offset is None, so creation_ts + COALESCE(tz_offset, 0) is always the
+    wall-clock time as epoch seconds. Returns (None, None) when the string cannot be parsed.
+    utc marks a string that is already UTC (the mvhd creation time of MP4/MOV videos): it is
+    creation_ts as is, and tz_offset is the timezone's offset at that instant.
+    """
+    if not creation_time:
+        return None, None
+    local_time = None
+    for fmt in CREATION_TIME_FORMATS:
+        try:
+            local_time = datetime.strptime(creation_time[:19], fmt)
+            break
+        except ValueError:
+            continue
+    if local_time is None:
+        return None, None
+
+    zone = None
+    if timezone:
+        try:
+            zone = ZoneInfo(timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            logging.debug("Unknown timezone '%s' for creation time %s", timezone, creation_time)
+    wall_clock = int(local_time.replace(tzinfo=dt_timezone.utc).timestamp())
+    if utc:
+        tz_offset = int(datetime.fromtimestamp(wall_clock, zone).utcoffset().total_seconds()) if zone else None
+        return wall_clock, tz_offset
+    tz_offset = int(local_time.replace(tzinfo=zone).utcoffset().total_seconds()) if zone else None
+    return wall_clock - (tz_offset or 0), tz_offset
+
+def cluster_cell(latitude, longitude, zoom):
+    """Return the (x, y) Web Mercator grid cell of a coordinate at the given map zoom."""
+    n = 2 ** (zoom + CLUSTER_CELL_BITS)
+    lat = max(min(latitude, 85.05112878), -85.05112878)
+    lat_rad = math.radians(lat)
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.log(math.tan(lat_rad) + 1.0 / math.cos(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def thumbnail_path_for(filepath):
+    """Thumbnails are stored next to the media file as <name>_thumb.jpg"""
+    name_without_ext = os.path.splitext(os.path.basename(filepath))[0]
+    return os.path.join(os.path.dirname(filepath), f"{name_without_ext}_thumb.jpg")
+
+def video_thumbnail_timestamp(filepath):
+    """
+    Seconds into the video for its thumbnail (10% of the duration, at most 1 second),
+    or None if the file has no video stream or cannot be probed.
+    """
+    video_info = read_video_metadata(filepath)
+    if video_info:
+        if not video_info['HasVideo']:
+            logging.warning(f"No video streams found in {filepath}")
+            return None
+        duration = video_info['Duration']
+        return min(1.0, duration * 0.1) if duration else 0.1
+
+    # Other containers, or boxes the native reader does not understand: ask ffprobe
+    info_cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', filepath]
+    info_result = subprocess.run(info_cmd, capture_output=True, text=True, timeout=FFMPEG_TIMEOUT)
+    
+    if info_result.returncode != 0:
+        logging.warning(f"ffprobe failed for {filepath}, file might be corrupted")
+        return None
+    
+    # Parse ffprobe output to check for video streams
+    try:
+        import json
+        probe_data = json.loads(info_result.stdout)
+        video_streams = [s for s in probe_data.get('streams', []) if s.get('codec_type') == 'video']
+        
+        if not video_streams:
+            logging.warning(f"No video streams found in {filepath}")
+            return None
+            
+        # Get duration to determine best timestamp for thumbnail
+        duration = video_streams[0].get('duration')
+        if duration:
+            # Use 10% of duration or 1 second, whichever is smaller
+            timestamp = min(1.0, float(duration) * 0.1)
+        else:
+            timestamp = 0.1  # Very early timestamp for problematic files
+            
+    except (json.JSONDecodeError, ValueError, KeyError):
+        logging.warning(f"Could not parse video info for {filepath}, using default timestamp")
+        timestamp = 0.1
+    return timestamp
+
 class MediaOrganizerDB:
     def __init__(self, rescan=False, db_path='media_organizer.db'):
         self.db_path = db_path
         self.conn = None
         self.cursor = None
         self.rescan = rescan
+        self._place_ids = {}
 
         if self.rescan and os.path.exists(self.db_path):
             logging.info(f"Rescan requested. Deleting existing database: {self.db_path}")
@@ -33,12 +173,13 @@ class MediaOrganizerDB:
 
         self._connect()
         self._create_table()
+        self._migrate_schema()
 
     def _connect(self):
         try:
             self.conn = sqlite3.connect(self.db_path)
             self.cursor = self.conn.cursor()
-            logging.debug(f"Connected to database: {self.db_path}")
+            logging.debug("Connected to database: %s", self.db_path)
         except sqlite3.Error as e:
             logging.error(f"Database connection error: {e}")
             sys.exit(1)
@@ -47,6 +188,25 @@ class MediaOrganizerDB:
         # if media_files table does not exist, create it with geo fields
         # Otherwise skip the creation
         try:
+            # One row per geo-list place; media rows only carry the place_id
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS places (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    city_en TEXT NOT NULL DEFAULT '',
+                    city_zh TEXT,
+                    region_en TEXT NOT NULL DEFAULT '',
+                    region_zh TEXT,
+                    subregion_en TEXT NOT NULL DEFAULT '',
+                    subregion_zh TEXT,
+                    country_code TEXT NOT NULL DEFAULT '',
+                    country_en TEXT,
+                    country_zh TEXT,
+                    timezone TEXT,
+                    UNIQUE (city_en, region_en, subregion_en, country_code)
+                )
+            ''')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_places_country_en ON places (country_en)')
+
             self.cursor.execute('''
                 CREATE TABLE IF NOT EXISTS media_files (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -55,26 +215,162 @@ class MediaOrganizerDB:
                     file_extension TEXT NOT NULL,
                     file_type TEXT,
                     size INTEGER,
+                    mtime INTEGER,
                     creation_time TEXT,
+                    creation_ts INTEGER,
+                    tz_offset INTEGER,
                     latitude REAL,
                     longitude REAL,
-                    city_en TEXT,
-                    city_zh TEXT,
-                    region_en TEXT,
-                    region_zh TEXT,
-                    subregion_en TEXT,
-                    subregion_zh TEXT,
-                    country_code TEXT,
-                    country_en TEXT,
-                    country_zh TEXT,
-                    timezone TEXT,
+                    place_id INTEGER REFERENCES places (id),
+                    partial_hash TEXT,
+                    content_hash TEXT,
+                    perceptual_hash INTEGER,
                     people_count INTEGER DEFAULT 0,
                     activities TEXT,
                     scenery TEXT,
                     talking_detected BOOLEAN DEFAULT 0,
+                    analysis_version TEXT,
+                    analysis_status TEXT,
+                    analyzed_at TEXT,
                     scanned_at TEXT DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
+            # R*Tree spatial index over media coordinates, kept in sync with media_files by triggers
+            self.cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'media_rtree'")
+            rtree_exists = self.cursor.fetchone() is not None
+            self.cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS media_rtree USING rtree (
+                    id, min_lat, max_lat, min_lon, max_lon
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS media_rtree_insert AFTER INSERT ON media_files
+                WHEN NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL
+                BEGIN
+                    INSERT OR REPLACE INTO media_rtree VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+                END
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS media_rtree_update AFTER UPDATE OF latitude, longitude ON media_files
+                BEGIN
+                    DELETE FROM media_rtree WHERE id = OLD.id;
+                    INSERT INTO media_rtree SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+                        WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+                END
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS media_rtree_delete AFTER DELETE ON media_files
+                BEGIN
+                    DELETE FROM media_rtree WHERE id = OLD.id;
+                END
+            ''')
+            if not rtree_exists:
+                # Existing database: index the coordinates that were stored before the R*Tree existed
+                self.cursor.execute('''
+                    INSERT INTO media_rtree
+                    SELECT id, latitude, latitude, longitude, longitude FROM media_files
+                    WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                ''')
+                logging.info(f"Created spatial index for {self.cursor.rowcount} media files.")
+
+            # Technical metadata stored by the extraction pass, so thumbnails and the web app need not probe files.
+            # orientation is the EXIF orientation (1-8), video rotation is mapped to it.
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS media_technical (
+                    media_id INTEGER PRIMARY KEY REFERENCES media_files (id),
+                    width INTEGER,
+                    height INTEGER,
+                    orientation INTEGER,
+                    duration REAL,
+                    fps REAL,
+                    codec TEXT,
+                    make TEXT,
+                    model TEXT
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS media_technical_delete AFTER DELETE ON media_files
+                BEGIN
+                    DELETE FROM media_technical WHERE media_id = OLD.id;
+                END
+            ''')
+
+            # Per-day media counts by type and place (wall-clock day), rebuilt by rebuild_daily_counts().
+            # place_id 0 collects the media without a place.
+            if 'city_en' in self._table_columns('daily_counts'):
+                # Older layout keyed by city name. It is only an aggregate, rebuild_daily_counts() refills it.
+                self.cursor.execute('DROP TABLE daily_counts')
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS daily_counts (
+                    day TEXT NOT NULL,
+                    file_type TEXT NOT NULL,
+                    place_id INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (day, file_type, place_id)
+                )
+            ''')
+
+            # Directory mtimes of the last completed scan, lets DirectoryWalker skip unchanged directories
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS scanned_dirs (
+                    path TEXT PRIMARY KEY,
+                    parent TEXT,
+                    mtime_ns INTEGER NOT NULL
+                )
+            ''')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_scanned_dirs_parent ON scanned_dirs (parent)')
+
+            # Scan journal: one session per scan run, every walked file with the last completed stage
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS scan_sessions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    root TEXT NOT NULL,
+                    started_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                    finished_at TEXT,
+                    walk_done BOOLEAN DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'running'
+                )
+            ''')
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS scan_queue (
+                    session_id INTEGER NOT NULL REFERENCES scan_sessions (id),
+                    filepath TEXT NOT NULL,
+                    stage INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (session_id, filepath)
+                )
+            ''')
+
+            # Precomputed map clusters per zoom level, rebuilt by rebuild_geo_clusters()
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS geo_clusters (
+                    zoom INTEGER NOT NULL,
+                    cell_x INTEGER NOT NULL,
+                    cell_y INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    latitude REAL NOT NULL,
+                    longitude REAL NOT NULL,
+                    min_lat REAL NOT NULL,
+                    min_lon REAL NOT NULL,
+                    max_lat REAL NOT NULL,
+                    max_lon REAL NOT NULL,
+                    sample_id INTEGER,
+                    PRIMARY KEY (zoom, cell_x, cell_y)
+                )
+            ''')
+            self.cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_geo_clusters_zoom_lat_lon ON geo_clusters (zoom, latitude, longitude)')
+
+            # Reverse geocoding memo of MetadataExtractor (geo_cache.py): nearest geo-list place per grid cell,
+            # stamped with the geo list version and grid size
+            self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS geo_cache (
+                    lat_key INTEGER NOT NULL,
+                    lon_key INTEGER NOT NULL,
+                    stamp TEXT NOT NULL,
+                    place TEXT NOT NULL,
+                    PRIMARY KEY (lat_key, lon_key)
+                )
+            ''')
             self.conn.commit()
             logging.debug("Media files table ensured to exist with geo fields.")
         except sqlite3.Error as e:
@@ -82,178 +378,859 @@ class MediaOrganizerDB:
             logging.error(f"Warning creating table: {e}")
             # sys.exit(1)
 
+    def _table_columns(self, table):
+        self.cursor.execute(f'PRAGMA table_info({table})')
+        return {row[1] for row in self.cursor.fetchall()}
+
+    def _migrate_schema(self):
+        """Bring databases created by older versions up to the current schema."""
+        try:
+            columns = self._table_columns('media_files')
+            legacy_columns = [column for column in PLACE_COLUMNS if column in columns]
+            # The legacy geo name columns are dropped below: keep a copy of the database first
+            drop_legacy = (bool(legacy_columns) and sqlite3.sqlite_version_info >= (3, 35, 0)
+                           and self._backup_database())
+
+            # Geo names moved from every media row into the places table
+            if 'place_id' not in columns:
+                self.cursor.execute('ALTER TABLE media_files ADD COLUMN place_id INTEGER REFERENCES places (id)')
+            self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_media_files_place_id ON media_files (place_id)')
+            if 'city_en' in legacy_columns:
+                self.cursor.execute('''
+                    INSERT OR IGNORE INTO places (
+                        city_en, city_zh, region_en, region_zh, subregion_en, subregion_zh,
+                        country_code, country_en, country_zh, timezone
+                    )
+                    SELECT city_en, MAX(city_zh), COALESCE(region_en, ''), MAX(region_zh),
+                           COALESCE(subregion_en, ''), MAX(subregion_zh), COALESCE(country_code, ''),
+                           MAX(country_en), MAX(country_zh), MAX(timezone)
+                    FROM media_files
+                    WHERE city_en IS NOT NULL
+                    GROUP BY city_en, COALESCE(region_en, ''), COALESCE(subregion_en, ''), COALESCE(country_code, '')
+                ''')
+                self.cursor.execute('''
+                    UPDATE media_files SET place_id = (
+                        SELECT p.id FROM places p
+                        WHERE p.city_en = media_files.city_en
+                          AND p.region_en = COALESCE(media_files.region_en, '')
+                          AND p.subregion_en = COALESCE(media_files.subregion_en, '')
+                          AND p.country_code = COALESCE(media_files.country_code, '')
+                    )
+                    WHERE city_en IS NOT NULL AND place_id IS NULL
+                ''')
+                logging.info(f"Migrated geo names of {self.cursor.rowcount} media files to the places table.")
+            vacuum = False
+            if legacy_columns:
+                if drop_legacy:
+                    for column in legacy_columns:
+                        self.cursor.execute(f'ALTER TABLE media_files DROP COLUMN {column}')
+                    vacuum = True
+                elif sqlite3.sqlite_version_info < (3, 35, 0):
+                    logging.warning(f"SQLite {sqlite3.sqlite_version} cannot drop columns, "
+                                    f"the unused geo name columns stay in media_files.")
+                else:
+                    logging.warning("The unused geo name columns stay in media_files until a backup can be written.")
+
+            # File modification time, used by sync_with_filesystem() to detect changed files
+            if 'mtime' not in columns:
+                self.cursor.execute('ALTER TABLE media_files ADD COLUMN mtime INTEGER')
+
+            # Content identity: partial (size/head/tail) hash of every file, full hash where partial hashes collide
+            if 'partial_hash' not in columns:
+                self.cursor.execute('ALTER TABLE media_files ADD COLUMN partial_hash TEXT')
+            if 'content_hash' not in columns:
+                self.cursor.execute('ALTER TABLE media_files ADD COLUMN content_hash TEXT')
+            self.cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_media_files_partial_hash ON media_files (partial_hash)')
+            self.cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_media_files_content_hash ON media_files (content_hash)')
+
+            # 64-bit difference hash of the thumbnail for near-duplicate (burst / re-encode) lookups
+            if 'perceptual_hash' not in columns:
+                self.cursor.execute('ALTER TABLE media_files ADD COLUMN perceptual_hash INTEGER')
+
+            # Semantic analysis stamp and outcome per row, so --analyze resumes and re-runs when the models change
+            for column in ('analysis_version', 'analysis_status', 'analyzed_at'):
+                if column not in columns:
+                    self.cursor.execute(f'ALTER TABLE media_files ADD COLUMN {column} TEXT')
+
+            # Integer UTC epoch + timezone offset, backfilled from the creation_time string and timezone
+            if 'creation_ts' not in columns:
+                self.cursor.execute('ALTER TABLE media_files ADD COLUMN creation_ts INTEGER')
+            if 'tz_offset' not in columns:
+                self.cursor.execute('ALTER TABLE media_files ADD COLUMN tz_offset INTEGER')
+            self.cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_media_files_creation_ts ON media_files (creation_ts)')
+            # user_version 1: video creation times are UTC. Videos converted before took them as
+            # wall-clock time, so all of them are converted again once
+            self.cursor.execute('PRAGMA user_version')
+            redo_videos = self.cursor.fetchone()[0] < 1
+            self.cursor.execute(f'''
+                SELECT m.id, m.creation_time, p.timezone, m.file_type
+                FROM media_files m LEFT JOIN places p ON p.id = m.place_id
+                WHERE m.creation_time IS NOT NULL
+                  AND (m.creation_ts IS NULL {"OR m.file_type = 'Video'" if redo_videos else ''})
+            ''')
+            backfill = []
+            for media_id, creation_time, timezone, file_type in self.cursor.fetchall():
+                creation_ts, tz_offset = creation_epoch(creation_time, timezone, utc=file_type == 'Video')
+                if creation_ts is not None:
+                    backfill.append((creation_ts, tz_offset, media_id))
+            if backfill:
+                self.cursor.executemany(
+                    'UPDATE media_files SET creation_ts = ?, tz_offset = ? WHERE id = ?', backfill)
+                logging.info(f"Migrated creation_time to epoch timestamps for {len(backfill)} media files.")
+            if redo_videos:
+                self.cursor.execute('PRAGMA user_version = 1')
+
+            self.conn.commit()
+            if vacuum:
+                # Give the space of the dropped columns back to the file system
+                self.conn.execute('VACUUM')
+        except sqlite3.Error as e:
+            logging.error(f"Error migrating database schema: {e}")
+            self.conn.rollback()
+
+    def _backup_database(self):
+        """
+        Copy the database as it was before this run's migration to <db_path>.bak, ahead of a step that
+        drops data. An existing backup is kept, it holds the older state. Returns False if none could be made.
+        """
+        backup_path = self.db_path + '.bak'
+        if os.path.exists(backup_path):
+            logging.info(f"Keeping the existing database backup {backup_path}.")
+            return True
+        # The backup API copies the committed state, _create_table() has already committed its tables
+        self.conn.commit()
+        try:
+            backup = sqlite3.connect(backup_path)
+            try:
+                self.conn.backup(backup)
+            finally:
+                backup.close()
+        except sqlite3.Error as e:
+            logging.error(f"Could not back up the database to {backup_path}: {e}")
+            return False
+        logging.info(f"Backed up the database to {backup_path} before dropping the old geo name columns.")
+        return True
+
     def file_exists(self, filepath):
         self.cursor.execute(
             'SELECT 1 FROM media_files WHERE filepath = ?', (filepath,))
         return self.cursor.fetchone() is not None
 
-    def add_media_file(self, metadata):
+    def get_place_id(self, geo_data):
+        """
+        Return the places row id for the geo names in geo_data (as returned by get_geo_from_coordinates),
+        inserting the place on first use. Returns None when geo_data has no city.
+        """
+        if not geo_data or not geo_data.get('city_en'):
+            return None
+        key = (geo_data.get('city_en'), geo_data.get('region_en') or '',
+               geo_data.get('subregion_en') or '', geo_data.get('country_code') or '')
+        place_id = self._place_ids.get(key)
+        if place_id is not None:
+            return place_id
+
+        self.cursor.execute('''
+            INSERT OR IGNORE INTO places (
+                city_en, city_zh, region_en, region_zh, subregion_en, subregion_zh,
+                country_code, country_en, country_zh, timezone
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (
+            key[0], geo_data.get('city_zh'), key[1], geo_data.get('region_zh'),
+            key[2], geo_data.get('subregion_zh'), key[3],
+            geo_data.get('country_en'), geo_data.get('country_zh'), geo_data.get('timezone'),
+        ))
+        self.cursor.execute('''
+            SELECT id FROM places
+            WHERE city_en = ? AND region_en = ? AND subregion_en = ? AND country_code = ?
+        ''', key)
+        place_id = self.cursor.fetchone()[0]
+        self._place_ids[key] = place_id
+        return place_id
+
+    def start_scan_session(self, root):
+        """Start a new journaled scan of root and return its session id"""
+        # A new full scan supersedes any interrupted one
+        self.cursor.execute('''
+            DELETE FROM scan_queue WHERE session_id IN (
+                SELECT id FROM scan_sessions WHERE root = ? AND status = 'running'
+            )
+        ''', (root,))
+        self.cursor.execute("UPDATE scan_sessions SET status = 'abandoned' WHERE root = ? AND status = 'running'", (root,))
+        self.cursor.execute('INSERT INTO scan_sessions (root) VALUES (?)', (root,))
+        self.conn.commit()
+        return self.cursor.lastrowid
+
+    def get_resumable_session(self, root):
+        """Return (session id, walk_done) of the last unfinished scan of root, or None"""
+        self.cursor.execute('''
+            SELECT id, walk_done FROM scan_sessions
+            WHERE root = ? AND status = 'running'
+            ORDER BY id DESC LIMIT 1
+        ''', (root,))
+        return self.cursor.fetchone()
+
+    def queue_scan_paths(self, session_id, filepaths):
+        """Add walked files to the journal; files already queued keep their stage"""
+        self.cursor.executemany('INSERT OR IGNORE INTO scan_queue (session_id, filepath) VALUES (?, ?)',
+                                ((session_id, path) for path in filepaths))
+        self.conn.commit()
+
+    def get_scan_stages(self, session_id, filepaths):
+        """Return {filepath: stage} of the given journaled files"""
+        stages = dict.fromkeys(filepaths, SCAN_STAGE_QUEUED)
+        placeholders = ', '.join('?' * len(filepaths))
+        self.cursor.execute(f'SELECT filepath, stage FROM scan_queue WHERE session_id = ? AND filepath IN ({placeholders})',
+                            [session_id, *filepaths])
+        stages.update(self.cursor.fetchall())
+        return stages
+
+    def set_scan_stage(self, session_id, filepaths, stage):
+        """Record that the given files completed a stage; one commit per batch and stage"""
+        self.cursor.executemany('UPDATE scan_queue SET stage = ? WHERE session_id = ? AND filepath = ?',
+                                ((stage, session_id, path) for path in filepaths))
+        self.conn.commit()
+
+    def get_pending_scan_paths(self, session_id):
+        """Files of a session that have not completed all stages"""
+        self.cursor.execute('SELECT filepath FROM scan_queue WHERE session_id = ? AND stage < ? ORDER BY filepath',
+                            (session_id, SCAN_STAGE_DONE))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def set_scan_walk_done(self, session_id):
+        self.cursor.execute('UPDATE scan_sessions SET walk_done = 1 WHERE id = ?', (session_id,))
+        self.conn.commit()
+
+    def finish_scan_session(self, session_id):
+        """Mark a session complete and drop its queue, which is only needed to resume"""
+        self.cursor.execute('''
+            UPDATE scan_sessions SET status = 'finished', finished_at = CURRENT_TIMESTAMP WHERE id = ?
+        ''', (session_id,))
+        self.cursor.execute('DELETE FROM scan_queue WHERE session_id = ?', (session_id,))
+        self.conn.commit()
+
+    def find_identical_media(self, filepath, partial):
+        """
+        Look for a stored file with the same content as filepath. Files with the same partial hash are
+        compared by their full hash, which is computed (and stored) only for these candidates.
+        Returns (id of the identical row or None, full hash of filepath or None).
+        """
+        self.cursor.execute('SELECT id, filepath, content_hash FROM media_files WHERE partial_hash = ? AND filepath != ?',
+                            (partial, filepath))
+        candidates = self.cursor.fetchall()
+        if not candidates:
+            return None, None
+        content = full_hash(filepath)
+        if content is None:
+            return None, None
+        for media_id, candidate_path, candidate_hash in candidates:
+            if candidate_hash is None and os.path.exists(candidate_path):
+                candidate_hash = full_hash(candidate_path)
+                if candidate_hash:
+                    self.cursor.execute('UPDATE media_files SET content_hash = ? WHERE id = ?', (candidate_hash, media_id))
+                    self.conn.commit()
+            if candidate_hash == content:
+                return media_id, content
+        return None, content
+
+    def add_duplicate_media(self, filepath, source_id, content):
+        """
+        Add a byte-identical copy of an already scanned file, taking over its metadata instead of
+        extracting it again. Returns the path of the source file, or None if the insert failed.
+        """
+        try:
+            mtime = int(os.stat(filepath).st_mtime)
+            self.cursor.execute('''
+                INSERT INTO media_files (
+                    filepath, filename, file_extension, file_type, size, mtime, creation_time, creation_ts, tz_offset,
+                    latitude, longitude, place_id, partial_hash, content_hash, perceptual_hash,
+                    people_count, activities, scenery, talking_detected, analysis_version, analysis_status, analyzed_at
+                )
+                SELECT ?, ?, file_extension, file_type, size, ?, creation_time, creation_ts, tz_offset,
+                       latitude, longitude, place_id, partial_hash, ?, perceptual_hash,
+                       people_count, activities, scenery, talking_detected, analysis_version, analysis_status, analyzed_at
+                FROM media_files WHERE id = ?
+            ''', (filepath, os.path.basename(filepath), mtime, content, source_id))
+            self.cursor.execute(f'''
+                INSERT INTO media_technical (media_id, {', '.join(TECHNICAL_FIELDS)})
+                SELECT ?, {', '.join(TECHNICAL_FIELDS)} FROM media_technical WHERE media_id = ?
+            ''', (self.cursor.lastrowid, source_id))
+            self.cursor.execute('SELECT filepath FROM media_files WHERE id = ?', (source_id,))
+            source_path = self.cursor.fetchone()[0]
+            self.conn.commit()
+            logging.info(f"Added identical copy of {source_path}: {filepath}")
+            return source_path
+        except sqlite3.IntegrityError:
+            logging.debug("File already exists in DB, skipping: %s", filepath)
+        except (sqlite3.Error, OSError) as e:
+            logging.error(f"Error adding duplicate media file to DB: {e}")
+            self.conn.rollback()
+        return None
+
+    def backfill_content_hashes(self, workers=4):
+        """
+        Hash the stored files that have no partial hash yet, then resolve partial hash collisions
+        with full hashes. Files on drives that are not mounted are left for a later run.
+        """
+        self.cursor.execute('SELECT id, filepath FROM media_files WHERE partial_hash IS NULL')
+        rows = [(media_id, path) for media_id, path in self.cursor.fetchall() if os.path.exists(path)]
+        hashes = hash_files([path for _, path in rows], partial_hash, workers)
+        self.cursor.executemany('UPDATE media_files SET partial_hash = ? WHERE id = ?',
+                                [(hashes[path], media_id) for media_id, path in rows if hashes[path]])
+        self.conn.commit()
+        logging.info(f"Computed partial hashes of {len(rows)} media files.")
+
+        self.cursor.execute('''
+            SELECT id, filepath FROM media_files
+            WHERE content_hash IS NULL AND partial_hash IN (
+                SELECT partial_hash FROM media_files WHERE partial_hash IS NOT NULL
+                GROUP BY partial_hash HAVING COUNT(*) > 1
+            )
+        ''')
+        rows = [(media_id, path) for media_id, path in self.cursor.fetchall() if os.path.exists(path)]
+        hashes = hash_files([path for _, path in rows], full_hash, workers)
+        self.cursor.executemany('UPDATE media_files SET content_hash = ? WHERE id = ?',
+                                [(hashes[path], media_id) for media_id, path in rows if hashes[path]])
+        self.conn.commit()
+        logging.info(f"Computed full hashes of {len(rows)} media files with colliding partial hashes.")
+
+    def set_perceptual_hash(self, filepath, value):
+        if value is None:
+            return
+        try:
+            self.cursor.execute('UPDATE media_files SET perceptual_hash = ? WHERE filepath = ?', (value, filepath))
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Error storing perceptual hash of {filepath}: {e}")
+
+    def backfill_perceptual_hashes(self, workers=4):
+        """Compute the perceptual hash from the existing thumbnail of files scanned before it was stored"""
+        self.cursor.execute('SELECT id, filepath FROM media_files WHERE perceptual_hash IS NULL')
+        rows = [(media_id, thumbnail_path_for(path)) for media_id, path in self.cursor.fetchall()]
+        rows = [(media_id, thumbnail) for media_id, thumbnail in rows if os.path.exists(thumbnail)]
+        if not rows:
+            return
+        hashes = dhash_files([thumbnail for _, thumbnail in rows], workers)
+        self.cursor.executemany('UPDATE media_files SET perceptual_hash = ? WHERE id = ?',
+                                [(hashes[thumbnail], media_id) for media_id, thumbnail in rows
+                                 if hashes[thumbnail] is not None])
+        self.conn.commit()
+        logging.info(f"Computed perceptual hashes of {len(rows)} existing thumbnails.")
+
+    def get_duplicate_groups(self):
+        """Return [(content_hash, [(id, filepath, size), ...])] for content stored more than once"""
+        self.cursor.execute('''
+            SELECT content_hash, id, filepath, size FROM media_files
+            WHERE content_hash IN (
+                SELECT content_hash FROM media_files WHERE content_hash IS NOT NULL
+                GROUP BY content_hash HAVING COUNT(*) > 1
+            )
+            ORDER BY size DESC, content_hash, filepath
+        ''')
+        groups = {}
+        for content, media_id, filepath, size in self.cursor.fetchall():
+            groups.setdefault(content, []).append((media_id, filepath, size))
+        return list(groups.items())
+
+    def get_file_state(self, filepath):
+        """Return the stored (size, mtime) of a media file, or None if it is not in the DB"""
+        self.cursor.execute('SELECT size, mtime FROM media_files WHERE filepath = ?', (filepath,))
+        return self.cursor.fetchone()
+
+    def remove_media_files(self, filepaths, directories=()):
+        """Delete media rows by file path and everything below the given directories. Returns the row count."""
+        next_sep = chr(ord(os.sep) + 1)
+        try:
+            before = self.conn.total_changes
+            self.cursor.executemany('DELETE FROM media_files WHERE filepath = ?', ((path,) for path in filepaths))
+            self.cursor.executemany('DELETE FROM media_files WHERE filepath > ? AND filepath < ?',
+                                    ((path + os.sep, path + next_sep) for path in directories))
+            self.conn.commit()
+            return self.conn.total_changes - before
+        except sqlite3.Error as e:
+            logging.error(f"Error removing media files from DB: {e}")
+            self.conn.rollback()
+            return 0
+
+    def add_media_file(self, metadata, thumbnail=True):
+        """Insert an extracted file (and its thumbnail unless thumbnail is False), False if it could not be stored"""
         # logging.info(f"Adding media file to DB: {metadata.get('filepath')}, {metadata.get('creation_time')}")
+        creation_ts, tz_offset = creation_epoch(metadata.get('creation_time'), metadata.get('timezone'),
+                                                utc=metadata.get('file_type') == 'Video')
         try:
+            place_id = self.get_place_id(metadata)
             self.cursor.execute('''
                 INSERT INTO media_files (
-                    filepath, filename, file_extension, file_type, size, creation_time, latitude, longitude,
-                    city_en, city_zh, region_en, region_zh, subregion_en, subregion_zh, country_code, country_en, country_zh, timezone
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    filepath, filename, file_extension, file_type, size, mtime, creation_time, creation_ts, tz_offset,
+                    latitude, longitude, place_id, partial_hash, content_hash
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 metadata.get('filepath'),
                 metadata.get('filename'),
                 metadata.get('file_extension'),
                 metadata.get('file_type'),
                 metadata.get('size'),
+                metadata.get('mtime'),
                 metadata.get('creation_time'),
+                creation_ts,
+                tz_offset,
                 metadata.get('latitude'),
                 metadata.get('longitude'),
-                metadata.get('city_en'),
-                metadata.get('city_zh'),
-                metadata.get('region_en'),
-                metadata.get('region_zh'),
-                metadata.get('subregion_en'),
-                metadata.get('subregion_zh'),
-                metadata.get('country_code'),
-                metadata.get('country_en'),
-                metadata.get('country_zh'),
-                metadata.get('timezone'),
+                place_id,
+                metadata.get('partial_hash'),
+                metadata.get('content_hash'),
             ))
+            self._add_technical(self.cursor.lastrowid, metadata)
             self.conn.commit()
-            logging.debug(f"Added media file: {metadata.get('filepath')}, {metadata.get('creation_time')}")
+            logging.debug("Added media file: %s, %s", metadata.get('filepath'), metadata.get('creation_time'))
             
             # Generate thumbnail after successfully adding to database
             filepath = metadata.get('filepath')
-            if filepath and os.path.exists(filepath):
+            if thumbnail and filepath and os.path.exists(filepath):
                 thumbnail_path = self.generate_thumbnail(filepath)
                 if thumbnail_path:
                     logging.info(f"Generated thumbnail: {thumbnail_path}")
                     
         except sqlite3.IntegrityError:
-            logging.debug(f"File already exists in DB, skipping: {metadata.get('filepath')}")
+            logging.debug("File already exists in DB, skipping: %s", metadata.get('filepath'))
         except sqlite3.Error as e:
             logging.error(f"Error adding media file to DB: {e}")
+            return False
+        return True
 
-    def update_city_translation(self, filepath, extractor):
+    def _add_technical(self, media_id, metadata, keep_empty=False):
+        """
+        Store the technical fields of an extracted metadata dict. Rows without any are not stored unless
+        keep_empty is set, an empty row marks a file whose technical metadata cannot be read.
+        """
+        values = [metadata.get(field) for field in TECHNICAL_FIELDS]
+        if keep_empty or any(value is not None for value in values):
+            self.cursor.execute(f'''
+                INSERT OR REPLACE INTO media_technical (media_id, {', '.join(TECHNICAL_FIELDS)})
+                VALUES (?{', ?' * len(TECHNICAL_FIELDS)})
+            ''', [media_id] + values)
+
+    def get_technical(self, filepath):
+        """Return the stored technical metadata of a media file as a dict, or None"""
+        self.cursor.execute(f'''
+            SELECT {', '.join('t.' + field for field in TECHNICAL_FIELDS)}
+            FROM media_technical t JOIN media_files m ON m.id = t.media_id
+            WHERE m.filepath = ?
+        ''', (filepath,))
+        row = self.cursor.fetchone()
+        return dict(zip(TECHNICAL_FIELDS, row)) if row else None
+
+    def backfill_technical_metadata(self):
+        """
+        Store the technical metadata of files scanned before it was recorded. Only the native JPEG/HEIC
+        and MP4/MOV readers are used, the other files get it when they are extracted again. Files
+        the readers cannot handle get an empty row, so they are not parsed again on every scan.
+        """
+        self.cursor.execute('''
+            SELECT id, filepath FROM media_files m
+            WHERE NOT EXISTS (SELECT 1 FROM media_technical t WHERE t.media_id = m.id)
+        ''')
+        rows = []
+        for media_id, filepath in self.cursor.fetchall():
+            if not os.path.exists(filepath):
+                continue
+            native = read_exif(filepath) or read_video_metadata(filepath)
+            rows.append((media_id, technical_metadata(native) if native else {}))
+        if not rows:
+            return
         try:
-            #logging.info(f"City translation from DB {filepath}")
-            city_en = None
-            city_zh = None
-            meta_city_zh = None
-            self.cursor.execute('''
-                SELECT filepath, city_en, city_zh FROM media_files
-                WHERE filepath = ?
-            ''', (filepath,))
-            result = self.cursor.fetchone()
-            if result:
-                city_en = result[1]
-                city_zh = result[2]
-
-            #logging.info(f"   From DB: city_en: {city_en}, city_zh: {city_zh}")
+            for media_id, technical in rows:
+                self._add_technical(media_id, technical, keep_empty=True)
+            self.conn.commit()
+            unreadable = sum(1 for _, technical in rows if not any(value is not None for value in technical.values()))
+            logging.info(f"Stored technical metadata of {len(rows)} previously scanned media files "
+                         f"({unreadable} without any).")
+        except sqlite3.Error as e:
+            logging.error(f"Error storing technical metadata: {e}")
+            self.conn.rollback()
 
-            if city_en:
-                meta_city_zh = extractor._get_city_translation(city_en)
+    def update_place_translations(self, extractor):
+        """
+        Refresh the Chinese city names from the geo list in one transaction: the extractor's
+        city_dict is loaded into a temp table and joined against places, so the cost does not
+        depend on the number of media files. Returns {city_en: (old city_zh, new city_zh, media count)}.
+        """
+        changes = {}
+        try:
+            self.cursor.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS city_translations (
+                    city_en TEXT PRIMARY KEY,
+                    city_zh TEXT NOT NULL
+                )
+            ''')
+            self.cursor.execute('DELETE FROM temp.city_translations')
+            self.cursor.executemany(
+                'INSERT OR REPLACE INTO temp.city_translations (city_en, city_zh) VALUES (?, ?)',
+                ((city_en, city_zh) for city_en, city_zh in extractor.city_dict.items() if city_en and city_zh))
 
-            #logging.info(f"   Retrieved translation    city_en: {city_en} -> meta_city_zh: {meta_city_zh}")
+            self.cursor.execute('''
+                SELECT p.city_en, p.city_zh, t.city_zh, COUNT(m.id)
+                FROM places p
+                JOIN temp.city_translations t ON t.city_en = p.city_en
+                LEFT JOIN media_files m ON m.place_id = p.id
+                WHERE p.city_zh IS NOT t.city_zh
+                GROUP BY p.city_en
+            ''')
+            changes = {city_en: (city_zh, new_city_zh, count)
+                       for city_en, city_zh, new_city_zh, count in self.cursor.fetchall()}
 
-            if meta_city_zh and meta_city_zh != city_zh:
-                #logging.info(f"   Found new city translation meta_city_zh: {meta_city_zh}, updateing database.")
+            if changes:
                 self.cursor.execute('''
-                    UPDATE media_files
-                    SET city_zh = ?
-                    WHERE filepath = ?
-                ''', (meta_city_zh, filepath))
-                self.conn.commit()
-                logging.info(f"Updated DB file {filepath}:\n > city_en: {city_en}, city_zh: {city_zh} -> meta_city_zh: {meta_city_zh}")
-            #else:
-            #    logging.info(f"   No update required for city translation: city_en: {city_en}, city_zh: {city_zh}, meta_city_zh: {meta_city_zh}\n")
-
+                    UPDATE places
+                    SET city_zh = (SELECT t.city_zh FROM temp.city_translations t WHERE t.city_en = places.city_en)
+                    WHERE city_en IN (
+                        SELECT t.city_en FROM temp.city_translations t
+                        WHERE t.city_en = places.city_en AND t.city_zh IS NOT places.city_zh
+                    )
+                ''')
+            self.cursor.execute('DROP TABLE temp.city_translations')
+            self.conn.commit()
         except sqlite3.Error as e:
-            logging.error(f"Error updating city translation for {filepath}: {e}")
+            logging.error(f"Error updating city translations: {e}")
             self.conn.rollback()
-            logging.debug(f"Rolled back changes for {filepath}")
+            logging.debug("Rolled back city translation changes")
+            return {}
+
+        for city_en, (city_zh, new_city_zh, count) in sorted(changes.items()):
+            logging.info(f"Updated city translation for {count} media files: {city_en}: {city_zh} -> {new_city_zh}")
+        return changes
 
     def update_media_file_geo(self, filepath, geo_data):
         try:
+            # The creation_time now has a known timezone: the UTC epoch of a wall-clock time changes,
+            # a UTC video time gets its offset
+            self.cursor.execute('SELECT creation_time, file_type FROM media_files WHERE filepath = ?', (filepath,))
+            row = self.cursor.fetchone()
+            creation_ts, tz_offset = creation_epoch(row[0] if row else None, geo_data.get('timezone'),
+                                                    utc=bool(row) and row[1] == 'Video')
             self.cursor.execute('''
                 UPDATE media_files
-                SET city_en = ?, city_zh = ?, region_en = ?, region_zh = ?, subregion_en = ?, subregion_zh = ?,
-                    country_code = ?, country_en = ?, country_zh = ?, timezone = ?
+                SET place_id = ?, creation_ts = COALESCE(?, creation_ts), tz_offset = ?
                 WHERE filepath = ?
             ''', (
-                geo_data.get('city_en'),
-                geo_data.get('city_zh'),
-                geo_data.get('region_en'),
-                geo_data.get('region_zh'),
-                geo_data.get('subregion_en'),
-                geo_data.get('subregion_zh'),
-                geo_data.get('country_code'),
-                geo_data.get('country_en'),
-                geo_data.get('country_zh'),
-                geo_data.get('timezone'),
+                self.get_place_id(geo_data),
+                creation_ts,
+                tz_offset,
                 filepath
             ))
             self.conn.commit()
-            logging.debug(f"Updated geo data for {filepath}")
+            logging.debug("Updated geo data for %s", filepath)
         except sqlite3.Error as e:
             logging.error(f"Error updating geo data for {filepath}: {e}")
             self.conn.rollback()
-            logging.debug(f"Rolled back changes for {filepath}")
+            logging.debug("Rolled back changes for %s", filepath)
+
+    @staticmethod
+    def _semantic_values(semantic_data):
+        """Column values of an analyze_video() result; activities and scenery are stored as JSON lists"""
+        return (
+            semantic_data.get('people_count', 0),
+            json.dumps(semantic_data.get('activities', [])),
+            json.dumps(semantic_data.get('scenery', [])),
+            int(bool(semantic_data.get('talking_detected', 0))),
+        )
 
-    def update_media_file_semantic(self, filepath, semantic_data):
+    def update_media_file_semantic(self, filepath, semantic_data, version=None):
         try:
             self.cursor.execute('''
                 UPDATE media_files
-                SET people_count = ?, activities = ?, scenery = ?, talking_detected = ?
+                SET people_count = ?, activities = ?, scenery = ?, talking_detected = ?,
+                    analysis_version = ?, analysis_status = ?, analyzed_at = CURRENT_TIMESTAMP
                 WHERE filepath = ?
-            ''', (
-                semantic_data.get('people_count', 0),
-                semantic_data.get('activities', ''),
-                semantic_data.get('scenery', ''),
-                semantic_data.get('talking_detected', 0),
-                filepath
-            ))
+            ''', self._semantic_values(semantic_data) + (version, ANALYSIS_DONE, filepath))
             self.conn.commit()
-            logging.debug(f"Updated semantic data for {filepath}")
+            logging.debug("Updated semantic data for %s", filepath)
         except sqlite3.Error as e:
             logging.error(f"Error updating semantic data for {filepath}: {e}")
             self.conn.rollback()
-            logging.debug(f"Rolled back changes for {filepath}")
+            logging.debug("Rolled back changes for %s", filepath)
+
+    def get_unanalyzed_media(self, version):
+        """Return [(id, filepath)] of the videos not analyzed yet, analyzed under another version, or failed"""
+        self.cursor.execute('''
+            SELECT id, filepath FROM media_files
+            WHERE file_type = 'Video'
+              AND (analysis_version IS NULL OR analysis_version != ? OR analysis_status = ?)
+            ORDER BY id
+        ''', (version, ANALYSIS_FAILED))
+        return self.cursor.fetchall()
+
+    def store_semantic_results(self, results, version):
+        """
+        Write a batch of (media_id, analyze_video() result or None if it failed, analysis status) in one
+        transaction
+        """
+        done = [self._semantic_values(semantic_data) + (version, status, media_id)
+                for media_id, semantic_data, status in results if semantic_data is not None]
+        failed = [(version, ANALYSIS_FAILED, media_id)
+                  for media_id, semantic_data, status in results if semantic_data is None]
+        try:
+            self.cursor.executemany('''
+                UPDATE media_files
+                SET people_count = ?, activities = ?, scenery = ?, talking_detected = ?,
+                    analysis_version = ?, analysis_status = ?, analyzed_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', done)
+            # Failed rows keep their previous results; get_unanalyzed_media() selects them again
+            self.cursor.executemany('''
+                UPDATE media_files SET analysis_version = ?, analysis_status = ?, analyzed_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', failed)
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Error storing semantic analysis results: {e}")
+            self.conn.rollback()
+
+    def get_directory_cache(self):
+        """Return {directory: (mtime_ns, [subdirectories])} recorded by save_directory_cache()"""
+        self.cursor.execute('SELECT path, parent, mtime_ns FROM scanned_dirs')
+        return build_dir_cache(self.cursor.fetchall())
+
+    def save_directory_cache(self, walker, incomplete_dirs=()):
+        """
+        Record the directory mtimes of a walk whose files have all been processed.
+        The subdirectory records of every listed directory are replaced, which drops deleted directories.
+        incomplete_dirs hold files that could not be stored; they are recorded with an mtime that never
+        matches, so the next scan still reaches them through their parent, lists them and retries those files.
+        """
+        incomplete_dirs = set(incomplete_dirs)
+        visited = [(path, parent, -1 if path in incomplete_dirs else mtime_ns)
+                   for path, parent, mtime_ns in walker.visited_dirs]
+        try:
+            self.cursor.executemany('DELETE FROM scanned_dirs WHERE parent = ?',
+                                    ((path,) for path in walker.listed_dirs))
+            self.cursor.executemany('INSERT OR REPLACE INTO scanned_dirs (path, parent, mtime_ns) VALUES (?, ?, ?)',
+                                    visited)
+            self.conn.commit()
+            logging.info(f"Recorded {len(visited)} directory mtimes for the next incremental scan"
+                         f"{f', {len(incomplete_dirs)} directories with failed files are listed again' if incomplete_dirs else ''}.")
+        except sqlite3.Error as e:
+            logging.error(f"Error saving directory mtimes: {e}")
+            self.conn.rollback()
+
+    def sync_with_filesystem(self, entries, root, dry_run=False):
+        """
+        Compare a directory walk of root with the database using SQL joins; rows outside root are
+        neither reported nor deleted.
+        entries yields (filepath, size, mtime) for every media file on disk, from a walk that listed
+        every directory (a file rewritten in place does not change its directory's mtime); they are
+        staged in a temp table and joined against media_files. Files missing on disk and files whose
+        size or mtime changed are deleted in bulk (changed files are then re-extracted like new ones),
+        unless dry_run is set. Returns (added, removed, changed) lists of file paths.
+        """
+        try:
+            self.cursor.execute('''
+                CREATE TEMP TABLE IF NOT EXISTS fs_files (
+                    filepath TEXT PRIMARY KEY,
+                    size INTEGER,
+                    mtime INTEGER
+                )
+            ''')
+            self.cursor.execute('DELETE FROM temp.fs_files')
+            self.cursor.executemany('INSERT OR REPLACE INTO temp.fs_files (filepath, size, mtime) VALUES (?, ?, ?)', entries)
+            # The rows below root: a range scan on the filepath index
+            root = os.path.abspath(root)
+            under_root = (root.rstrip(os.sep) + os.sep, root.rstrip(os.sep) + chr(ord(os.sep) + 1))
+
+            self.cursor.execute('''
+                SELECT f.filepath FROM temp.fs_files f
+                WHERE NOT EXISTS (SELECT 1 FROM media_files m WHERE m.filepath = f.filepath)
+            ''')
+            added = [row[0] for row in self.cursor.fetchall()]
+            self.cursor.execute('''
+                SELECT m.filepath FROM media_files m
+                WHERE m.filepath >= ? AND m.filepath < ?
+                  AND NOT EXISTS (SELECT 1 FROM temp.fs_files f WHERE f.filepath = m.filepath)
+            ''', under_root)
+            removed = [row[0] for row in self.cursor.fetchall()]
+            # Rows scanned before mtime was recorded are compared by size only
+            changed_condition = 'm.size IS NOT f.size OR (m.mtime IS NOT NULL AND m.mtime IS NOT f.mtime)'
+            self.cursor.execute(f'''
+                SELECT m.filepath FROM media_files m JOIN temp.fs_files f ON f.filepath = m.filepath
+                WHERE {changed_condition}
+            ''')
+            changed = [row[0] for row in self.cursor.fetchall()]
+
+            if not dry_run:
+                self.cursor.execute(f'''
+                    DELETE FROM media_files
+                    WHERE (filepath >= ? AND filepath < ?
+                           AND NOT EXISTS (SELECT 1 FROM temp.fs_files f WHERE f.filepath = media_files.filepath))
+                       OR filepath IN (
+                           SELECT m.filepath FROM media_files m JOIN temp.fs_files f ON f.filepath = m.filepath
+                           WHERE {changed_condition}
+                       )
+                ''', under_root)
+                self.cursor.execute('''
+                    UPDATE media_files
+                    SET mtime = (SELECT f.mtime FROM temp.fs_files f WHERE f.filepath = media_files.filepath)
+                    WHERE mtime IS NULL AND filepath IN (SELECT filepath FROM temp.fs_files)
+                ''')
+            self.cursor.execute('DROP TABLE temp.fs_files')
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logging.error(f"Error syncing file system with the database: {e}")
+            self.conn.rollback()
+            return [], [], []
+        return added, removed, changed
 
     def get_files_with_geo(self):
+        # The last three columns: wall-clock epoch, UTC epoch and file type
         self.cursor.execute(
-            'SELECT filepath, creation_time, latitude, longitude, city_en, city_zh, ' + \
-                   'region_en, region_zh, subregion_en, subregion_zh, country_code, country_en, country_zh, timezone ' + \
-                   'FROM media_files WHERE creation_time IS NOT NULL and city_en IS NOT NULL')
+            'SELECT m.filepath, m.creation_time, m.latitude, m.longitude, m.place_id, p.timezone, ' + \
+                   'm.creation_ts + COALESCE(m.tz_offset, 0), m.creation_ts, m.file_type ' + \
+                   'FROM media_files m JOIN places p ON p.id = m.place_id WHERE m.creation_time IS NOT NULL')
         arr = self.cursor.fetchall()
-        # logging.info(f"== Found {len(arr)} image files with city_en data.")
+        # logging.info(f"== Found {len(arr)} image files with place data.")
         #for a in arr:
         #    logging.info(f"geo data: {a}")
         return arr
 
     def get_files_without_geo(self):
         self.cursor.execute(
-            'SELECT filepath, creation_time, latitude, longitude, city_en, city_zh, ' + \
-                   'region_en, region_zh, subregion_en, subregion_zh, country_code, country_en, country_zh, timezone ' + \
-                   'FROM media_files WHERE creation_time IS NOT NULL AND city_en IS NULL AND latitude IS NULL'
+            'SELECT filepath, creation_time, latitude, longitude, place_id, NULL, ' + \
+                   'creation_ts + COALESCE(tz_offset, 0), creation_ts, file_type ' + \
+                   'FROM media_files WHERE creation_time IS NOT NULL AND place_id IS NULL AND latitude IS NULL'
         )
         arr = self.cursor.fetchall()
-        # logging.info(f"== Found {len(arr)} files without geo data (city_en is NULL and latitude is NULL).")
+        # logging.info(f"== Found {len(arr)} files without geo data (place_id is NULL and latitude is NULL).")
         return arr
 
+    def _rtree_bbox_condition(self, south, west, north, east):
+        """
+        WHERE clause (and parameters) selecting media_rtree entries inside a bounding box.
+        Boxes crossing the antimeridian (west > east, or outside [-180, 180]) are split in two.
+        """
+        if east - west >= 360:
+            return 'r.max_lat >= ? AND r.min_lat <= ?', (south, north)
+        west = (west + 180) % 360 - 180
+        east = (east + 180) % 360 - 180
+        if west <= east:
+            return ('r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?',
+                    (south, north, west, east))
+        return ('r.max_lat >= ? AND r.min_lat <= ? AND (r.max_lon >= ? OR r.min_lon <= ?)',
+                (south, north, west, east))
+
+    def get_media_in_bbox(self, south, west, north, east):
+        """Return (filepath, file_type, latitude, longitude, creation_time) of media inside a bounding box"""
+        condition, params = self._rtree_bbox_condition(south, west, north, east)
+        self.cursor.execute(f'''
+            SELECT m.filepath, m.file_type, m.latitude, m.longitude, m.creation_time
+            FROM media_rtree r JOIN media_files m ON m.id = r.id
+            WHERE {condition}
+        ''', params)
+        return self.cursor.fetchall()
+
+    def get_media_near(self, lat, lon, radius_km, extra_condition='', extra_params=()):
+        """
+        Return (filepath, file_type, latitude, longitude, creation_time, distance_km) of media within
+        radius_km of a point, nearest first. The R*Tree narrows the search to the radius' bounding box,
+        so the exact haversine distance is only computed for those candidates.
+        """
+        dlat = radius_km / 111.32
+        dlon = radius_km / (111.32 * max(math.cos(math.radians(lat)), 1e-6))
+        south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        condition, params = self._rtree_bbox_condition(south, lon - dlon, north, lon + dlon)
+        self.cursor.execute(f'''
+            SELECT m.filepath, m.file_type, m.latitude, m.longitude, m.creation_time
+            FROM media_rtree r JOIN media_files m ON m.id = r.id
+            WHERE {condition} {extra_condition}
+        ''', params + tuple(extra_params))
+
+        results = []
+        for row in self.cursor.fetchall():
+            distance = haversine_km(lat, lon, row[2], row[3])
+            if distance <= radius_km:
+                results.append(row + (distance,))
+        results.sort(key=lambda r: r[-1])
+        return results
+
     def get_media_by_time_and_location(self, timestamp, lat, lon, time_window_minutes=5, distance_threshold_km=0.2):
-        # This is a simplified proximity check. A more robust solution would use spatial indexing.
-        # For demonstration, we'll just return files within a time window.
-        # Real implementation would need to calculate distance from lat/lon.
-        self.cursor.execute(
-            """SELECT filepath, file_type, latitude, longitude, creation_time FROM media_files
-            WHERE ABS(strftime('%s', creation_time) - strftime('%s', ?)) < ? * 60
-            AND latitude IS NOT NULL AND longitude IS NOT NULL
-            """, (timestamp, time_window_minutes)
+        # Spatial candidates come from the R*Tree index, then the time window is applied to those rows only.
+        # timestamp is either a creation_time string or wall-clock epoch seconds.
+        if isinstance(timestamp, str):
+            timestamp = creation_epoch(timestamp)[0]
+        return self.get_media_near(
+            lat, lon, distance_threshold_km,
+            extra_condition="AND ABS(m.creation_ts + COALESCE(m.tz_offset, 0) - ?) < ? * 60",
+            extra_params=(timestamp, time_window_minutes)
         )
-        return self.cursor.fetchall()
+
+    def rebuild_geo_clusters(self):
+        """
+        Recompute the per-zoom map cluster table from the media coordinates in set-based statements.
+        Each distinct coordinate gets its cell at CLUSTER_MAX_ZOOM once; the cell at a lower zoom is
+        that cell shifted right by the zoom difference, so every zoom is a GROUP BY in SQL.
+        """
+        self.conn.create_function('cluster_cell_x', 2, lambda lat, lon: cluster_cell(lat, lon, CLUSTER_MAX_ZOOM)[0],
+                                  deterministic=True)
+        self.conn.create_function('cluster_cell_y', 2, lambda lat, lon: cluster_cell(lat, lon, CLUSTER_MAX_ZOOM)[1],
+                                  deterministic=True)
+        try:
+            self.cursor.execute('DROP TABLE IF EXISTS temp.cluster_points')
+            self.cursor.execute('''
+                CREATE TEMP TABLE cluster_points AS
+                SELECT latitude, longitude, COUNT(*) AS count, MIN(id) AS sample_id,
+                       cluster_cell_x(latitude, longitude) AS cell_x, cluster_cell_y(latitude, longitude) AS cell_y
+                FROM media_files
+                WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+                GROUP BY latitude, longitude
+            ''')
+            points = self.cursor.execute('SELECT COUNT(*) FROM cluster_points').fetchone()[0]
+            self.cursor.execute('DELETE FROM geo_clusters')
+            self.cursor.execute('''
+                WITH RECURSIVE zooms (zoom) AS (SELECT 0 UNION ALL SELECT zoom + 1 FROM zooms WHERE zoom < ?)
+                INSERT INTO geo_clusters (
+                    zoom, cell_x, cell_y, count, latitude, longitude, min_lat, min_lon, max_lat, max_lon, sample_id
+                )
+                SELECT zoom, cell_x >> (? - zoom), cell_y >> (? - zoom), SUM(count),
+                       SUM(latitude * count) / SUM(count), SUM(longitude * count) / SUM(count),
+                       MIN(latitude), MIN(longitude), MAX(latitude), MAX(longitude), MIN(sample_id)
+                FROM zooms, cluster_points
+                GROUP BY 1, 2, 3
+            ''', (CLUSTER_MAX_ZOOM, CLUSTER_MAX_ZOOM, CLUSTER_MAX_ZOOM))
+            cells = self.cursor.execute('SELECT COUNT(*) FROM geo_clusters').fetchone()[0]
+            self.cursor.execute('DROP TABLE temp.cluster_points')
+            self.conn.commit()
+            logging.info(f"Rebuilt map clusters: {points} distinct locations, {cells} cluster cells.")
+        except sqlite3.Error as e:
+            logging.error(f"Error rebuilding map clusters: {e}")
+            self.conn.rollback()
+
+    def rebuild_daily_counts(self):
+        """Recompute the per-day timeline aggregate used by /api/media/days in one set-based statement."""
+        try:
+            self.cursor.execute('DELETE FROM daily_counts')
+            self.cursor.execute('''
+                INSERT INTO daily_counts (day, file_type, place_id, count)
+                SELECT date(creation_ts + COALESCE(tz_offset, 0), 'unixepoch'),
+                       COALESCE(file_type, 'Undefined'), COALESCE(place_id, 0), COUNT(*)
+                FROM media_files
+                WHERE creation_ts IS NOT NULL
+                GROUP BY 1, 2, 3
+            ''')
+            self.conn.commit()
+            logging.info(f"Rebuilt daily counts: {self.cursor.rowcount} day/type/place rows.")
+        except sqlite3.Error as e:
+            logging.error(f"Error rebuilding daily counts: {e}")
+            self.conn.rollback()
 
     def generate_thumbnail(self, filepath, thumbnail_size=(300, 300)):
         """
         Generate thumbnail for image or video files.
         Returns the thumbnail file path if successful, None otherwise.
         """
+        with profiler.stage('thumbnail', filepath):
+            return self._generate_thumbnail(filepath, thumbnail_size)
+
+    def _generate_thumbnail(self, filepath, thumbnail_size):
         if not PIL_AVAILABLE:
             logging.debug("PIL/Pillow not available, skipping thumbnail generation")
             return None
@@ -269,14 +1246,11 @@ class MediaOrganizerDB:
             
         try:
             # Generate thumbnail filename
-            file_dir = os.path.dirname(filepath)
-            file_name = os.path.basename(filepath)
-            name_without_ext = os.path.splitext(file_name)[0]
-            thumbnail_path = os.path.join(file_dir, f"{name_without_ext}_thumb.jpg")
+            thumbnail_path = thumbnail_path_for(filepath)
             
             # Skip if thumbnail already exists
             if os.path.exists(thumbnail_path):
-                logging.debug(f"Thumbnail already exists: {thumbnail_path}")
+                logging.debug("Thumbnail already exists: %s", thumbnail_path)
                 return thumbnail_path
             
             file_ext = os.path.splitext(filepath)[1].lower()
@@ -284,10 +1258,8 @@ class MediaOrganizerDB:
             # Handle image files
             if file_ext in ['.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.heic', '.webp']:
                 try:
-                    # Debug logging to check filepath
-                    logging.debug(f"Attempting to open image file: '{filepath}'")
-                    logging.debug(f"File exists check: {os.path.exists(filepath)}")
-                    logging.debug(f"File extension: {file_ext}")
+                    # Lazy %-style arguments: nothing is formatted (or stat'ed) unless debug logging is on
+                    logging.debug("Attempting to open image file: '%s' (extension %s)", filepath, file_ext)
                     
                     # Special handling for HEIC files which might need pillow-heif
                     if file_ext == '.heic':
@@ -313,7 +1285,9 @@ class MediaOrganizerDB:
                         # Generate thumbnail
                         img.thumbnail(thumbnail_size, Image.Resampling.LANCZOS)
                         img.save(thumbnail_path, 'JPEG', quality=85, optimize=True)
-                        logging.debug(f"Generated image thumbnail: {thumbnail_path}")
+                        logging.debug("Generated image thumbnail: %s", thumbnail_path)
+                        # The downscaled image is hashed while it is in memory
+                        self.set_perceptual_hash(filepath, dhash(img))
                         return thumbnail_path
                         
                 except Exception as e:
@@ -326,36 +1300,16 @@ class MediaOrganizerDB:
             # Handle video files
             elif file_ext in ['.mp4', '.mov', '.avi', '.mkv', '.webm', '.m4v']:
                 try:
-                    # First, try to get video info to check if file is valid
-                    info_cmd = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', filepath]
-                    info_result = subprocess.run(info_cmd, capture_output=True, text=True)
-                    
-                    if info_result.returncode != 0:
-                        logging.warning(f"ffprobe failed for {filepath}, file might be corrupted")
+                    technical = self.get_technical(filepath)
+                    if technical and technical['width'] and technical['duration']:
+                        # Video stream and duration stored by the extraction pass, the file is not probed again
+                        timestamp = min(1.0, technical['duration'] * 0.1)
+                    else:
+                        # Duration and video stream check from the file's boxes, ffprobe only as a fallback
+                        timestamp = video_thumbnail_timestamp(filepath)
+                    if timestamp is None:
                         return None
                     
-                    # Parse ffprobe output to check for video streams
-                    try:
-                        import json
-                        probe_data = json.loads(info_result.stdout)
-                        video_streams = [s for s in probe_data.get('streams', []) if s.get('codec_type') == 'video']
-                        
-                        if not video_streams:
-                            logging.warning(f"No video streams found in {filepath}")
-                            return None
-                            
-                        # Get duration to determine best timestamp for thumbnail
-                        duration = video_streams[0].get('duration')
-                        if duration:
-                            # Use 10% of duration or 1 second, whichever is smaller
-                            timestamp = min(1.0, float(duration) * 0.1)
-                        else:
-                            timestamp = 0.1  # Very early timestamp for problematic files
-                            
-                    except (json.JSONDecodeError, ValueError, KeyError):
-                        logging.warning(f"Could not parse video info for {filepath}, using default timestamp")
-                        timestamp = 0.1
-                    
                     # Try multiple ffmpeg strategies
                     strategies = [
                         # Strategy 1: Use calculated timestamp
@@ -375,30 +1329,35 @@ class MediaOrganizerDB:
                     ]
                     
                     for i, cmd in enumerate(strategies, 1):
-                        logging.debug(f"Trying ffmpeg strategy {i} for {filepath}")
-                        result = subprocess.run(cmd, capture_output=True, text=True)
+                        logging.debug("Trying ffmpeg strategy %s for %s", i, filepath)
+                        try:
+                            result = subprocess.run(cmd, capture_output=True, text=True, timeout=FFMPEG_TIMEOUT)
+                        except subprocess.TimeoutExpired:
+                            logging.warning(f"ffmpeg strategy {i} timed out after {FFMPEG_TIMEOUT}s for {filepath}")
+                            if os.path.exists(thumbnail_path):
+                                os.remove(thumbnail_path)
+                            continue
                         
                         if result.returncode == 0 and os.path.exists(thumbnail_path):
-                            logging.debug(f"Generated video thumbnail using strategy {i}: {thumbnail_path}")
+                            logging.debug("Generated video thumbnail using strategy %s: %s", i, thumbnail_path)
+                            self.set_perceptual_hash(filepath, dhash_file(thumbnail_path))
                             return thumbnail_path
                         else:
-                            logging.debug(f"Strategy {i} failed: {result.stderr.strip()}")
+                            logging.debug("Strategy %s failed: %s", i, result.stderr.strip())
                             # Clean up any partial file
                             if os.path.exists(thumbnail_path):
                                 os.remove(thumbnail_path)
                     
                     # All strategies failed
                     logging.error(f"All ffmpeg strategies failed for {filepath}")
-                    logging.error(f"Last error: {result.stderr.strip()}")
                     return None
                         
                 except Exception as e:
                     logging.error(f"Error generating video thumbnail for {filepath}: {e}")
-                    input("Press Enter to continue...")
                     return None
             
             else:
-                logging.debug(f"Unsupported file type for thumbnail generation: {file_ext}")
+                logging.debug("Unsupported file type for thumbnail generation: %s", file_ext)
                 return None
                 
         except Exception as e:
@@ -410,24 +1369,325 @@ class MediaOrganizerDB:
             self.conn.close()
             logging.debug("Database connection closed.")
 
-def scan_directory_recursive(path):
-    logging.info(f"Starting recursive scan of: {path}")
-    all_files = []
-    for root, _, files in os.walk(path):
-        for file in files:
-            # Skip hidden files and non-media files
-            extension = os.path.splitext(file)[1].lower()
-            if file.startswith('.') or extension not in [".jpg", ".jpeg", ".png", ".heic", ".mp4", ".mov"]:
-                continue
+def process_media_file(db, extractor, filepath, thumbnail=True, partial=None):
+    """
+    Extract metadata and geo data of a media file and add it to the database.
+    A byte-identical copy of a stored file takes over that file's metadata and thumbnail instead.
+    """
+    if partial is None:
+        with profiler.stage('hash', filepath):
+            partial = partial_hash(filepath)
+    content = None
+    if partial:
+        with profiler.stage('dedupe', filepath):
+            source_id, content = db.find_identical_media(filepath, partial)
+        if source_id:
+            source_path = db.add_duplicate_media(filepath, source_id, content)
+            if source_path:
+                source_thumbnail = thumbnail_path_for(source_path)
+                target_thumbnail = thumbnail_path_for(filepath)
+                if os.path.exists(source_thumbnail) and not os.path.exists(target_thumbnail):
+                    try:
+                        shutil.copyfile(source_thumbnail, target_thumbnail)
+                    except OSError as e:
+                        logging.warning(f"Could not copy thumbnail {source_thumbnail}: {e}")
+                return True
+
+    with profiler.stage('extract', filepath):
+        metadata = extractor.extract_metadata(filepath)
+    if not metadata:
+        logging.warning(f"Could not extract metadata for: {filepath}")
+        return False
+
+    # Attempt to get geo data from geo.list if GPS coords are present
+    if metadata.get('latitude') is not None and metadata.get('longitude') is not None:
+        with profiler.stage('geocode', filepath):
+            geo_data = extractor.get_geo_from_coordinates(metadata['latitude'], metadata['longitude'])
+        if geo_data:
+            metadata.update(geo_data)
+
+    metadata['partial_hash'] = partial
+    metadata['content_hash'] = content
+    with profiler.stage('db', filepath):
+        return db.add_media_file(metadata, thumbnail=thumbnail)
+
+def process_scan_batch(db, extractor, session_id, filepaths, resumed=False):
+    """
+    Run one journaled batch: first extraction and DB insert of every file, then the thumbnails.
+    Each stage is committed to the scan journal for the whole batch, so --resume continues after
+    the last completed stage. Files of resumed sessions that are already in the DB only get their thumbnail.
+    Returns the files that could not be stored.
+    """
+    stages = db.get_scan_stages(session_id, filepaths)
+    to_thumbnail = [path for path in filepaths if stages[path] == SCAN_STAGE_STORED]
+    skipped = []
+    stored = []
+    failed = []
+    new_files = []
+    for filepath in filepaths:
+        if stages[filepath] != SCAN_STAGE_QUEUED:
+            continue
+        if db.file_exists(filepath):
+            if resumed:
+                stored.append(filepath)
+            else:
+                logging.debug("Skipping already scanned and existing file: %s", filepath)
+                skipped.append(filepath)
+        else:
+            new_files.append(filepath)
+
+    # Partial hashes of the batch are read in parallel, identical copies skip extraction
+    with profiler.stage('hash'):
+        hashes = hash_files(new_files)
+    for filepath in new_files:
+        logging.debug("Processing file: %s", filepath)
+        if process_media_file(db, extractor, filepath, thumbnail=False, partial=hashes[filepath]):
+            stored.append(filepath)
+        else:
+            failed.append(filepath)
+    db.set_scan_stage(session_id, stored, SCAN_STAGE_STORED)
+
+    to_thumbnail += stored
+    for filepath in to_thumbnail:
+        if os.path.exists(filepath):
+            thumbnail_path = db.generate_thumbnail(filepath)
+            if thumbnail_path:
+                logging.info(f"Generated thumbnail: {thumbnail_path}")
+    db.set_scan_stage(session_id, to_thumbnail + skipped + failed, SCAN_STAGE_DONE)
+    return failed
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def ingest_changes(db, extractor, changed, deleted, deleted_dirs):
+    """Apply one batch of watch mode changes: only the affected files are extracted, geocoded and thumbnailed"""
+    removed = db.remove_media_files(deleted, deleted_dirs)
+    processed = 0
+    for filepath in changed:
+        try:
+            stat_info = os.stat(filepath)
+        except OSError:
+            continue
+        state = db.get_file_state(filepath)
+        if state == (stat_info.st_size, int(stat_info.st_mtime)):
+            continue
+        if state:
+            # Modified in place: drop the old row and the thumbnail of the previous content
+            db.remove_media_files([filepath])
+            thumbnail_path = thumbnail_path_for(filepath)
+            if os.path.exists(thumbnail_path):
+                try:
+                    os.remove(thumbnail_path)
+                except OSError as e:
+                    logging.error(f"Watch: Error removing stale thumbnail {thumbnail_path}: {e}")
+        if process_media_file(db, extractor, filepath):
+            processed += 1
+
+    logging.info(f"Watch: {processed} files added or updated, {removed} removed.")
+    if processed or removed:
+        db.rebuild_geo_clusters()
+        db.rebuild_daily_counts()
+
+def run_semantic_analysis(db, cpus=None, worker_threads=ANALYZE_WORKER_THREADS, sample_fps=None,
+                          scene_threshold=None, keyframes=None):
+    """
+    Analyze the videos without results for the current analysis version in a process pool. Each
+    worker loads the models once and runs worker_threads threads; cpus // worker_threads workers
+    share the CPU budget. Results are committed every ANALYZE_BATCH_SIZE videos and on the way out,
+    so an interrupted run, or one whose pool broke because a worker died, continues where it stopped.
+    Frames are sampled at sample_fps (keyframes only if keyframes), or on scene changes above
+    scene_threshold; None keeps the semantic_analyzer default. The sampling is part of the analysis
+    version, so changing it analyzes the videos again.
+    """
+    # Imported here: torch, ultralytics and OpenCV are only needed for --analyze
+    import semantic_analyzer
+
+    sampling = {
+        'sample_fps': sample_fps or semantic_analyzer.SAMPLE_FPS,
+        'scene_threshold': scene_threshold,
+        'keyframes': semantic_analyzer.KEYFRAMES_ONLY if keyframes is None else keyframes,
+    }
+    version = semantic_analyzer.analysis_version(**sampling)
+    rows = [(media_id, path) for media_id, path in db.get_unanalyzed_media(version) if os.path.exists(path)]
+    if not rows:
+        logging.info(f"All videos are analyzed (analysis version {version}).")
+        return
+    cpus = cpus or os.cpu_count() or 1
+    worker_threads = max(1, min(worker_threads, cpus))
+    workers = max(1, min(cpus // worker_threads, len(rows)))
+    logging.info(f"Analyzing {len(rows)} videos with {workers} workers x {worker_threads} threads "
+                 f"(analysis version {version})...")
+
+    start = time.perf_counter()
+    analyzed = partial = failed = 0
+    batch = []
+    # spawn: the workers start without the parent's state, the same on Linux and macOS
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=semantic_analyzer.init_worker,
+                             initargs=(worker_threads, logging.getLogger().level)) as executor:
+        futures = {executor.submit(semantic_analyzer.analyze_file, row, **sampling): row for row in rows}
+        try:
+            for future in as_completed(futures):
+                media_id, path = futures[future]
+                try:
+                    media_id, semantic_data, status, error = future.result()
+                except BrokenProcessPool as e:
+                    # A worker died (killed, out of memory, crash in a native decoder); the
+                    # videos not stored yet are picked up again by the next --analyze run
+                    logging.error(f"The analysis worker pool stopped ({e}), "
+                                  f"{len(rows) - analyzed - partial - failed} videos are left for the next run.")
+                    break
+                except Exception as e:
+                    semantic_data, status, error = None, ANALYSIS_FAILED, e
+                if status == ANALYSIS_FAILED:
+                    failed += 1
+                    logging.error(f"Semantic analysis failed for {path}: {error}")
+                elif status == ANALYSIS_PARTIAL:
+                    partial += 1
+                    logging.warning(f"Semantic analysis incomplete for {path}: {error}")
+                else:
+                    analyzed += 1
+                    logging.debug("Analyzed %s: %s", path, semantic_data)
+                batch.append((media_id, semantic_data, status))
+                if len(batch) >= ANALYZE_BATCH_SIZE:
+                    db.store_semantic_results(batch, version)
+                    batch = []
+                    logging.info(f"Analyzed {analyzed + partial + failed} of {len(rows)} videos...")
+        finally:
+            # Keep what finished, also on Ctrl+C, and do not start the queued videos
+            if batch:
+                db.store_semantic_results(batch, version)
+            executor.shutdown(wait=False, cancel_futures=True)
+    logging.info(f"Semantic analysis: {analyzed} videos analyzed, {partial} incomplete, {failed} failed "
+                 f"in {time.perf_counter() - start:.1f}s.")
+
+
+def share_geo_info(db, time_diff_seconds):
+    """Give media files without geo data the place of the geo-tagged file closest in time, within time_diff_seconds"""
+    # Post-processing for metadata sharing (MP4 from HEIC/Images)
+    logging.info("Attempting to share geo metadata between related files...")
+
+    # All iPhone images are HEIC, some other images may have geo data.
+    # Once we have more media files (Image and Video) with geo data, we can use them to find nearby videos.
+    image_files_with_geo = db.get_files_with_geo()
+    logging.info(f">> Found {len(image_files_with_geo)} media files with geo data.")
+
+    #for a in image_files_with_geo:
+    #    logging.info(f"geo data: {a}")
+    #input("Paused for debugging. Press Enter to continue...")
+
+    # The video files are from DJI Pocket 3 which MP4 do not have geo data.
+    # As long as the file has creation_time, we can try to find nearby images with geo data.
+    all_files_without_geo = db.get_files_without_geo()
+    logging.info(f">> Found {len(all_files_without_geo)} media files (mainly MP4) without geo data.")
+
+    #for a in all_files_without_geo:
+    #    logging.info(f"no geo data: {a}")
+    #input("Paused for debugging. Press Enter to continue...")
+
+    # Sort the geo-tagged files by epoch (computed in SQL), so the closest one in time is found
+    # by binary search instead of comparing against every file. Images are matched on their
+    # wall-clock time; videos carry a UTC time without a timezone, so they are matched on the
+    # UTC epoch of the geo-tagged files, whose timezone is known.
+    image_files_with_geo = [image_file for image_file in image_files_with_geo if image_file[6] is not None]
+    by_time = {
+        False: sorted(image_files_with_geo, key=lambda image_file: image_file[6]),
+        True: sorted(image_files_with_geo, key=lambda image_file: image_file[7]),
+    }
+    times = {
+        False: [image_file[6] for image_file in by_time[False]],
+        True: [image_file[7] for image_file in by_time[True]],
+    }
+
+    # Process each media file without geo data to find closest image with geo data
+    for media_file in all_files_without_geo:
+        media_filepath = media_file[0]
+        is_video = media_file[8] == 'Video'
+        media_time = media_file[7] if is_video else media_file[6]
+        image_times = times[is_video]
+
+        # Already use SQL to filter out files without creation_time (SQL: creation_time IS NOT NULL)
+        if media_time is None:
+            logging.debug("Skipping %s - creation time could not be parsed", media_filepath)
+            continue
+
+        # Find the closest image file by creation time: the neighbours around the insertion point
+        closest_image = None
+        min_time_diff = float('inf')
+        index = bisect_left(image_times, media_time)
+        for candidate in (index - 1, index):
+            if 0 <= candidate < len(image_times):
+                time_diff = abs(media_time - image_times[candidate])
+                if time_diff < min_time_diff:
+                    min_time_diff = time_diff
+                    closest_image = by_time[is_video][candidate]
+
+        # If we found a close image (within reasonable time window, e.g., 4 hours = 240 minutes)
+        if closest_image and min_time_diff <= time_diff_seconds:  # 240 minutes = 4 hours
+            # Extract geo data from closest image
+            geo_data = {
+                'latitude': closest_image[2],
+                'longitude': closest_image[3], 
+                'place_id': closest_image[4],
+                'timezone': closest_image[5]
+            }
+            # The media's time is now known to be in the shared timezone
+            creation_ts, tz_offset = creation_epoch(media_file[1], geo_data['timezone'], utc=is_video)
+        
+            # Update the media file with geo data from closest image
+            try:
+                db.cursor.execute('''
+                    UPDATE media_files
+                    SET latitude = ?, longitude = ?, place_id = ?,
+                        creation_ts = COALESCE(?, creation_ts), tz_offset = ?
+                    WHERE filepath = ?
+                ''', (
+                    geo_data['latitude'], geo_data['longitude'], geo_data['place_id'],
+                    creation_ts, tz_offset,
+                    media_filepath
+                ))
+                db.conn.commit()
             
-            # Skip thumbnail files (files ending with _thumb.jpg)
-            if file.endswith('_thumb.jpg'):
-                logging.debug(f"Skipping thumbnail file: {file}")
-                continue
-                
-            all_files.append(os.path.join(root, file))
-    logging.info(f"Found {len(all_files)} files in total.")
-    return all_files
+                logging.info(f"Updated geo data for {media_filepath} from {closest_image[0]} "
+                        f"(time diff: {min_time_diff:.0f} seconds)")
+                    
+            except sqlite3.Error as e:
+                logging.error(f"Error updating geo data for {media_filepath}: {e}")
+        else:
+            if closest_image:
+                logging.debug("Closest image for %s is too far in time (%.0f seconds)",
+                              media_filepath, min_time_diff)
+            else:
+                logging.debug("No suitable image found for %s", media_filepath)
+
+
+def print_sync_summary(added, removed, changed, limit=20):
+    print("\nSync FS and DB: difference between file system and database")
+    for label, paths in (('New files', added), ('Removed files', removed), ('Changed files', changed)):
+        print(f"  {label}: {len(paths)}")
+        for filepath in sorted(paths)[:limit]:
+            print(f"    {filepath}")
+        if len(paths) > limit:
+            print(f"    ... and {len(paths) - limit} more")
+
+def print_duplicate_report(groups, limit=50):
+    """Print the groups of byte-identical media files and the space taken by the extra copies"""
+    wasted = sum(files[0][2] * (len(files) - 1) for _, files in groups)
+    print(f"\n{len(groups)} groups of identical media files, {wasted / 1024 / 1024:.1f} MB in extra copies.")
+    for content, files in groups[:limit]:
+        print(f"  {content}  {len(files)} copies of {files[0][2]} bytes")
+        for _, filepath, _ in files:
+            print(f"    {filepath}")
+    if len(groups) > limit:
+        print(f"  ... and {len(groups) - limit} more groups")
+
 
 def cleanup_thumbnails(path):
     """Remove all existing thumbnail files from the directory tree"""
@@ -441,7 +1701,7 @@ def cleanup_thumbnails(path):
                 try:
                     os.remove(thumbnail_path)
                     thumbnail_count += 1
-                    logging.debug(f"Removed thumbnail: {thumbnail_path}")
+                    logging.debug("Removed thumbnail: %s", thumbnail_path)
                 except OSError as e:
                     logging.error(f"Error removing thumbnail {thumbnail_path}: {e}")
     
@@ -461,14 +1721,37 @@ Usage Note: Consider the parameter execution order for optimal performance.
   --cleanup_thumbnails or -c : Remove all existing thumbnail files before file system scanning process. Default: False.
   --jump2update or -j        : Skip the file scanning and processing. Just jump to next section. Default: False.
   --syncFSnDB or -f          : Sync file system changes with the database. Default: False.
+  --dry-run                  : With --syncFSnDB, only print the file system / database difference, change
+                               nothing. Default: False.
+  --resume                   : Continue the last interrupted scan of the directory from its journal. Default: False.
+  --full-walk                : List every directory, also the ones unchanged since the last scan. --syncFSnDB
+                               always does. Default: False.
+  --duplicates               : Hash the files scanned before content hashing existed, print the groups of
+                               byte-identical media files and exit. Default: False.
+  --watch                    : After the run, keep watching the directory and ingest new media as it lands.
+                               No confirmation prompt is shown in watch mode. Default: False.
   --updateCity or -u         : Update city translation in the database. Default: False.
+  --exiftool-only            : JPEG/HEIC EXIF (date, GPS) is read natively; use ExifTool for every file instead.
+  --profile [NAME]           : Time every stage (walk, hash, extract, geocode, db, thumbnail, ...) and write
+                               NAME.json / NAME.csv with wall/CPU times, per file type histograms and the
+                               slowest files. --profile-stage STAGE also writes cProfile output of that stage.
   --shareGeoInfo or -s       : Share (Update DB) geo info to the no geo media files at the end. Default: False.
+  --analyze                  : Detect people, walking, scenery and talking in the videos not analyzed yet (or
+                               analyzed with other models / settings). Resumable. Default: False.
 
   The following parameters can be used together with the above options:
   --debug-level : Set the logging debug level.
   --deldb or -d : Delete database and start the re-scan process.
   --time-diff : Time difference in min for proximity search (default is 240 minutes = 4 hours).
   --geo-list : Specific path to the 'geo.list' file for enhanced geolocation (default: geo_chinese_.list).
+  --geo-cache-grid : Grid in degrees of the cached geo lookups (default: 0.001, 0 disables the cache).
+  --geo-memory-mb : Memory cap in MB of the loaded geo list shards (default: 256).
+  --analyze-cpus : CPU cores used by --analyze (default: all).
+  --analyze-threads : Threads per --analyze worker process (default: 2).
+  --sample-fps : Frames per second --analyze samples from each video (default: 1).
+  --scene-threshold : Sample the frames where the scene changes by more than this score (0-1, e.g. 0.3)
+                      instead of at a fixed rate.
+  --all-frames : Decode every frame when sampling at a fixed rate, not only the keyframes.
 
   Finally, specify the target directory to scan (default is "/Volumes/Extreme SSD 1/Media").
 """
@@ -498,6 +1781,62 @@ Usage Note: Consider the parameter execution order for optimal performance.
         '--syncFSnDB', '-f', default=False, action='store_true',
         help='Sync file system changes with the database. default: False'
     )
+    parser.add_argument(
+        '--dry-run', default=False, action='store_true',
+        help='With --syncFSnDB: print the difference between file system and database without changing anything. '
+             'default: False'
+    )
+    parser.add_argument(
+        '--resume', default=False, action='store_true',
+        help='Continue the last interrupted scan of the target directory from the scan journal. default: False'
+    )
+    parser.add_argument(
+        '--full-walk', default=False, action='store_true',
+        help='List every directory instead of skipping the ones unchanged since the last scan '
+             '(always done by --syncFSnDB). default: False'
+    )
+    parser.add_argument(
+        '--duplicates', default=False, action='store_true',
+        help='Print the groups of byte-identical media files in the database and exit. default: False'
+    )
+    parser.add_argument(
+        '--walk-threads', type=int, default=8,
+        help='Number of directory subtrees walked in parallel (default: 8).'
+    )
+    parser.add_argument(
+        '--watch', default=False, action='store_true',
+        help='Keep watching the target directory after the run and ingest new or changed media. default: False'
+    )
+    parser.add_argument(
+        '--watch-debounce', type=float, default=5.0,
+        help='Seconds without new file events before a batch is processed in watch mode (default: 5).'
+    )
+    parser.add_argument(
+        '--watch-polling', default=False, action='store_true',
+        help='Watch by polling the directory tree instead of file system events (e.g. network shares).'
+    )
+    parser.add_argument(
+        '--poll-interval', type=float, default=30.0,
+        help='Seconds between directory polls when watching by polling (default: 30).'
+    )
+    parser.add_argument(
+        '--exiftool-only', default=False, action='store_true',
+        help='Read all metadata with ExifTool instead of the built-in JPEG/HEIC EXIF reader. default: False'
+    )
+    parser.add_argument(
+        '--profile', type=str, nargs='?', const='scan_profile', default=None,
+        help='Write a per-stage timing report to PROFILE.json and PROFILE.csv (default name: scan_profile).'
+    )
+    parser.add_argument(
+        '--profile-stage', type=str, default=None,
+        choices=['walk', 'hash', 'dedupe', 'extract', 'geocode', 'db', 'thumbnail', 'sync', 'city_update', 'share_geo',
+                 'analyze', 'aggregates'],
+        help='With --profile, also dump cProfile output of this stage to PROFILE.<stage>.prof.'
+    )
+    parser.add_argument(
+        '--profile-slowest', type=int, default=20,
+        help='Number of slowest files listed in the profile report (default: 20).'
+    )
     parser.add_argument(
         '--updateCity', '-u', default=False, action='store_true',
         help='Update city translation in the database. default: False'
@@ -515,9 +1854,50 @@ Usage Note: Consider the parameter execution order for optimal performance.
         '--geo-list', type=str, default='geo_chinese_.list',
         help='Path to the geo.list file for enhanced geolocation (default: geo_chinese_.list).'
     )
+    parser.add_argument(
+        '--geo-cache-grid', type=float, default=GEO_CACHE_GRID, metavar='DEGREES',
+        help=f'Grid of the reverse geocoding cache: files within the same cell share one lookup '
+             f'(default: {GEO_CACHE_GRID:g} degrees, about 110 m; 0 disables the cache).'
+    )
+    parser.add_argument(
+        '--geo-memory-mb', type=int, default=GEO_MEMORY_MB, metavar='MB',
+        help=f'Memory cap of the geo list shards loaded for reverse geocoding (default: {GEO_MEMORY_MB} MB).'
+    )
+    parser.add_argument(
+        '--analyze', default=False, action='store_true',
+        help='Run semantic analysis on the videos that have no results for the current models. default: False'
+    )
+    parser.add_argument(
+        '--analyze-cpus', type=int, default=None, metavar='N',
+        help='CPU cores shared by the analysis worker processes (default: all cores).'
+    )
+    parser.add_argument(
+        '--analyze-threads', type=int, default=ANALYZE_WORKER_THREADS, metavar='N',
+        help=f'Threads of each analysis worker process (default: {ANALYZE_WORKER_THREADS}).'
+    )
+    parser.add_argument(
+        '--sample-fps', type=float, default=None, metavar='FPS',
+        help='Frames per second sampled from each video by --analyze (default: 1).'
+    )
+    parser.add_argument(
+        '--scene-threshold', type=float, default=None, metavar='SCORE',
+        help='Sample the frames where the scene changes by more than SCORE (0-1, e.g. 0.3) instead of at a fixed rate.'
+    )
+    parser.add_argument(
+        '--all-frames', default=False, action='store_true',
+        help='Decode every frame when sampling at a fixed rate, not only the keyframes. default: False'
+    )
     # The geo_chinese_.list file for enhanced geolocation with Chinese name translations
 
     args = parser.parse_args()
+    if args.dry_run and not args.syncFSnDB:
+        parser.error('--dry-run only applies to the FS and DB sync, use it with --syncFSnDB (-f)')
+    if (args.sample_fps is not None or args.scene_threshold is not None or args.all_frames) and not args.analyze:
+        parser.error('--sample-fps, --scene-threshold and --all-frames only apply to --analyze')
+    if args.sample_fps is not None and args.sample_fps <= 0:
+        parser.error('--sample-fps must be greater than 0')
+    if args.scene_threshold is not None and not 0 < args.scene_threshold < 1:
+        parser.error('--scene-threshold must be between 0 and 1')
 
     time_diff_seconds = args.time_diff * 60  # convert minutes to seconds
 
@@ -532,6 +1912,13 @@ Usage Note: Consider the parameter execution order for optimal performance.
     if args.syncFSnDB:
         args.jump2update = False
         logging.info("Sync FS and DB enabled, disabling jump2update option (jump to DB Geo update section).")
+    if args.profile_stage and not args.profile:
+        args.profile = 'scan_profile'
+    if args.profile:
+        profiler.enable(cprofile_stage=args.profile_stage, slowest_count=args.profile_slowest)
+    if args.resume and args.deldb:
+        args.deldb = False
+        logging.warning("--resume keeps the database of the interrupted scan, ignoring --deldb.")
 
     # Summary of user options
     print("\nUser options summary:")
@@ -542,10 +1929,16 @@ Usage Note: Consider the parameter execution order for optimal performance.
     if args.cleanup_thumbnails:
         print("    WARNING: Existing thumbnails will be deleted!")
     print(f"  3. Jump to update (skip scanning): {args.jump2update}")
+    if args.resume:
+        print("    RESUME: The last interrupted scan of the target directory is continued.")
     if args.jump2update:
         print("    WARNING: File scanning will be skipped!  Do not use this option for the first run.")
     print(f"  4. Sync FS and DB: {args.syncFSnDB}")
-    if not args.syncFSnDB:
+    if args.duplicates:
+        print("    DUPLICATES: Only the byte-identical media files in the database are reported.")
+    elif args.dry_run:
+        print("    DRY RUN: Only the file system / database difference is printed, nothing is changed.")
+    elif not args.syncFSnDB:
         print("    WARNING: File system changes will not be synced with the database!")
     print(f"  5. Update city translations: {args.updateCity}")
     if args.updateCity:
@@ -554,11 +1947,25 @@ Usage Note: Consider the parameter execution order for optimal performance.
     if args.shareGeoInfo:
         print("    WARNING: Geo info will be shared to media files without geo data!")
         print("             This may overwrite existing geo data in those files in DB.")
+    print(f"  7. Semantic analysis of videos: {args.analyze}")
+    if args.analyze:
+        print(f"    Uses {args.analyze_cpus or os.cpu_count()} CPU cores, {args.analyze_threads} threads per worker.")
+        if args.scene_threshold:
+            print(f"    Frames are sampled on scene changes above {args.scene_threshold:g}.")
+        else:
+            print(f"    Frames are sampled at {args.sample_fps or 1:g} per second"
+                  f"{' from all frames' if args.all_frames else ' from the keyframes'}.")
     print(f"\n  I. Time difference for proximity search: '{args.time_diff}' minutes")
     print(f"  II. Geo list path: '{args.geo_list}'    User can specify different geolocation file.")
+    if args.geo_cache_grid > 0:
+        print(f"      Geo lookups are cached per {args.geo_cache_grid:g} degree grid cell.")
     print(f"  III. Target directory: '{args.directory}'    The directory to scan for media files.\n")
-    # ask for user confirmation to proceed
-    proceed = input("Proceed with these settings? (y/n): ")
+    if args.profile:
+        print(f"  Profile report: '{args.profile}.json' / '{args.profile}.csv'\n")
+    if args.watch:
+        print(f"  IV. Watch mode: new media is ingested as it lands (debounce {args.watch_debounce:.0f}s).\n")
+    # ask for user confirmation to proceed, watch mode runs unattended
+    proceed = 'y' if args.watch else input("Proceed with these settings? (y/n): ")
     if proceed.lower() != 'y':
         print(logging.info("User aborted the operation."))
         # logging.info("User aborted the operation.")
@@ -566,7 +1973,9 @@ Usage Note: Consider the parameter execution order for optimal performance.
 
     # If user specified --deldb, delete the existing database file inside MetaOrganizerDB class.
     db = MediaOrganizerDB(rescan=args.deldb)
-    extractor = MetadataExtractor(geo_list_path=args.geo_list)
+    extractor = MetadataExtractor(geo_list_path=args.geo_list, native_exif=not args.exiftool_only,
+                                  geo_cache_grid=args.geo_cache_grid, geo_memory_mb=args.geo_memory_mb)
+    extractor.geo_cache.attach(db.conn)
 
     target_directory = args.directory
     
@@ -578,40 +1987,66 @@ Usage Note: Consider the parameter execution order for optimal performance.
     else:
         logging.info("Skipping thumbnail cleanup as per user request.")
 
-    all_files = scan_directory_recursive(target_directory)
+    if args.duplicates:
+        db.backfill_content_hashes()
+        print_duplicate_report(db.get_duplicate_groups())
+        if args.profile:
+            profiler.write_report(args.profile)
+        db.close()
+        return
+
+    # The walk is lazy and streams files while it runs; directories unchanged since the last
+    # completed scan are skipped unless --full-walk is given. The FS and DB sync compares the size
+    # and mtime of every file, so it always lists every directory.
+    full_walk = args.full_walk or args.syncFSnDB
+    walker = DirectoryWalker(
+        target_directory,
+        dir_cache=None if full_walk else db.get_directory_cache(),
+        workers=args.walk_threads,
+        with_stats=args.syncFSnDB
+    )
+
+    if args.dry_run:
+        entries = list(profiler.iterate('walk', walker))
+        with profiler.stage('sync'):
+            added, removed, changed = db.sync_with_filesystem(entries, walker.root, dry_run=True)
+        print_sync_summary(added, removed, changed)
+        if args.profile:
+            profiler.write_report(args.profile)
+        db.close()
+        return
 
     # ==================================================================================
     # After the first run, DB is created.  For the rest of the runs, we can skip already scanned files.
-    if not args.jump2update:
+    if args.syncFSnDB:
+        logging.info("New files are found and processed by the FS and DB sync below.")
+    elif not args.jump2update:
         logging.info("Starting to process files and update database...")
-        for filepath in all_files:
-
-            # Skip the hidden files and non-media files, already done in scanning.
-            #extension = os.path.splitext(filepath)[1].lower()
-            #if os.path.basename(filepath).startswith('.') or extension not in [".jpg", ".jpeg", ".png", ".heic", ".mp4", ".mov"]:
-            #    continue
-            
-            if db.file_exists(filepath):
-                logging.debug(f"Skipping already scanned and existing file: {filepath}")
-                continue
-
-            logging.debug(f"Processing file: {filepath}")
-            metadata = extractor.extract_metadata(filepath)
-
-            if metadata:
-                # Attempt to get geo data from geo.list if GPS coords are present
-                if metadata.get('latitude') is not None and metadata.get('longitude') is not None:
-                    geo_data = extractor.get_geo_from_coordinates(metadata['latitude'], metadata['longitude'])
-                    if geo_data:
-                        metadata.update(geo_data)
-
-                #if 'creation_time' not in metadata or metadata['creation_time'] is None or metadata['creation_time'] == 'N/A':
-                #    logging.warning(f"Metadata for {filepath}: ****** Missing creation_time")
-                #    input("Paused for debugging. Press Enter to continue...")
-
-                db.add_media_file(metadata)
-            else:
-                logging.warning(f"Could not extract metadata for: {filepath}")
+        # Walked files are journaled in batches (scan_queue), so an interrupted scan can be resumed
+        resumable = db.get_resumable_session(walker.root) if args.resume else None
+        if resumable:
+            session_id, walk_done = resumable
+            logging.info(f"Resuming scan session {session_id} of {walker.root}")
+        else:
+            if args.resume:
+                logging.info(f"No interrupted scan of {walker.root} found, starting a new scan.")
+            session_id, walk_done = db.start_scan_session(walker.root), False
+
+        failed = []
+        if not walk_done:
+            for batch in batched(profiler.iterate('walk', walker), SCAN_BATCH_SIZE):
+                db.queue_scan_paths(session_id, batch)
+                failed += process_scan_batch(db, extractor, session_id, batch, resumed=bool(resumable))
+            db.set_scan_walk_done(session_id)
+        # Left over from the interrupted run (all of them if the walk had already finished)
+        for batch in batched(db.get_pending_scan_paths(session_id), SCAN_BATCH_SIZE):
+            failed += process_scan_batch(db, extractor, session_id, batch, resumed=bool(resumable))
+        db.finish_scan_session(session_id)
+
+        # Every walked file is processed now. The mtimes are the ones read before processing, so a
+        # directory that got new thumbnails is listed once more on the next run and then skipped.
+        if not walk_done:
+            db.save_directory_cache(walker, incomplete_dirs={os.path.dirname(path) for path in failed})
     else:
         logging.info("Skipping file scanning as per user request (--jump2update or -j), go to next step.")
 
@@ -619,64 +2054,53 @@ Usage Note: Consider the parameter execution order for optimal performance.
     if args.syncFSnDB:
         logging.info("Sync FS and DB: Syncing file system changes with the database...")
         
-        # Generate thumbnails for all existing files if they don't exist
-        logging.info("Sync FS and DB: Generating missing thumbnails for existing files...")
-        current_files_set = set(all_files)
+        # The walk is staged in a temp table and compared with media_files in SQL.
+        # Removed and changed files are deleted in bulk, changed files are then re-extracted like new ones.
+        entries = list(profiler.iterate('walk', walker))
+        with profiler.stage('sync'):
+            added, removed, changed = db.sync_with_filesystem(entries, walker.root)
+        logging.info(f"Sync FS and DB: {len(added)} new, {len(removed)} removed, {len(changed)} changed files.")
+        for filepath in removed:
+            logging.info(f"Sync FS and DB: Removed from DB (file no longer exists): {filepath}")
+
+        for filepath in changed:
+            # The old thumbnail shows the previous content of the file
+            thumbnail_path = thumbnail_path_for(filepath)
+            if thumbnail_path in walker.thumbnails:
+                try:
+                    os.remove(thumbnail_path)
+                    walker.thumbnails.discard(thumbnail_path)
+                except OSError as e:
+                    logging.error(f"Sync FS and DB: Error removing stale thumbnail {thumbnail_path}: {e}")
+
+        with profiler.stage('hash'):
+            hashes = hash_files(added + changed)
+        failed = []
+        for filepath in added + changed:
+            logging.debug("Sync FS and DB: New or changed file detected, processing: %s", filepath)
+            if not process_media_file(db, extractor, filepath, partial=hashes[filepath]):
+                failed.append(filepath)
+
+        # Thumbnails are generated when a file is added, so only the files whose thumbnail was not
+        # seen while listing the directories (e.g. after --cleanup_thumbnails) need one.
+        added_set = set(added + changed)
         thumbnail_count = 0
-        for filepath in current_files_set:
-            if os.path.exists(filepath):
-                thumbnail_path = db.generate_thumbnail(filepath)
-                if thumbnail_path:
+        for filepath, _, _ in entries:
+            if filepath not in added_set and thumbnail_path_for(filepath) not in walker.thumbnails:
+                if db.generate_thumbnail(filepath):
                     thumbnail_count += 1
-                    logging.debug(f"Generated thumbnail: {thumbnail_path}")
-        logging.info(f"Sync FS and DB: Generated {thumbnail_count} new thumbnails")
-        
-        db.cursor.execute('SELECT filepath FROM media_files')
-        db_files_set = set(row[0] for row in db.cursor.fetchall())
-
-        # Files to remove from DB
-        files_to_remove = db_files_set - current_files_set
-        for filepath in files_to_remove:
-            try:
-                db.cursor.execute('DELETE FROM media_files WHERE filepath = ?', (filepath,))
-                logging.info(f"Sync FS and DB: Removed from DB (file no longer exists): {filepath}")
-            except sqlite3.Error as e:
-                logging.error(f"Sync FS and DB: Error removing {filepath} from DB: {e}")
-        db.conn.commit()
-
-        # This section is repeated here to ensure new files are added above.
-        # Files to add to DB (new files)
-        files_to_add = current_files_set - db_files_set
-        for filepath in files_to_add:
-            # No need to check again for hidden files and non-media files here since already checked in scanning.
-            #extension = os.path.splitext(filepath)[1].lower()
-            #if os.path.basename(filepath).startswith('.') or extension not in [".jpg", ".jpeg", ".png", ".heic", ".mp4", ".mov"]:
-            #    continue
-
-            logging.debug(f"Sync FS and DB: New file detected, processing: {filepath}")
-            metadata = extractor.extract_metadata(filepath)
-
-            if metadata:
-                # Attempt to get geo data from geo.list if GPS coords are present
-                if metadata.get('latitude') is not None and metadata.get('longitude') is not None:
-                    geo_data = extractor.get_geo_from_coordinates(metadata['latitude'], metadata['longitude'])
-                    if geo_data:
-                        metadata.update(geo_data)
-
-                # This file is new and not in DB, so no need to check for existing.
-                db.add_media_file(metadata)
-            else:
-                logging.warning(f"Sync FS and DB: Could not extract metadata for new file: {filepath}")
+        logging.info(f"Sync FS and DB: Generated {thumbnail_count} missing thumbnails")
+        db.save_directory_cache(walker, incomplete_dirs={os.path.dirname(path) for path in failed})
     else:
         logging.info("Do not Sync File System and DB, go to next step.")
 
     # ==================================================================================
     # Update city translation if requested
     if args.updateCity:
-        image_files_with_geo = db.get_files_with_geo()
-        for image_file in image_files_with_geo:
-            db.update_city_translation(image_file[0], extractor)
-        logging.info("City translation updated for all relevant image files.")
+        with profiler.stage('city_update'):
+            changes = db.update_place_translations(extractor)
+        logging.info(f"City translation updated for {len(changes)} cities, "
+                     f"{sum(count for _, _, count in changes.values())} media files.")
     else:
         logging.info("Skipping city translation update as per user request.")
 
@@ -693,126 +2117,39 @@ Usage Note: Consider the parameter execution order for optimal performance.
         # 3. Propagate the detailed geo-location from the source media to the target media.
         # -----------------------------------------------------------------------------
 
-        # Post-processing for metadata sharing (MP4 from HEIC/Images)
-        logging.info("Attempting to share geo metadata between related files...")
-
-        # All iPhone images are HEIC, some other images may have geo data.
-        # Once we have more media files (Image and Video) with geo data, we can use them to find nearby videos.
-        image_files_with_geo = db.get_files_with_geo()
-        logging.info(f">> Found {len(image_files_with_geo)} media files with geo data.")
-
-        #for a in image_files_with_geo:
-        #    logging.info(f"geo data: {a}")
-        #input("Paused for debugging. Press Enter to continue...")
-        
-        # The video files are from DJI Pocket 3 which MP4 do not have geo data.
-        # As long as the file has creation_time, we can try to find nearby images with geo data.
-        all_files_without_geo = db.get_files_without_geo()
-        logging.info(f">> Found {len(all_files_without_geo)} media files (mainly MP4) without geo data.")
-
-        #for a in all_files_without_geo:
-        #    logging.info(f"no geo data: {a}")
-        #input("Paused for debugging. Press Enter to continue...")
-       
-        # Pre-calculate image_time for all image files for efficiency
-        updated_image_files_with_geo = []
-        for image_file in image_files_with_geo:
-            # convert image_file[1] (YYYY-MM-DD HH:MM:SS format) to datetime object,  
-            image_datetime = datetime.strptime(image_file[1], '%Y-%m-%d %H-%M-%S')
-            updated_image_file = image_file + (image_datetime,)
-            updated_image_files_with_geo.append(updated_image_file)       
-        # Update the original list
-        image_files_with_geo = updated_image_files_with_geo
-
-        # Process each media file without geo data to find closest image with geo data
-        for media_file in all_files_without_geo:
-            media_filepath = media_file[0]
-            media_time = datetime.strptime(media_file[1], '%Y-%m-%d %H-%M-%S')
-
-            # Already use SQL to filter out files without creation_time (SQL: creation_time IS NOT NULL)
-            #if not media_creation_time:
-            #    logging.debug(f"Skipping {media_filepath} - no creation time available")
-            #    continue
-
-            # Find the closest image file by creation time
-            closest_image = None
-            min_time_diff = float('inf')
-            
-            for image_file in image_files_with_geo:
-                image_filepath = image_file[0]
-                image_time = image_file[-1]
-
-                # Already use SQL to filter out files without creation_time (SQL: creation_time IS NOT NULL)
-                # if not image_creation_time:
-                #    continue
-                    
-                try:
-                    # Calculate time difference in seconds
-                    time_diff = abs((media_time - image_time).total_seconds())
-
-                    if time_diff > time_diff_seconds:  # Use seconds for search, default 4h (240 minutes = 4 hours)
-                        continue  # Skip images that are more than 4 hours apart
-
-                    if time_diff < min_time_diff:
-                        min_time_diff = time_diff
-                        closest_image = image_file
-                        
-                except (ValueError, TypeError) as e:
-                    logging.debug(f"Error parsing timestamps for {media_filepath} or {image_filepath}: {e}")
-                    continue
-
-            # If we found a close image (within reasonable time window, e.g., 4 hours = 240 minutes)
-            if closest_image and min_time_diff <= time_diff_seconds:  # 240 minutes = 4 hours
-                # Extract geo data from closest image
-                geo_data = {
-                    'latitude': closest_image[2],
-                    'longitude': closest_image[3], 
-                    'city_en': closest_image[4],
-                    'city_zh': closest_image[5],
-                    'region_en': closest_image[6],
-                    'region_zh': closest_image[7],
-                    'subregion_en': closest_image[8],
-                    'subregion_zh': closest_image[9],
-                    'country_code': closest_image[10],
-                    'country_en': closest_image[11],
-                    'country_zh': closest_image[12],
-                    'timezone': closest_image[13]
-                }
-                
-                # Update the media file with geo data from closest image
-                try:
-                    db.cursor.execute('''
-                        UPDATE media_files
-                        SET latitude = ?, longitude = ?, city_en = ?, city_zh = ?, 
-                            region_en = ?, region_zh = ?, subregion_en = ?, subregion_zh = ?,
-                            country_code = ?, country_en = ?, country_zh = ?, timezone = ?
-                        WHERE filepath = ?
-                    ''', (
-                        geo_data['latitude'], geo_data['longitude'],
-                        geo_data['city_en'], geo_data['city_zh'],
-                        geo_data['region_en'], geo_data['region_zh'],
-                        geo_data['subregion_en'], geo_data['subregion_zh'],
-                        geo_data['country_code'], geo_data['country_en'],
-                        geo_data['country_zh'], geo_data['timezone'],
-                        media_filepath
-                    ))
-                    db.conn.commit()
-                    
-                    logging.info(f"Updated geo data for {media_filepath} from {closest_image[0]} "
-                            f"(time diff: {min_time_diff:.0f} seconds)")
-                            
-                except sqlite3.Error as e:
-                    logging.error(f"Error updating geo data for {media_filepath}: {e}")
-            else:
-                if closest_image:
-                    logging.debug(f"Closest image for {media_filepath} is too far in time "
-                                f"({min_time_diff:.0f} seconds)")
-                else:
-                    logging.debug(f"No suitable image found for {media_filepath}")
+        with profiler.stage('share_geo'):
+            share_geo_info(db, time_diff_seconds)
     else:
         logging.info("Skipping geo metadata sharing as per user request.")
 
     # ==================================================================================
+    # People, walking, scenery and talking of the videos; rows analyzed with the current models are skipped
+    if args.analyze:
+        with profiler.stage('analyze'):
+            run_semantic_analysis(db, cpus=args.analyze_cpus, worker_threads=args.analyze_threads,
+                                  sample_fps=args.sample_fps, scene_threshold=args.scene_threshold,
+                                  keyframes=False if args.all_frames else None)
+    else:
+        logging.info("Skipping semantic analysis (use --analyze).")
+
+    # ==================================================================================
+    # Refresh the precomputed aggregates used by /api/media/clusters and /api/media/days
+    with profiler.stage('aggregates'):
+        db.backfill_technical_metadata()
+        db.backfill_perceptual_hashes()
+        db.rebuild_geo_clusters()
+        db.rebuild_daily_counts()
+    logging.info(extractor.geo_cache.summary())
+    if extractor.geo_shards:
+        logging.info(extractor.geo_shards.summary())
+
+    if args.profile:
+        profiler.write_report(args.profile)
+
+    if args.watch:
+        watcher = MediaWatcher(target_directory, debounce=args.watch_debounce,
+                               polling=args.watch_polling, poll_interval=args.poll_interval)
+        watcher.run(lambda changed, deleted, deleted_dirs: ingest_changes(db, extractor, changed, deleted, deleted_dirs))
 
     db.close()
     logging.info("Media organization complete.")
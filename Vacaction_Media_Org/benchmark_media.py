@@ -0,0 +1,407 @@
+"""
+Benchmark harness for the media scanner and the web API.
+
+A synthetic library is generated in a work directory:
+  * JPEG and PNG images with EXIF CreateDate and (for most of them) GPS coordinates,
+    grouped in one folder per day like a camera import;
+  * MP4 videos rendered from ffmpeg's lavfi test sources, with a creation time but no GPS
+    (like DJI footage), so geo sharing has work to do. Skipped if ffmpeg is not installed;
+  * a geo list in the geo_chinese_.list format with the requested number of places.
+
+The scanner then runs as a subprocess with --profile, once from scratch and once as an
+incremental --syncFSnDB run. Its per-stage report gives the walk, extraction, reverse geocoding,
+thumbnailing and geo sharing times. Reverse geocoding is also timed directly, and the main web
+API endpoints are called through the Flask test client against the generated database.
+
+Results are written as flat {metric: value} JSON named after the git commit, so two runs can be
+compared across commits:
+
+  python benchmark_media.py --images 2000 --videos 20 --geo-entries 20000
+  python benchmark_media.py --compare bench_results/1a2b3c4.json bench_results/5d6e7f8.json
+
+The same corpus (same --seed and sizes) is reused between runs unless --regenerate is given.
+ExifTool must be installed as `exifTool`, like for Main_scan_media.py.
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    from PIL import Image, ImageDraw
+    from PIL.ExifTags import IFD
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+logging.basicConfig(level=logging.INFO, format=
+    '%(asctime)s - %(levelname)s - %(message)s')
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SCAN_SCRIPT = os.path.join(SCRIPT_DIR, 'Main_scan_media.py')
+WEB_DIR = os.path.join(SCRIPT_DIR, 'media_library_web')
+
+GEO_LIST_HEADER = ('City_en,City_zn,Region_en,Region_zn,Subregion_en,Subregion_zn,'
+                   'CountryCode,Country_en,Country_zn,TimeZone,Latitude,Longitude')
+
+# Trip destinations the synthetic photos are taken around: (country code, country, timezone, lat, lon)
+TRIP_CENTERS = (
+    ('TW', 'Taiwan', 'Asia/Taipei', 25.03, 121.56),
+    ('JP', 'Japan', 'Asia/Tokyo', 35.68, 139.69),
+    ('FR', 'France', 'Europe/Paris', 48.86, 2.35),
+    ('US', 'United States', 'America/Los_Angeles', 37.77, -122.42),
+    ('CN', 'China', 'Asia/Shanghai', 31.23, 121.47),
+)
+
+
+# ==================================================================================
+# Synthetic corpus
+
+def generate_geo_list(path, entries, rng):
+    """Write a geo list with places scattered around the trip centers"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(GEO_LIST_HEADER + '\n')
+        for i in range(entries):
+            code, country, timezone, lat, lon = TRIP_CENTERS[i % len(TRIP_CENTERS)]
+            # Most places close to the centers, some spread over the whole region
+            spread = 0.5 if i % 4 else 8.0
+            f.write(f"City{i:06d},城市{i:06d},Region{i % 97},地区{i % 97},Sub{i % 13},分区{i % 13},"
+                    f"{code},{country},{country}中文,{timezone},"
+                    f"{lat + rng.uniform(-spread, spread):.5f},{lon + rng.uniform(-spread, spread):.5f}\n")
+
+
+def _dms(value):
+    value = abs(value)
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = round((value - degrees - minutes / 60) * 3600, 2)
+    return (float(degrees), float(minutes), seconds)
+
+
+def generate_images(media_dir, count, rng, image_size=(640, 480), png_ratio=0.1, gps_ratio=0.8):
+    """Images with EXIF dates (and mostly GPS) in per-day folders, returns the number of bytes written"""
+    total_bytes = 0
+    start = datetime.datetime(2024, 5, 1, 8, 0, 0)
+    for i in range(count):
+        trip = (i * len(TRIP_CENTERS)) // max(count, 1)
+        _, _, _, center_lat, center_lon = TRIP_CENTERS[trip]
+        taken = start + datetime.timedelta(days=trip * 10 + (i % 50) // 10, seconds=(i % 10) * 900 + rng.randrange(60))
+        day_dir = os.path.join(media_dir, taken.strftime('%Y-%m-%d'))
+        os.makedirs(day_dir, exist_ok=True)
+
+        img = Image.new('RGB', image_size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        draw = ImageDraw.Draw(img)
+        for _ in range(12):
+            x, y = rng.randrange(image_size[0]), rng.randrange(image_size[1])
+            draw.rectangle((x, y, x + rng.randrange(20, 200), y + rng.randrange(20, 150)),
+                           fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+
+        exif = Image.Exif()
+        date_text = taken.strftime('%Y:%m:%d %H:%M:%S')
+        exif[0x0132] = date_text                      # DateTime
+        exif_ifd = exif.get_ifd(IFD.Exif)
+        exif_ifd[0x9003] = date_text                  # DateTimeOriginal
+        exif_ifd[0x9004] = date_text                  # CreateDate
+        if rng.random() < gps_ratio:
+            lat = center_lat + rng.uniform(-0.3, 0.3)
+            lon = center_lon + rng.uniform(-0.3, 0.3)
+            gps_ifd = exif.get_ifd(IFD.GPSInfo)
+            gps_ifd[1] = 'N' if lat >= 0 else 'S'
+            gps_ifd[2] = _dms(lat)
+            gps_ifd[3] = 'E' if lon >= 0 else 'W'
+            gps_ifd[4] = _dms(lon)
+
+        if rng.random() < png_ratio:
+            path = os.path.join(day_dir, f"IMG_{i:06d}.png")
+            img.save(path, exif=exif)
+        else:
+            path = os.path.join(day_dir, f"IMG_{i:06d}.jpg")
+            img.save(path, 'JPEG', quality=85, exif=exif)
+        total_bytes += os.path.getsize(path)
+    return total_bytes
+
+
+def generate_videos(media_dir, count, rng, duration=2):
+    """Short H.264 test-pattern videos with a creation time, returns (videos written, bytes)"""
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        logging.warning("ffmpeg not found, the corpus has no videos.")
+        return 0, 0
+    written = total_bytes = 0
+    start = datetime.datetime(2024, 5, 1, 9, 0, 0)
+    for i in range(count):
+        trip = (i * len(TRIP_CENTERS)) // max(count, 1)
+        taken = start + datetime.timedelta(days=trip * 10 + i % 5, minutes=rng.randrange(600))
+        day_dir = os.path.join(media_dir, taken.strftime('%Y-%m-%d'))
+        os.makedirs(day_dir, exist_ok=True)
+        path = os.path.join(day_dir, f"DJI_{i:06d}.mp4")
+        cmd = [ffmpeg, '-v', 'error', '-y',
+               '-f', 'lavfi', '-i', f"testsrc=duration={duration}:size=640x360:rate=25",
+               '-f', 'lavfi', '-i', f"sine=frequency={220 + i % 8 * 110}:duration={duration}",
+               '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', '-c:a', 'aac', '-shortest',
+               '-metadata', f"creation_time={taken.strftime('%Y-%m-%dT%H:%M:%S')}Z", path]
+        try:
+            subprocess.run(cmd, check=True, capture_output=True, timeout=120)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            logging.warning(f"Could not render test video {path}: {e}")
+            continue
+        written += 1
+        total_bytes += os.path.getsize(path)
+    return written, total_bytes
+
+
+def prepare_corpus(workdir, args):
+    """Generate the corpus unless the same configuration already exists in workdir"""
+    config = {
+        'images': args.images, 'videos': args.videos, 'geo_entries': args.geo_entries,
+        'seed': args.seed, 'image_size': args.image_size,
+    }
+    media_dir = os.path.join(workdir, 'media')
+    geo_list = os.path.join(workdir, 'geo_bench.list')
+    config_path = os.path.join(workdir, 'corpus.json')
+
+    if not args.regenerate and os.path.exists(config_path):
+        with open(config_path, encoding='utf-8') as f:
+            corpus = json.load(f)
+        if corpus.get('config') == config:
+            logging.info(f"Reusing the corpus in {workdir}")
+            return media_dir, geo_list, corpus
+
+    logging.info(f"Generating corpus in {workdir}: {args.images} images, {args.videos} videos, "
+                 f"{args.geo_entries} geo list entries")
+    shutil.rmtree(media_dir, ignore_errors=True)
+    os.makedirs(media_dir)
+    rng = random.Random(args.seed)
+    generate_geo_list(geo_list, args.geo_entries, rng)
+    width, height = (int(v) for v in args.image_size.split('x'))
+    image_bytes = generate_images(media_dir, args.images, rng, image_size=(width, height))
+    videos, video_bytes = generate_videos(media_dir, args.videos, rng)
+    corpus = {'config': config, 'videos_written': videos, 'bytes': image_bytes + video_bytes}
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(corpus, f, indent=2)
+    return media_dir, geo_list, corpus
+
+
+# ==================================================================================
+# Measurements
+
+def run_scan(workdir, media_dir, geo_list, name, scan_args):
+    """Run Main_scan_media.py with --profile, returns the flat metrics of the run"""
+    profile = os.path.join(workdir, name)
+    cmd = [sys.executable, SCAN_SCRIPT, '--profile', profile, '--geo-list', geo_list] + scan_args + [media_dir]
+    logging.info(f"Running scan '{name}': {' '.join(scan_args)}")
+    start = time.perf_counter()
+    with open(os.path.join(workdir, f"{name}.log"), 'w', encoding='utf-8') as log:
+        result = subprocess.run(cmd, input='y\n', text=True, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Scan '{name}' failed with exit code {result.returncode}, see {name}.log")
+
+    with open(f"{profile}.json", encoding='utf-8') as f:
+        report = json.load(f)
+    metrics = {
+        f"scan.{name}.process_wall_s": round(wall, 4),
+        f"scan.{name}.wall_s": report['wall_s'],
+        f"scan.{name}.cpu_s": report['process_cpu_s'],
+    }
+    for stage, stats in report['stages'].items():
+        metrics[f"scan.{name}.{stage}.self_wall_s"] = stats['self_wall_s']
+        metrics[f"scan.{name}.{stage}.cpu_s"] = stats['cpu_s']
+        for file_type, type_stats in stats['file_types'].items():
+            metrics[f"scan.{name}.{stage}{file_type}.mean_ms"] = type_stats['mean_ms']
+    return metrics
+
+
+def summarize(samples_s):
+    samples_ms = sorted(sample * 1000 for sample in samples_s)
+    return {
+        'median_ms': round(statistics.median(samples_ms), 3),
+        'p95_ms': round(samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.95))], 3),
+    }
+
+
+def bench_geocoding(geo_list, lookups, seed):
+    """Time reverse geocoding of random points near the trip centers"""
+    sys.path.insert(0, SCRIPT_DIR)
+    from metadata_extractor import MetadataExtractor
+
+    start = time.perf_counter()
+    # Without the lookup cache, so the metric stays the cost of the nearest-place search
+    extractor = MetadataExtractor(geo_list_path=geo_list, geo_cache_grid=0)
+    load = time.perf_counter() - start
+
+    rng = random.Random(seed)
+    points = []
+    for i in range(lookups):
+        _, _, _, lat, lon = TRIP_CENTERS[i % len(TRIP_CENTERS)]
+        points.append((lat + rng.uniform(-1, 1), lon + rng.uniform(-1, 1)))
+
+    # Per-lookup INFO lines would dominate the timing
+    logger = logging.getLogger()
+    level = logger.level
+    logger.setLevel(logging.WARNING)
+    try:
+        samples = []
+        for lat, lon in points:
+            start = time.perf_counter()
+            extractor.get_geo_from_coordinates(lat, lon)
+            samples.append(time.perf_counter() - start)
+    finally:
+        logger.setLevel(level)
+
+    metrics = {'geocode.load_s': round(load, 4)}
+    metrics.update({f"geocode.lookup.{key}": value for key, value in summarize(samples).items()})
+    return metrics
+
+
+def bench_web(workdir, repeat):
+    """Time the main web API endpoints through the Flask test client"""
+    os.environ['MEDIA_DB_PATH'] = os.path.join(workdir, 'media_organizer.db')
+    os.environ['RENDITION_CACHE_DIR'] = os.path.join(workdir, 'rendition_cache')
+    sys.path.insert(0, WEB_DIR)
+    from src.main import app
+
+    client = app.test_client()
+    media = client.get('/api/media').get_json() or []
+    if not media:
+        logging.warning("The benchmark database has no media, skipping the web API benchmark.")
+        return {}
+    first = media[0]
+    located = next((m for m in media if m.get('latitude') is not None), first)
+    city = located.get('city_en') or ''
+    lat, lon = located.get('latitude') or 0, located.get('longitude') or 0
+
+    endpoints = [
+        ('media_all', '/api/media'),
+        ('media_city', f"/api/media?city={city}"),
+        ('media_date_range', '/api/media?date_from=2024-05-01&date_to=2024-05-15'),
+        ('media_one', f"/api/media/{first['id']}"),
+        ('thumbnail', f"/api/media/{first['id']}/thumbnail"),
+        ('stats', '/api/media/stats'),
+        ('locations', '/api/media/locations'),
+        ('clusters_world', '/api/media/clusters?bbox=-180,-85,180,85&zoom=2'),
+        ('clusters_city', f"/api/media/clusters?bbox={lon - 0.5},{lat - 0.5},{lon + 0.5},{lat + 0.5}&zoom=10"),
+        ('bbox', f"/api/media/bbox?bbox={lon - 0.5},{lat - 0.5},{lon + 0.5},{lat + 0.5}"),
+        ('nearby', f"/api/media/nearby?lat={lat}&lon={lon}&radius_km=20"),
+        ('days', '/api/media/days'),
+        ('cities', '/api/media/cities'),
+        ('countries', '/api/media/countries'),
+    ]
+    metrics = {}
+    for name, url in endpoints:
+        samples = []
+        status = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url)
+            response.get_data()
+            samples.append(time.perf_counter() - start)
+            status = response.status_code
+        if status != 200:
+            logging.warning(f"Web endpoint {url} returned {status}")
+        metrics.update({f"web.{name}.{key}": value for key, value in summarize(samples).items()})
+    return metrics
+
+
+# ==================================================================================
+# Results
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SCRIPT_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=SCRIPT_DIR,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+
+
+def compare_results(old_path, new_path, threshold=5.0):
+    """Print the metrics of two result files side by side with the relative change"""
+    with open(old_path, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(new_path, encoding='utf-8') as f:
+        new = json.load(f)
+    print(f"\n{'metric':<52}{old['commit']:>14}{new['commit']:>14}{'change':>10}")
+    for metric in sorted(set(old['metrics']) | set(new['metrics'])):
+        old_value = old['metrics'].get(metric)
+        new_value = new['metrics'].get(metric)
+        change = ''
+        if old_value and new_value is not None:
+            percent = (new_value - old_value) / old_value * 100
+            change = f"{percent:+.1f}%" + (' !' if percent > threshold else '')
+        print(f"{metric:<52}{'' if old_value is None else old_value:>14}{'' if new_value is None else new_value:>14}{change:>10}")
+    if old.get('corpus', {}).get('config') != new.get('corpus', {}).get('config'):
+        print("\nWARNING: the two runs used different corpus configurations.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the media scanner and web API on a synthetic library.")
+    parser.add_argument('--images', type=int, default=500, help='Number of synthetic images (default: 500).')
+    parser.add_argument('--videos', type=int, default=10, help='Number of synthetic MP4 videos (default: 10).')
+    parser.add_argument('--geo-entries', type=int, default=5000, help='Number of geo list entries (default: 5000).')
+    parser.add_argument('--image-size', type=str, default='640x480', help='Image size WxH (default: 640x480).')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed of the corpus (default: 42).')
+    parser.add_argument('--workdir', type=str, default=os.path.join(tempfile.gettempdir(), 'media_bench'),
+                        help='Directory for the corpus and the benchmark database.')
+    parser.add_argument('--regenerate', default=False, action='store_true', help='Generate the corpus again.')
+    parser.add_argument('--geo-lookups', type=int, default=200, help='Reverse geocoding lookups to time (default: 200).')
+    parser.add_argument('--web-repeat', type=int, default=5, help='Calls per web endpoint (default: 5).')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Result file (default: bench_results/<commit>.json).')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files and exit.')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare_results(*args.compare)
+        return
+    if not PIL_AVAILABLE:
+        sys.exit("Pillow is required to generate the benchmark corpus.")
+    if not shutil.which('exifTool'):
+        sys.exit("exifTool was not found in PATH, the scanner cannot extract metadata.")
+
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    media_dir, geo_list, corpus = prepare_corpus(workdir, args)
+
+    metrics = {}
+    # From scratch: new database, thumbnails removed first
+    metrics.update(run_scan(workdir, media_dir, geo_list, 'full', ['--deldb', '--cleanup_thumbnails']))
+    # Nothing changed: incremental sync of file system and database
+    metrics.update(run_scan(workdir, media_dir, geo_list, 'incremental', ['--syncFSnDB']))
+    metrics.update(bench_geocoding(geo_list, args.geo_lookups, args.seed))
+    metrics.update(bench_web(workdir, args.web_repeat))
+
+    commit, dirty = git_revision()
+    results = {
+        'commit': commit + ('-dirty' if dirty else ''),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'corpus': corpus,
+        'metrics': metrics,
+    }
+    output = args.output or os.path.join('bench_results', f"{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    for metric, value in metrics.items():
+        print(f"  {metric:<52}{value:>12}")
+    logging.info(f"Benchmark results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Content hashing for duplicate detection.
+
+A partial hash covers the file size plus the first and last HASH_CHUNK_SIZE bytes, which is two
+small reads per file and enough to tell almost all different media files apart. Only files whose
+partial hashes collide are read completely (full_hash) to confirm that they are byte-identical.
+hashlib releases the GIL on large buffers, so hashing runs well in a thread pool.
+"""
+
+import hashlib
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+HASH_CHUNK_SIZE = 64 * 1024
+FULL_HASH_READ_SIZE = 4 * 1024 * 1024
+
+
+def partial_hash(filepath):
+    """blake2b over size, head and tail of the file. Returns None if the file cannot be read."""
+    try:
+        with open(filepath, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+            digest.update(f.read(HASH_CHUNK_SIZE))
+            if size > HASH_CHUNK_SIZE:
+                f.seek(max(size - HASH_CHUNK_SIZE, HASH_CHUNK_SIZE))
+                digest.update(f.read(HASH_CHUNK_SIZE))
+        return digest.hexdigest()
+    except OSError as e:
+        logging.warning(f"Cannot hash {filepath}: {e}")
+        return None
+
+
+def full_hash(filepath):
+    """Streaming blake2b of the whole file with large reads. Returns None if the file cannot be read."""
+    try:
+        digest = hashlib.blake2b(digest_size=16)
+        buffer = bytearray(FULL_HASH_READ_SIZE)
+        view = memoryview(buffer)
+        with open(filepath, 'rb', buffering=0) as f:
+            while True:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                digest.update(view[:count])
+        return digest.hexdigest()
+    except OSError as e:
+        logging.warning(f"Cannot hash {filepath}: {e}")
+        return None
+
+
+def hash_files(filepaths, hash_function=partial_hash, workers=4):
+    """Hash files in parallel, returns {filepath: hash or None}"""
+    filepaths = list(filepaths)
+    if len(filepaths) <= 1:
+        return {path: hash_function(path) for path in filepaths}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hash') as executor:
+        return dict(zip(filepaths, executor.map(hash_function, filepaths)))
@@ -0,0 +1,467 @@
+"""
+Native EXIF reader for the fields the scanner uses: GPS latitude/longitude, CreateDate and the
+technical fields (image size, orientation, camera make and model).
+
+MetadataExtractor normally runs ExifTool (a Perl process per file) and parses its full JSON dump.
+For the common photo layouts this module reads the EXIF block directly with a few bounded reads:
+
+  * JPEG: the marker segments are walked from the start of the file (seeking over the segment
+    payloads) through the APP1 "Exif" segment, whose TIFF structure holds the IFDs, up to the
+    SOF segment with the image size;
+  * HEIC/HEIF: the top-level `meta` box is read, the Exif item is looked up in `iinf` and
+    located through `iloc`, and only that item is read from the file. The image size is the
+    `ispe` property of the primary item.
+
+read_exif() returns the same fields as MetadataExtractor._run_exiftool with `exiftool -n`, or None
+when the layout is not understood (no EXIF, no CreateDate, other file types, corrupt data). In that
+case the caller falls back to ExifTool, so the fast path never loses information.
+
+Check the reader (and video_reader for MP4/MOV) against ExifTool on a media folder with:
+    python exif_reader.py --compare /path/to/media
+"""
+
+import logging
+import os
+import struct
+
+# Upper bounds of the bytes read per file
+JPEG_MAX_SCAN = 512 * 1024        # JPEG headers (APP0/APP2 ICC profiles) before the Exif segment
+EXIF_MAX_SIZE = 256 * 1024        # EXIF block (APP1 segments are at most 64 KiB)
+HEIF_MAX_META = 1024 * 1024       # HEIF 'meta' box
+
+TAG_MAKE, TAG_MODEL, TAG_ORIENTATION = 0x010F, 0x0110, 0x0112
+TAG_EXIF_IFD = 0x8769
+TAG_GPS_IFD = 0x8825
+TAG_CREATE_DATE = 0x9004          # DateTimeDigitized, reported as CreateDate by ExifTool
+TAG_EXIF_IMAGE_WIDTH, TAG_EXIF_IMAGE_HEIGHT = 0xA002, 0xA003
+GPS_LATITUDE_REF, GPS_LATITUDE, GPS_LONGITUDE_REF, GPS_LONGITUDE = 1, 2, 3, 4
+
+# TIFF field type: (struct format character, size in bytes)
+TIFF_TYPES = {
+    1: ('B', 1), 2: ('s', 1), 3: ('H', 2), 4: ('L', 4), 5: ('L', 8),
+    7: ('B', 1), 9: ('l', 4), 10: ('l', 8),
+}
+
+HEIF_BRANDS = {b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1', b'avif'}
+
+
+class _UnknownLayout(Exception):
+    pass
+
+
+# ==================================================================================
+# TIFF / EXIF
+
+def _read_ifd(tiff, offset, endian):
+    """Return {tag: (type, count, value bytes)} of the IFD at offset"""
+    if offset + 2 > len(tiff):
+        raise _UnknownLayout("IFD offset out of range")
+    count = struct.unpack_from(endian + 'H', tiff, offset)[0]
+    entries = {}
+    for i in range(count):
+        entry = offset + 2 + i * 12
+        if entry + 12 > len(tiff):
+            break
+        tag, field_type, value_count = struct.unpack_from(endian + 'HHL', tiff, entry)
+        if field_type not in TIFF_TYPES:
+            continue
+        size = TIFF_TYPES[field_type][1] * value_count
+        if size <= 4:
+            data = tiff[entry + 8:entry + 8 + size]
+        else:
+            value_offset = struct.unpack_from(endian + 'L', tiff, entry + 8)[0]
+            if value_offset + size > len(tiff):
+                continue
+            data = tiff[value_offset:value_offset + size]
+        entries[tag] = (field_type, value_count, data)
+    return entries
+
+
+def _ascii(entry):
+    return entry[2].split(b'\0', 1)[0].decode('ascii', 'replace').strip() if entry and entry[0] == 2 else None
+
+
+def _long(entry, endian):
+    if not entry or entry[0] not in (3, 4):
+        return None
+    return struct.unpack_from(endian + ('H' if entry[0] == 3 else 'L'), entry[2])[0]
+
+
+def _rationals(entry, endian):
+    if not entry or entry[0] not in (5, 10):
+        return None
+    values = struct.unpack(endian + ('L' if entry[0] == 5 else 'l') * (2 * entry[1]), entry[2])
+    return [numerator / denominator if denominator else 0.0
+            for numerator, denominator in zip(values[::2], values[1::2])]
+
+
+def _gps_coordinate(value, ref, negative_ref):
+    if not value:
+        return None
+    degrees = value[0] + (value[1] / 60 if len(value) > 1 else 0) + (value[2] / 3600 if len(value) > 2 else 0)
+    return -degrees if ref and ref.upper().startswith(negative_ref) else degrees
+
+
+def parse_tiff(tiff):
+    """
+    Return {'CreateDate', 'Latitude', 'Longitude', 'Make', 'Model', 'Orientation', 'ExifImageWidth',
+    'ExifImageHeight'} from a TIFF-structured EXIF block, missing fields are None
+    """
+    if tiff[:2] == b'II':
+        endian = '<'
+    elif tiff[:2] == b'MM':
+        endian = '>'
+    else:
+        raise _UnknownLayout("no TIFF header")
+    if struct.unpack_from(endian + 'H', tiff, 2)[0] != 42:
+        raise _UnknownLayout("bad TIFF magic")
+
+    ifd0 = _read_ifd(tiff, struct.unpack_from(endian + 'L', tiff, 4)[0], endian)
+
+    fields = {
+        'CreateDate': None,
+        'Make': _ascii(ifd0.get(TAG_MAKE)) or None,
+        'Model': _ascii(ifd0.get(TAG_MODEL)) or None,
+        'Orientation': _long(ifd0.get(TAG_ORIENTATION), endian),
+        'ExifImageWidth': None,
+        'ExifImageHeight': None,
+    }
+    exif_offset = _long(ifd0.get(TAG_EXIF_IFD), endian)
+    if exif_offset:
+        exif = _read_ifd(tiff, exif_offset, endian)
+        fields['CreateDate'] = _ascii(exif.get(TAG_CREATE_DATE))
+        fields['ExifImageWidth'] = _long(exif.get(TAG_EXIF_IMAGE_WIDTH), endian)
+        fields['ExifImageHeight'] = _long(exif.get(TAG_EXIF_IMAGE_HEIGHT), endian)
+
+    latitude = longitude = None
+    gps_offset = _long(ifd0.get(TAG_GPS_IFD), endian)
+    if gps_offset:
+        gps = _read_ifd(tiff, gps_offset, endian)
+        latitude = _gps_coordinate(_rationals(gps.get(GPS_LATITUDE), endian),
+                                   _ascii(gps.get(GPS_LATITUDE_REF)), 'S')
+        longitude = _gps_coordinate(_rationals(gps.get(GPS_LONGITUDE), endian),
+                                    _ascii(gps.get(GPS_LONGITUDE_REF)), 'W')
+        if latitude is None or longitude is None:
+            latitude = longitude = None
+    fields['Latitude'] = latitude
+    fields['Longitude'] = longitude
+    return fields
+
+
+# ==================================================================================
+# JPEG
+
+def _jpeg_exif(f):
+    """Return (TIFF block of the first APP1 Exif segment, (width, height) from the SOF segment or None)"""
+    if f.read(2) != b'\xff\xd8':
+        raise _UnknownLayout("not a JPEG")
+    tiff = None
+    while f.tell() < JPEG_MAX_SCAN:
+        header = f.read(4)
+        if len(header) < 4 or header[0] != 0xFF:
+            raise _UnknownLayout("bad JPEG marker")
+        marker = header[1]
+        if marker == 0xFF:                      # fill byte
+            f.seek(-3, os.SEEK_CUR)
+            continue
+        if marker in (0xDA, 0xD9):              # start of scan / end of image: no SOF in the header
+            break
+        length = struct.unpack('>H', header[2:])[0]
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            # Start of frame: sample precision, height, width
+            frame = f.read(5)
+            if tiff is None:
+                raise _UnknownLayout("no Exif segment before the image data")
+            height, width = struct.unpack_from('>HH', frame, 1)
+            return tiff, (width, height)
+        if marker == 0xE1 and length > 8 and tiff is None:
+            payload = f.read(min(length - 2, EXIF_MAX_SIZE))
+            if payload[:6] == b'Exif\0\0':
+                tiff = payload[6:]
+        else:
+            f.seek(length - 2, os.SEEK_CUR)
+    if tiff is None:
+        raise _UnknownLayout("Exif segment not found in the JPEG header")
+    return tiff, None
+
+
+# ==================================================================================
+# ISO base media file format (HEIF here, MP4/MOV video in video_reader.py)
+
+def iter_boxes(data, start=0, end=None):
+    """Yield (type, payload start, box end) of the boxes in data[start:end]"""
+    end = len(data) if end is None else end
+    offset = start
+    while offset + 8 <= end:
+        size, box_type = struct.unpack_from('>L4s', data, offset)
+        header = 8
+        if size == 1:
+            if offset + 16 > end:
+                return
+            size = struct.unpack_from('>Q', data, offset + 8)[0]
+            header = 16
+        elif size == 0:
+            size = end - offset
+        if size < header:
+            return
+        yield box_type, offset + header, min(offset + size, end)
+        offset += size
+
+
+def read_box_header(f):
+    """Read a box header at the file position: (type, payload size, header size) or None at EOF"""
+    header = f.read(8)
+    if len(header) < 8:
+        return None
+    size, box_type = struct.unpack('>L4s', header)
+    header_size = 8
+    if size == 1:
+        large = f.read(8)
+        if len(large) < 8:
+            return None
+        size = struct.unpack('>Q', large)[0]
+        header_size = 16
+    elif size == 0:
+        position = f.tell()
+        size = f.seek(0, os.SEEK_END) - position + header_size
+        f.seek(position)
+    return box_type, size - header_size, header_size
+
+
+def _heif_exif(f):
+    """
+    Find the Exif item through meta/iinf and meta/iloc, return (its TIFF block, (width, height) of the
+    primary item or None)
+    """
+    ftyp = read_box_header(f)
+    if not ftyp or ftyp[0] != b'ftyp':
+        raise _UnknownLayout("not an ISO-BMFF file")
+    brands = f.read(min(ftyp[1], 64))
+    compatible = {brands[i:i + 4] for i in range(8, len(brands) - 3, 4)} | {brands[:4]}
+    if not compatible & HEIF_BRANDS:
+        raise _UnknownLayout("not a HEIF image")
+
+    meta = None
+    while meta is None:
+        box = read_box_header(f)
+        if not box:
+            raise _UnknownLayout("no meta box")
+        box_type, size, _ = box
+        if box_type == b'meta':
+            if size > HEIF_MAX_META:
+                raise _UnknownLayout("meta box too large")
+            meta = f.read(size)
+        else:
+            f.seek(size, os.SEEK_CUR)
+
+    exif_ids = set()
+    locations = {}
+    primary_id = None
+    properties = []         # ipco children, ipma refers to them by index (1-based)
+    associations = {}       # {item_id: [property index]}
+    for box_type, start, end in iter_boxes(meta, 4):           # meta is a full box
+        if box_type == b'iinf':
+            version = meta[start]
+            first = start + (6 if version == 0 else 8)
+            for entry_type, entry_start, _ in iter_boxes(meta, first, end):
+                if entry_type != b'infe' or meta[entry_start] < 2:
+                    continue
+                if meta[entry_start] == 2:
+                    item_id = struct.unpack_from('>H', meta, entry_start + 4)[0]
+                    item_type = meta[entry_start + 8:entry_start + 12]
+                else:
+                    item_id = struct.unpack_from('>L', meta, entry_start + 4)[0]
+                    item_type = meta[entry_start + 10:entry_start + 14]
+                if item_type == b'Exif':
+                    exif_ids.add(item_id)
+        elif box_type == b'iloc':
+            locations = _parse_iloc(meta, start)
+        elif box_type == b'pitm':
+            primary_id = struct.unpack_from('>H' if meta[start] == 0 else '>L', meta, start + 4)[0]
+        elif box_type == b'iprp':
+            for child_type, child_start, child_end in iter_boxes(meta, start, end):
+                if child_type == b'ipco':
+                    properties = list(iter_boxes(meta, child_start, child_end))
+                elif child_type == b'ipma':
+                    associations.update(_parse_ipma(meta, child_start))
+
+    size = None
+    for index in associations.get(primary_id, ()):
+        if 0 < index <= len(properties) and properties[index - 1][0] == b'ispe':
+            # ispe is a full box: version/flags, width, height
+            size = struct.unpack_from('>LL', meta, properties[index - 1][1] + 4)
+            break
+
+    for item_id in exif_ids:
+        extents = locations.get(item_id)
+        if not extents or len(extents) != 1:
+            continue
+        offset, length = extents[0]
+        f.seek(offset)
+        item = f.read(min(length, EXIF_MAX_SIZE))
+        if len(item) < 4:
+            continue
+        # The item starts with the offset of the TIFF header, usually after 'Exif\0\0'
+        tiff_start = 4 + struct.unpack_from('>L', item)[0]
+        return item[tiff_start:], size
+    raise _UnknownLayout("no Exif item")
+
+
+def _parse_ipma(meta, start):
+    """Return {item_id: [property index]} of an item property association box"""
+    version = meta[start]
+    flags = int.from_bytes(meta[start + 1:start + 4], 'big')
+    entry_count = struct.unpack_from('>L', meta, start + 4)[0]
+    offset = start + 8
+    associations = {}
+    for _ in range(entry_count):
+        if version < 1:
+            item_id = struct.unpack_from('>H', meta, offset)[0]
+            offset += 2
+        else:
+            item_id = struct.unpack_from('>L', meta, offset)[0]
+            offset += 4
+        count = meta[offset]
+        offset += 1
+        indexes = []
+        for _ in range(count):
+            # The top bit marks essential properties
+            if flags & 1:
+                indexes.append(struct.unpack_from('>H', meta, offset)[0] & 0x7FFF)
+                offset += 2
+            else:
+                indexes.append(meta[offset] & 0x7F)
+                offset += 1
+        associations[item_id] = indexes
+    return associations
+
+
+def _parse_iloc(meta, start):
+    """Return {item_id: [(file offset, length)]} for items stored in the file (construction method 0)"""
+    version = meta[start]
+    offset = start + 4
+    sizes = struct.unpack_from('>H', meta, offset)[0]
+    offset_size, length_size = sizes >> 12, (sizes >> 8) & 0xF
+    base_offset_size, index_size = (sizes >> 4) & 0xF, sizes & 0xF if version in (1, 2) else 0
+    offset += 2
+    if version < 2:
+        item_count = struct.unpack_from('>H', meta, offset)[0]
+        offset += 2
+    else:
+        item_count = struct.unpack_from('>L', meta, offset)[0]
+        offset += 4
+
+    def read_uint(size):
+        nonlocal offset
+        if size == 0:
+            return 0
+        value = int.from_bytes(meta[offset:offset + size], 'big')
+        offset += size
+        return value
+
+    locations = {}
+    for _ in range(item_count):
+        item_id = read_uint(2 if version < 2 else 4)
+        construction_method = read_uint(2) & 0xF if version in (1, 2) else 0
+        read_uint(2)                                            # data_reference_index
+        base_offset = read_uint(base_offset_size)
+        extent_count = read_uint(2)
+        extents = []
+        for _ in range(extent_count):
+            read_uint(index_size)
+            extent_offset = read_uint(offset_size)
+            extent_length = read_uint(length_size)
+            extents.append((base_offset + extent_offset, extent_length))
+        if construction_method == 0:
+            locations[item_id] = extents
+    return locations
+
+
+# ==================================================================================
+
+def read_exif(filepath):
+    """
+    Return {'Latitude', 'Longitude', 'CreateDate', 'ImageWidth', 'ImageHeight', 'Orientation', 'Make',
+    'Model'} like `exiftool -n` for JPEG and HEIC files, or None if the file has to be read by ExifTool.
+    """
+    extension = os.path.splitext(filepath)[1].lower()
+    if extension not in ('.jpg', '.jpeg', '.heic', '.heif'):
+        return None
+    try:
+        with open(filepath, 'rb') as f:
+            tiff, size = _jpeg_exif(f) if extension in ('.jpg', '.jpeg') else _heif_exif(f)
+        fields = parse_tiff(tiff)
+    except (_UnknownLayout, struct.error, IndexError, ValueError, OSError) as e:
+        logging.debug("Native EXIF reader falls back to ExifTool for %s: %s", filepath, e)
+        return None
+    if not fields['CreateDate']:
+        return None
+    width, height = size or (fields['ExifImageWidth'], fields['ExifImageHeight'])
+    return {
+        'Latitude': fields['Latitude'],
+        'Longitude': fields['Longitude'],
+        'CreateDate': fields['CreateDate'],
+        'ImageWidth': width,
+        'ImageHeight': height,
+        'Orientation': fields['Orientation'],
+        'Make': fields['Make'],
+        'Model': fields['Model'],
+    }
+
+
+def compare_with_exiftool(paths, tolerance=1e-6):
+    """Read every file with both readers and print the differences, returns the number of mismatches"""
+    from metadata_extractor import MetadataExtractor, technical_metadata
+    from video_reader import read_video_metadata
+
+    extractor = MetadataExtractor(geo_list_path='')
+    native_count = mismatches = 0
+    for path in paths:
+        native = read_exif(path) or read_video_metadata(path)
+        if native is None:
+            continue
+        native_count += 1
+        reference = extractor._run_exiftool(path)
+        if not reference:
+            print(f"ExifTool failed, native reader did not: {path}")
+            mismatches += 1
+            continue
+        expected_date = reference['CreateDate']
+        native_date = native['CreateDate'].replace(':', '-', 2)
+        differences = []
+        if expected_date != native_date:
+            differences.append(f"CreateDate {expected_date!r} != {native_date!r}")
+        for field in ('Latitude', 'Longitude'):
+            expected, value = reference[field], native[field]
+            if (expected is None) != (value is None) or (
+                    expected is not None and abs(float(expected) - value) > tolerance):
+                differences.append(f"{field} {expected!r} != {value!r}")
+        # Technical fields are compared where ExifTool reports them
+        expected_technical = technical_metadata(reference)
+        for field, value in technical_metadata(native).items():
+            expected = expected_technical[field]
+            if expected is None:
+                continue
+            if isinstance(expected, float) and value is not None:
+                # ExifTool rounds the frame rate and duration
+                same = abs(expected - value) <= max(tolerance, abs(expected) * 1e-3)
+            else:
+                same = expected == value
+            if not same:
+                differences.append(f"{field} {expected!r} != {value!r}")
+        if differences:
+            mismatches += 1
+            print(f"{path}: {'; '.join(differences)}")
+    print(f"{native_count} files read natively, {mismatches} differ from ExifTool.")
+    return mismatches
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+    from media_walker import DirectoryWalker
+
+    parser = argparse.ArgumentParser(description="Compare the native EXIF reader with ExifTool.")
+    parser.add_argument('--compare', required=True, help='Directory with JPEG/HEIC/MP4/MOV files.')
+    args = parser.parse_args()
+    sys.exit(1 if compare_with_exiftool(DirectoryWalker(args.compare, workers=4)) else 0)
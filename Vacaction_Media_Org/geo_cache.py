@@ -0,0 +1,102 @@
+"""
+Memo of reverse geocoding results keyed by quantized coordinates.
+
+Photos of one spot have nearly identical coordinates, so MetadataExtractor looks up the nearest
+geo-list place once per grid cell (GEO_CACHE_GRID degrees, about 110 m for 1e-3) instead of once per
+file. GeoCache has two levels:
+
+  * an in-process LRU of the most recently used cells;
+  * the geo_cache table of the scanner database (created by MediaOrganizerDB), so repeated and
+    incremental scans start warm. New cells are written on the scanner's connection and committed
+    with its next commit.
+
+Every entry is stamped with the version of the geo list (a hash of its content) and the grid size.
+attach() deletes the entries with another stamp, so editing geo_chinese_.list or changing the grid
+invalidates the cache automatically.
+"""
+
+import json
+import logging
+import sqlite3
+from collections import OrderedDict
+
+GEO_CACHE_GRID = 1e-3
+GEO_CACHE_LRU_SIZE = 4096
+
+
+class GeoCache:
+    def __init__(self, version, grid=GEO_CACHE_GRID, lru_size=GEO_CACHE_LRU_SIZE):
+        self.grid = grid
+        self.stamp = f"{version}:{grid:g}"
+        self.lru_size = lru_size
+        self.conn = None
+        self.hits = self.stored_hits = self.misses = 0
+        self._lru = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.grid > 0
+
+    def key(self, latitude, longitude):
+        return round(latitude / self.grid), round(longitude / self.grid)
+
+    def attach(self, conn):
+        """Persist the cache in the geo_cache table of conn, dropping the entries of other geo lists / grids"""
+        if not self.enabled:
+            return
+        try:
+            cursor = conn.execute('DELETE FROM geo_cache WHERE stamp != ?', (self.stamp,))
+            if cursor.rowcount:
+                logging.info(f"Geo list or cache grid changed, dropped {cursor.rowcount} cached geo lookups.")
+            conn.commit()
+            self.conn = conn
+        except sqlite3.Error as e:
+            logging.error(f"Geo cache table not available, lookups are cached in memory only: {e}")
+
+    def get(self, latitude, longitude):
+        """Return the cached place (geo-list row) of the cell of the coordinates, or None"""
+        if not self.enabled:
+            return None
+        key = self.key(latitude, longitude)
+        place = self._lru.get(key)
+        if place is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return place
+        if self.conn is not None:
+            try:
+                row = self.conn.execute('SELECT place FROM geo_cache WHERE lat_key = ? AND lon_key = ? AND stamp = ?',
+                                        (key[0], key[1], self.stamp)).fetchone()
+            except sqlite3.Error as e:
+                logging.debug("Geo cache read failed: %s", e)
+                row = None
+            if row:
+                place = tuple(json.loads(row[0]))
+                self._remember(key, place)
+                self.stored_hits += 1
+                return place
+        self.misses += 1
+        return None
+
+    def put(self, latitude, longitude, place):
+        if not self.enabled:
+            return
+        key = self.key(latitude, longitude)
+        self._remember(key, place)
+        if self.conn is not None:
+            try:
+                self.conn.execute('INSERT OR REPLACE INTO geo_cache (lat_key, lon_key, stamp, place) VALUES (?, ?, ?, ?)',
+                                  (key[0], key[1], self.stamp, json.dumps(place, ensure_ascii=False)))
+            except sqlite3.Error as e:
+                logging.debug("Geo cache write failed: %s", e)
+
+    def _remember(self, key, place):
+        self._lru[key] = place
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def summary(self):
+        lookups = self.hits + self.stored_hits + self.misses
+        return (f"{lookups} geo lookups: {self.hits} from memory, {self.stored_hits} from the database, "
+                f"{self.misses} searched")
@@ -0,0 +1,244 @@
+"""
+Sharded geo list for reverse geocoding with bounded memory.
+
+The geo list (geo_chinese_.list, or a planet-scale GeoNames export in the same CSV layout) is split
+once into grid-cell shards of SHARD_DEGREES x SHARD_DEGREES degrees, written next to the list in
+<name>.shards/ together with index.json: the bounding box and entry count of every shard plus the
+size, mtime and content hash of the list the shards were built from. The index is rebuilt
+automatically when the list changes.
+
+A nearest-place lookup visits the shards in order of the smallest possible distance between the
+point and the shard's bounding box and stops as soon as no unvisited shard can hold a closer place,
+so the result is the same as a search of the whole list. Shards are loaded on first use and keep only
+the raw CSV lines plus the coordinates as double arrays; a line is split into its 12 fields only when
+it is the answer. Loaded shards are evicted least recently used first when they exceed the memory cap.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+from array import array
+from collections import OrderedDict
+
+SHARD_DEGREES = 10
+GEO_MEMORY_MB = 256
+INDEX_NAME = 'index.json'
+INDEX_FORMAT = 1
+EARTH_RADIUS_KM = 6371
+# Lines buffered per shard while the shards are written
+BUILD_BUFFER_LINES = 10000
+
+# Geo list columns:
+#  0:City_en,1:City_zn,2:Region_en,3:Region_zn,4:Subregion_en,5:Subregion_zn,6:CountryCode,7:Country_en,8:Country_zn,9:TimeZone,10:Latitude,11:Longitude
+
+
+def parse_geo_line(line):
+    """
+    Return the geo list line as (lat, lon, city_en, city_zn, region_en, region_zn, subregion_en,
+    subregion_zn, country_code, country_en, country_zn, timezone), raises ValueError / IndexError
+    """
+    parts = line.strip().split(',')
+    return (float(parts[10]), float(parts[11]), parts[0], parts[1], parts[2], parts[3], parts[4], parts[5],
+            parts[6], parts[7], parts[8], parts[9])
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two coordinates"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def min_distance_km(lat, lon, bbox):
+    """
+    Lower bound of the great-circle distance between a point and any point of a lat/lon bounding box.
+    With a the smallest longitude difference to the box, cos(d) <= sin(lat)sin(lat2) + cos(lat)cos(lat2)cos(a)
+    for every lat2 of the box; the right side is maximized over the box's latitude range.
+    """
+    min_lat, min_lon, max_lat, max_lon = bbox
+    if min_lon <= lon <= max_lon:
+        a = 0.0
+    else:
+        a = min(abs((lon - edge + 180) % 360 - 180) for edge in (min_lon, max_lon))
+    phi = math.radians(lat)
+    sin_part = math.sin(phi)
+    cos_part = math.cos(phi) * math.cos(math.radians(a))
+    # sin_part*sin(x) + cos_part*cos(x) peaks at x = atan2(sin_part, cos_part)
+    peak = min(max(math.atan2(sin_part, cos_part), math.radians(min_lat)), math.radians(max_lat))
+    cosine = sin_part * math.sin(peak) + cos_part * math.cos(peak)
+    return EARTH_RADIUS_KM * math.acos(min(1.0, max(-1.0, cosine)))
+
+
+class _Shard:
+    __slots__ = ('lines', 'lats', 'lons', 'size')
+
+    def __init__(self, path):
+        with open(path, 'r', encoding='utf-8') as f:
+            self.lines = f.read().splitlines()
+        self.lats = array('d')
+        self.lons = array('d')
+        for line in self.lines:
+            parts = line.split(',')
+            self.lats.append(float(parts[10]))
+            self.lons.append(float(parts[11]))
+        self.size = (sys.getsizeof(self.lines) + sum(sys.getsizeof(line) for line in self.lines)
+                     + self.lats.itemsize * len(self.lats) * 2)
+
+
+class GeoShards:
+    def __init__(self, geo_list_path, memory_mb=GEO_MEMORY_MB, shard_degrees=SHARD_DEGREES):
+        self.geo_list_path = geo_list_path
+        self.shard_degrees = shard_degrees
+        self.memory_limit = memory_mb * 1024 * 1024
+        self.shard_dir = os.path.splitext(geo_list_path)[0] + '.shards'
+        self.loads = self.evictions = 0
+        self._loaded = OrderedDict()        # {shard name: _Shard}, least recently used first
+        self._loaded_bytes = 0
+        self.index = self._open_index()
+        # Content hash of the geo list, stamps the cached lookups (geo_cache.py)
+        self.version = self.index['version']
+        self.count = sum(shard['count'] for shard in self.index['shards'].values())
+
+    def _read_index(self, shard_dir):
+        try:
+            with open(os.path.join(shard_dir, INDEX_NAME), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _open_index(self):
+        stat = os.stat(self.geo_list_path)
+        for shard_dir in (self.shard_dir, self._fallback_dir()):
+            index = self._read_index(shard_dir)
+            if (index and index.get('format') == INDEX_FORMAT and index.get('size') == stat.st_size
+                    and index.get('mtime_ns') == stat.st_mtime_ns and index.get('shard_degrees') == self.shard_degrees):
+                self.shard_dir = shard_dir
+                return index
+        try:
+            return self._build(stat, self.shard_dir)
+        except OSError as e:
+            # Read-only folder of the geo list
+            logging.warning(f"Cannot write geo shards to {self.shard_dir} ({e}), using {self._fallback_dir()}")
+            self.shard_dir = self._fallback_dir()
+            return self._build(stat, self.shard_dir)
+
+    def _fallback_dir(self):
+        path_hash = hashlib.blake2b(os.path.abspath(self.geo_list_path).encode('utf-8'), digest_size=8).hexdigest()
+        return os.path.join(tempfile.gettempdir(), 'geo_shards', path_hash)
+
+    def _build(self, stat, shard_dir):
+        """Stream the geo list into shard files, only BUILD_BUFFER_LINES lines per shard are held in memory"""
+        logging.info(f"Building geo shards of {self.geo_list_path} in {shard_dir} ...")
+        building = shard_dir + '.building'
+        shutil.rmtree(building, ignore_errors=True)
+        os.makedirs(building)
+
+        digest = hashlib.blake2b(digest_size=8)
+        shards = {}
+        buffers = {}
+
+        def flush(name):
+            with open(os.path.join(building, name), 'a', encoding='utf-8') as out:
+                out.write('\n'.join(buffers[name]) + '\n')
+            buffers[name] = []
+
+        with open(self.geo_list_path, 'rb') as f:
+            header = f.readline()
+            digest.update(header)
+            for raw in f:
+                digest.update(raw)
+                line = raw.decode('utf-8', 'replace').strip()
+                if not line:
+                    continue
+                try:
+                    lat, lon = parse_geo_line(line)[:2]
+                except (ValueError, IndexError):
+                    logging.error(f"Error parsing line in geo.list: {line}")
+                    continue
+                name = f"{math.floor(lat / self.shard_degrees)}_{math.floor(lon / self.shard_degrees)}.csv"
+                shard = shards.get(name)
+                if shard is None:
+                    shard = shards[name] = {'bbox': [lat, lon, lat, lon], 'count': 0}
+                    buffers[name] = []
+                bbox = shard['bbox']
+                bbox[0], bbox[1] = min(bbox[0], lat), min(bbox[1], lon)
+                bbox[2], bbox[3] = max(bbox[2], lat), max(bbox[3], lon)
+                shard['count'] += 1
+                buffers[name].append(line)
+                if len(buffers[name]) >= BUILD_BUFFER_LINES:
+                    flush(name)
+        for name, lines in buffers.items():
+            if lines:
+                flush(name)
+
+        index = {
+            'format': INDEX_FORMAT,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'shard_degrees': self.shard_degrees,
+            'version': digest.hexdigest(),
+            'shards': shards,
+        }
+        with open(os.path.join(building, INDEX_NAME), 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        shutil.rmtree(shard_dir, ignore_errors=True)
+        os.replace(building, shard_dir)
+        logging.info(f"Built {len(shards)} geo shards with {sum(s['count'] for s in shards.values())} entries.")
+        return index
+
+    def _shard(self, name):
+        shard = self._loaded.get(name)
+        if shard is not None:
+            self._loaded.move_to_end(name)
+            return shard
+        shard = _Shard(os.path.join(self.shard_dir, name))
+        self.loads += 1
+        logging.debug("Loaded geo shard %s (%d entries)", name, len(shard.lines))
+        self._loaded[name] = shard
+        self._loaded_bytes += shard.size
+        # The shard just loaded stays, even if it alone exceeds the cap
+        while self._loaded_bytes > self.memory_limit and len(self._loaded) > 1:
+            _, evicted = self._loaded.popitem(last=False)
+            self._loaded_bytes -= evicted.size
+            self.evictions += 1
+        return shard
+
+    def nearest(self, latitude, longitude):
+        """Return (geo-list row as parsed by parse_geo_line, distance in km) of the closest place, or (None, None)"""
+        candidates = sorted((min_distance_km(latitude, longitude, shard['bbox']), name)
+                            for name, shard in self.index['shards'].items())
+        best_line = None
+        best_distance = math.inf
+        for bound, name in candidates:
+            if bound - 1e-6 > best_distance:        # tolerance for the rounding of the two formulas
+                break
+            shard = self._shard(name)
+            lats, lons = shard.lats, shard.lons
+            for i in range(len(lats)):
+                distance = haversine_km(latitude, longitude, lats[i], lons[i])
+                if distance < best_distance:
+                    best_distance = distance
+                    best_line = shard.lines[i]
+        if best_line is None:
+            return None, None
+        return parse_geo_line(best_line), best_distance
+
+    def iter_rows(self):
+        """Yield every parsed row of the geo list, streamed from the file"""
+        with open(self.geo_list_path, 'r', encoding='utf-8') as f:
+            next(f, None)
+            for line in f:
+                try:
+                    yield parse_geo_line(line)
+                except (ValueError, IndexError):
+                    continue
+
+    def summary(self):
+        return (f"Geo shards: {len(self._loaded)} of {len(self.index['shards'])} resident "
+                f"({self._loaded_bytes / 1024 / 1024:.1f} MB), {self.loads} loads, {self.evictions} evictions")
@@ -6,6 +6,8 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from flask import Flask, send_from_directory
 from src.models.media import db
 from src.routes.media import media_bp
+from src.renditions import RenditionCache
+from src.similarity import SimilarityIndex
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -17,11 +19,22 @@ app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 3600  # Cache files for 1 hour
 app.register_blueprint(media_bp, url_prefix='/api')
 
 # Use the existing database from scan_main.py
-db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'media_organizer.db')
+db_path = os.environ.get(
+    'MEDIA_DB_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'media_organizer.db'))
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{db_path}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db.init_app(app)
 
+# Browser-friendly proxy renditions (720p H.264 / HLS) for videos, generated in the background
+app.config['RENDITION_CACHE_DIR'] = os.environ.get(
+    'RENDITION_CACHE_DIR', os.path.join(os.path.dirname(db_path), 'rendition_cache'))
+app.config['RENDITION_CACHE_MAX_BYTES'] = int(os.environ.get('RENDITION_CACHE_MAX_GB', '20')) * 1024 ** 3
+app.extensions['renditions'] = RenditionCache(
+    app.config['RENDITION_CACHE_DIR'], max_bytes=app.config['RENDITION_CACHE_MAX_BYTES'])
+
+# In-memory BK-tree over the perceptual hashes for /api/media/<id>/similar, rebuilt when media change
+app.extensions['similarity'] = SimilarityIndex()
+
 # Don't create tables here - they should already exist from scan_main.py
 # with app.app_context():
 #     db.create_all()
@@ -3,6 +3,49 @@ from datetime import datetime
 
 db = SQLAlchemy()
 
+# Geo names stored once per place and shared by all media taken there
+PLACE_FIELDS = ('city_en', 'city_zh', 'region_en', 'region_zh', 'subregion_en', 'subregion_zh',
+                'country_code', 'country_en', 'country_zh', 'timezone')
+
+class Place(db.Model):
+    """Geo-list place (city / region / country names), created by Main_scan_media.py"""
+    __tablename__ = 'places'
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    city_en = db.Column(db.String(100), nullable=False, default='')
+    city_zh = db.Column(db.String(100))
+    region_en = db.Column(db.String(100), nullable=False, default='')
+    region_zh = db.Column(db.String(100))
+    subregion_en = db.Column(db.String(100), nullable=False, default='')
+    subregion_zh = db.Column(db.String(100))
+    country_code = db.Column(db.String(10), nullable=False, default='')
+    country_en = db.Column(db.String(100))
+    country_zh = db.Column(db.String(100))
+    timezone = db.Column(db.String(50))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in PLACE_FIELDS}
+
+# Technical metadata stored by the scanner's extraction pass
+TECHNICAL_FIELDS = ('width', 'height', 'orientation', 'duration', 'fps', 'codec', 'make', 'model')
+
+class MediaTechnical(db.Model):
+    """Image / video technical metadata, one row per media file, created by Main_scan_media.py"""
+    __tablename__ = 'media_technical'
+
+    media_id = db.Column(db.Integer, db.ForeignKey('media_files.id'), primary_key=True)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    orientation = db.Column(db.Integer)     # EXIF orientation 1-8, video rotation mapped to it
+    duration = db.Column(db.Float)          # seconds
+    fps = db.Column(db.Float)
+    codec = db.Column(db.String(20))        # video sample entry code (avc1, hvc1, ...)
+    make = db.Column(db.String(100))
+    model = db.Column(db.String(100))
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in TECHNICAL_FIELDS}
+
 class Media(db.Model):
     __tablename__ = 'media_files'
     
@@ -13,25 +56,26 @@ class Media(db.Model):
     file_type = db.Column(db.String(50))
     size = db.Column(db.Integer)
     creation_time = db.Column(db.String(50))
+    creation_ts = db.Column(db.Integer)               # UTC epoch seconds
+    tz_offset = db.Column(db.Integer)                 # UTC offset in seconds, NULL if timezone unknown
     latitude = db.Column(db.Float)
     longitude = db.Column(db.Float)
-    city_en = db.Column(db.String(100))
-    city_zh = db.Column(db.String(100))
-    region_en = db.Column(db.String(100))
-    region_zh = db.Column(db.String(100))
-    subregion_en = db.Column(db.String(100))
-    subregion_zh = db.Column(db.String(100))
-    country_code = db.Column(db.String(10))
-    country_en = db.Column(db.String(100))
-    country_zh = db.Column(db.String(100))
-    timezone = db.Column(db.String(50))
+    place_id = db.Column(db.Integer, db.ForeignKey('places.id'))
+    partial_hash = db.Column(db.String(32), index=True)   # blake2b of size, head and tail
+    content_hash = db.Column(db.String(32), index=True)   # blake2b of the whole file, set where partial hashes collide
+    perceptual_hash = db.Column(db.Integer)               # 64-bit dHash of the thumbnail (signed)
     people_count = db.Column(db.Integer, default=0)
     activities = db.Column(db.Text)  # JSON string
     scenery = db.Column(db.Text)     # JSON string
     talking_detected = db.Column(db.Boolean, default=False)
     scanned_at = db.Column(db.String(50), default=lambda: datetime.utcnow().isoformat())
 
+    place = db.relationship('Place', lazy='joined')
+    technical = db.relationship('MediaTechnical', lazy='joined', uselist=False)
+
     def to_dict(self):
+        place = self.place.to_dict() if self.place else dict.fromkeys(PLACE_FIELDS)
+        technical = self.technical.to_dict() if self.technical else dict.fromkeys(TECHNICAL_FIELDS)
         return {
             'id': self.id,
             'filepath': self.filepath,
@@ -40,21 +84,63 @@ class Media(db.Model):
             'file_type': self.file_type,
             'size': self.size,
             'creation_time': self.creation_time,
+            'creation_ts': self.creation_ts,
+            'tz_offset': self.tz_offset,
             'latitude': self.latitude,
             'longitude': self.longitude,
-            'city_en': self.city_en,
-            'city_zh': self.city_zh,
-            'region_en': self.region_en,
-            'region_zh': self.region_zh,
-            'subregion_en': self.subregion_en,
-            'subregion_zh': self.subregion_zh,
-            'country_code': self.country_code,
-            'country_en': self.country_en,
-            'country_zh': self.country_zh,
-            'timezone': self.timezone,
+            'place_id': self.place_id,
+            **place,
+            'content_hash': self.content_hash,
+            **technical,
             'people_count': self.people_count,
             'activities': self.activities,
             'scenery': self.scenery,
             'talking_detected': self.talking_detected,
             'scanned_at': self.scanned_at
         }
+
+# R*Tree spatial index over media coordinates, maintained by triggers created in Main_scan_media.py
+media_rtree = db.Table(
+    'media_rtree',
+    db.Column('id', db.Integer, primary_key=True),
+    db.Column('min_lat', db.Float),
+    db.Column('max_lat', db.Float),
+    db.Column('min_lon', db.Float),
+    db.Column('max_lon', db.Float),
+)
+
+class GeoCluster(db.Model):
+    """Precomputed map cluster cell, built by Main_scan_media.py (rebuild_geo_clusters)"""
+    __tablename__ = 'geo_clusters'
+
+    zoom = db.Column(db.Integer, primary_key=True)
+    cell_x = db.Column(db.Integer, primary_key=True)
+    cell_y = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+    min_lat = db.Column(db.Float, nullable=False)
+    min_lon = db.Column(db.Float, nullable=False)
+    max_lat = db.Column(db.Float, nullable=False)
+    max_lon = db.Column(db.Float, nullable=False)
+    sample_id = db.Column(db.Integer)
+
+    def to_dict(self):
+        return {
+            'latitude': self.latitude,
+            'longitude': self.longitude,
+            'count': self.count,
+            'bounds': [[self.min_lat, self.min_lon], [self.max_lat, self.max_lon]],
+            'sample_id': self.sample_id
+        }
+
+class DailyCount(db.Model):
+    """Per-day media count by type and place, built by Main_scan_media.py (rebuild_daily_counts)"""
+    __tablename__ = 'daily_counts'
+
+    day = db.Column(db.String(10), primary_key=True)   # YYYY-MM-DD, wall-clock day
+    file_type = db.Column(db.String(50), primary_key=True)
+    place_id = db.Column(db.Integer, db.ForeignKey('places.id'), primary_key=True)  # 0 = no place
+    count = db.Column(db.Integer, nullable=False)
+
+    place = db.relationship('Place', lazy='joined')
@@ -0,0 +1,207 @@
+"""
+Browser-friendly proxy renditions for video playback.
+
+DJI and iPhone originals are usually 4K HEVC, which many browsers cannot decode
+and which is slow to stream over the LAN.  RenditionCache transcodes a video in
+a background worker (ffmpeg) into either a 720p H.264 MP4 or a segmented HLS
+playlist and keeps the results in a size-limited cache directory.  The least
+recently served renditions are evicted first when the cache grows too large.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# ffmpeg output settings for each rendition profile.
+RENDITION_PROFILES = {
+    '720p': {
+        'kind': 'file',
+        'filename': 'proxy_720p.mp4',
+        'mimetype': 'video/mp4',
+        'args': [
+            '-vf', 'scale=-2:\'min(720,ih)\'',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+            '-pix_fmt', 'yuv420p', '-profile:v', 'high',
+            '-c:a', 'aac', '-b:a', '128k', '-ac', '2',
+            '-movflags', '+faststart',
+        ],
+    },
+    'hls': {
+        'kind': 'playlist',
+        'filename': 'index.m3u8',
+        'mimetype': 'application/vnd.apple.mpegurl',
+        'args': [
+            '-vf', 'scale=-2:\'min(720,ih)\'',
+            '-c:v', 'libx264', '-preset', 'veryfast', '-crf', '23',
+            '-pix_fmt', 'yuv420p', '-profile:v', 'high',
+            '-c:a', 'aac', '-b:a', '128k', '-ac', '2',
+            '-f', 'hls', '-hls_time', '6', '-hls_playlist_type', 'vod',
+            '-hls_segment_filename', 'segment_%04d.ts',
+        ],
+    },
+}
+
+DEFAULT_PROFILE = '720p'
+
+# Seconds a failed rendition is reported as failed before the next request runs ffmpeg again
+FAILED_RETRY_SECONDS = 600
+
+# Video codecs every browser plays (H.264)
+BROWSER_CODECS = {'avc1', 'avc3'}
+
+
+def needs_proxy(codec, width, height):
+    """
+    Whether a video with the technical metadata stored by the scanner benefits from the 720p
+    proxy. H.264 videos no larger than the proxy are served as they are; unknown videos get one.
+    """
+    if not codec or not width or not height:
+        return True
+    return codec not in BROWSER_CODECS or min(width, height) > 720
+
+
+class RenditionCache:
+    def __init__(self, cache_dir, max_bytes=20 * 1024 ** 3, workers=1, ffmpeg_path=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.ffmpeg_path = ffmpeg_path or shutil.which('ffmpeg')
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='rendition')
+        self._lock = threading.Lock()
+        self._pending = set()
+        # {(media_id, profile): (entry directory, time.monotonic() of the failure)}, one per video and profile
+        self._failed = {}
+
+        if not self.ffmpeg_path:
+            logging.warning("ffmpeg not found. Proxy renditions are disabled, originals will be served.")
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @property
+    def available(self):
+        return self.ffmpeg_path is not None
+
+    def _entry_dir(self, media_id, source_path, profile):
+        # Size and mtime are part of the key, so a replaced original never gets a stale proxy.
+        stat_info = os.stat(source_path)
+        name = f"{media_id}_{stat_info.st_size}_{int(stat_info.st_mtime)}_{profile}"
+        return os.path.join(self.cache_dir, name)
+
+    def get(self, media_id, source_path, profile=DEFAULT_PROFILE):
+        """Return the path of a finished rendition, or None if it is not cached yet."""
+        if profile not in RENDITION_PROFILES:
+            return None
+        entry_dir = self._entry_dir(media_id, source_path, profile)
+        target = os.path.join(entry_dir, RENDITION_PROFILES[profile]['filename'])
+        if not os.path.exists(target):
+            return None
+        # Touch the entry so that eviction removes the least recently served renditions first.
+        try:
+            os.utime(entry_dir, None)
+        except OSError:
+            pass
+        return target
+
+    def status(self, media_id, source_path, profile=DEFAULT_PROFILE):
+        if profile not in RENDITION_PROFILES:
+            return 'unknown'
+        if not self.available:
+            return 'unavailable'
+        entry_dir = self._entry_dir(media_id, source_path, profile)
+        if os.path.exists(os.path.join(entry_dir, RENDITION_PROFILES[profile]['filename'])):
+            return 'ready'
+        with self._lock:
+            if entry_dir in self._pending:
+                return 'pending'
+            if self._has_failed(media_id, profile, entry_dir):
+                return 'failed'
+        return 'missing'
+
+    def _has_failed(self, media_id, profile, entry_dir):
+        """
+        Whether the rendition failed recently (call with the lock held). The failure is dropped once it
+        is FAILED_RETRY_SECONDS old, or when the source file changed and its entry directory with it.
+        """
+        failure = self._failed.get((media_id, profile))
+        if failure is None:
+            return False
+        failed_dir, failed_at = failure
+        if failed_dir == entry_dir and time.monotonic() - failed_at < FAILED_RETRY_SECONDS:
+            return True
+        del self._failed[(media_id, profile)]
+        return False
+
+    def _mark_failed(self, media_id, profile, entry_dir):
+        with self._lock:
+            self._failed[(media_id, profile)] = (entry_dir, time.monotonic())
+
+    def request(self, media_id, source_path, profile=DEFAULT_PROFILE):
+        """Queue a rendition for background generation. Returns the resulting status."""
+        current = self.status(media_id, source_path, profile)
+        if current != 'missing':
+            return current
+
+        entry_dir = self._entry_dir(media_id, source_path, profile)
+        with self._lock:
+            if entry_dir in self._pending:
+                return 'pending'
+            self._pending.add(entry_dir)
+        self._executor.submit(self._transcode, media_id, source_path, entry_dir, profile)
+        logging.info(f"Queued {profile} rendition for media {media_id}")
+        return 'pending'
+
+    def _transcode(self, media_id, source_path, entry_dir, profile):
+        settings = RENDITION_PROFILES[profile]
+        # Write into a private temp directory and rename it into place when ffmpeg succeeds,
+        # so readers (and other server processes) never see a half-written rendition.
+        tmp_dir = f"{entry_dir}.tmp-{uuid.uuid4().hex[:8]}"
+        try:
+            os.makedirs(tmp_dir, exist_ok=True)
+            cmd = [self.ffmpeg_path, '-v', 'error', '-nostdin', '-y', '-i', source_path] + \
+                settings['args'] + [settings['filename']]
+            result = subprocess.run(cmd, cwd=tmp_dir, capture_output=True, text=True)
+            if result.returncode != 0:
+                logging.error(f"ffmpeg failed to create {profile} rendition for {source_path}: {result.stderr.strip()}")
+                self._mark_failed(media_id, profile, entry_dir)
+                return
+
+            if os.path.exists(entry_dir):
+                shutil.rmtree(entry_dir, ignore_errors=True)
+            os.replace(tmp_dir, entry_dir)
+            logging.info(f"Created {profile} rendition: {entry_dir}")
+            self._enforce_limit()
+        except Exception as e:
+            logging.error(f"Error creating {profile} rendition for {source_path}: {e}")
+            self._mark_failed(media_id, profile, entry_dir)
+        finally:
+            if os.path.exists(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+            with self._lock:
+                self._pending.discard(entry_dir)
+
+    def _enforce_limit(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if not entry.is_dir() or '.tmp-' in entry.name:
+                continue
+            size = 0
+            for root, _, files in os.walk(entry.path):
+                for file in files:
+                    try:
+                        size += os.path.getsize(os.path.join(root, file))
+                    except OSError:
+                        pass
+            entries.append((entry.stat().st_mtime, size, entry.path))
+            total += size
+
+        # Oldest (least recently served) first
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            logging.info(f"Evicted rendition from cache: {path}")
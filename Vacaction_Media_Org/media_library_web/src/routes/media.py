@@ -1,13 +1,112 @@
-from flask import Blueprint, jsonify, request, send_file, Response
-from src.models.media import Media, db
+from flask import Blueprint, jsonify, request, send_file, send_from_directory, Response, current_app, redirect
+from src.models.media import Media, Place, GeoCluster, DailyCount, media_rtree, db
+from src.renditions import RENDITION_PROFILES, DEFAULT_PROFILE, needs_proxy
+from src.similarity import group_bursts
 import json
 import os
 import subprocess
 import platform
 import mimetypes
+import math
+import calendar
+from datetime import datetime, timezone
 
 media_bp = Blueprint('media', __name__)
 
+def media_to_json(media):
+    """Convert a Media record to a dictionary with the JSON list fields parsed"""
+    media_dict = media.to_dict()
+    try:
+        media_dict['activities'] = json.loads(media_dict['activities']) if media_dict['activities'] else []
+    except:
+        media_dict['activities'] = []
+    try:
+        media_dict['scenery'] = json.loads(media_dict['scenery']) if media_dict['scenery'] else []
+    except:
+        media_dict['scenery'] = []
+    return media_dict
+
+# Formats accepted for date_from/date_to, with the number of seconds the value spans
+# (a bare date covers the whole day, so date_to=YYYY-MM-DD includes that day).
+DATE_PARAM_FORMATS = (
+    ('%Y-%m-%d %H:%M:%S', 0),
+    ('%Y-%m-%dT%H:%M:%S', 0),
+    ('%Y-%m-%d %H-%M-%S', 0),
+    ('%Y-%m-%dT%H:%M', 59),
+    ('%Y-%m-%d %H:%M', 59),
+    ('%Y-%m-%d', 86399),
+)
+
+# Largest UTC offsets in use (UTC-12 .. UTC+14), used to bound indexed creation_ts range scans
+MAX_TZ_OFFSET_SECONDS = 14 * 3600
+
+def parse_date_param(value):
+    """Parse a wall-clock date/time query parameter to (start, end) epoch seconds, or raise ValueError"""
+    for fmt, span in DATE_PARAM_FORMATS:
+        try:
+            start = calendar.timegm(datetime.strptime(value, fmt).timetuple())
+            return start, start + span
+        except ValueError:
+            continue
+    raise ValueError(f'Unsupported date format: {value}')
+
+def local_time_filter(date_from=None, date_to=None):
+    """
+    Filter on the media wall-clock time (creation_ts + tz_offset) as integers. The extra
+    creation_ts bounds are widened by the largest timezone offset, so SQLite can narrow the
+    candidates with the creation_ts index before checking the exact wall-clock range.
+    """
+    local_ts = Media.creation_ts + db.func.coalesce(Media.tz_offset, 0)
+    conditions = []
+    if date_from:
+        start = parse_date_param(date_from)[0]
+        conditions += [Media.creation_ts >= start - MAX_TZ_OFFSET_SECONDS, local_ts >= start]
+    if date_to:
+        end = parse_date_param(date_to)[1]
+        conditions += [Media.creation_ts <= end + MAX_TZ_OFFSET_SECONDS, local_ts <= end]
+    return db.and_(*conditions)
+
+def local_time_string(creation_ts, tz_offset):
+    """Wall-clock time of a media file in the 'YYYY-MM-DD HH-MM-SS' format of creation_time"""
+    return datetime.fromtimestamp(creation_ts + (tz_offset or 0), tz=timezone.utc).strftime('%Y-%m-%d %H-%M-%S')
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two coordinates"""
+    dlat = math.radians(lat2 - lat1)
+    dlon = math.radians(lon2 - lon1)
+    a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+    return 6371 * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+def parse_bbox(bbox):
+    """Parse a 'west,south,east,north' bounding box string (Leaflet's toBBoxString order)"""
+    west, south, east, north = (float(v) for v in bbox.split(','))
+    if south > north:
+        raise ValueError('south must not be greater than north')
+    return west, south, east, north
+
+def bbox_longitude_filter_range(min_column, max_column, west, east):
+    """Longitude overlap condition on an indexed [min, max] range, handling the antimeridian"""
+    if east - west >= 360:
+        return db.true()
+    # Normalize into [-180, 180) so that wrapped map views still match stored coordinates
+    west = (west + 180) % 360 - 180
+    east = (east + 180) % 360 - 180
+    if west <= east:
+        return db.and_(max_column >= west, min_column <= east)
+    return db.or_(max_column >= west, min_column <= east)
+
+def bbox_longitude_filter(column, west, east):
+    """Longitude condition for a bounding box, handling boxes that wrap or cross the antimeridian"""
+    return bbox_longitude_filter_range(column, column, west, east)
+
+def rtree_bbox_ids(west, south, east, north):
+    """Subquery of media ids inside a bounding box, answered by the media_rtree spatial index"""
+    return db.select(media_rtree.c.id).where(
+        media_rtree.c.max_lat >= south,
+        media_rtree.c.min_lat <= north,
+        bbox_longitude_filter_range(media_rtree.c.min_lon, media_rtree.c.max_lon, west, east)
+    )
+
 @media_bp.route('/media', methods=['GET'])
 def get_all_media():
     """Get all media records with optional filtering"""
@@ -25,24 +124,22 @@ def get_all_media():
         
         # Apply filters based on new schema
         if city:
-            query = query.filter(db.or_(
-                Media.city_en.ilike(f'%{city}%'),
-                Media.city_zh.ilike(f'%{city}%')
-            ))
+            # Match against the small places table, then select media by place_id
+            query = query.filter(Media.place_id.in_(db.select(Place.id).where(db.or_(
+                Place.city_en.ilike(f'%{city}%'),
+                Place.city_zh.ilike(f'%{city}%')
+            ))))
         if country:
-            query = query.filter(db.or_(
-                Media.country_en.ilike(f'%{country}%'),
-                Media.country_zh.ilike(f'%{country}%')
-            ))
-        if date_from and date_to:
-            # Filter by creation_time range (assuming ISO format)
-            query = query.filter(
-                Media.creation_time.between(date_from, date_to)
-            )
-        elif date_from:
-            query = query.filter(Media.creation_time >= date_from)
-        elif date_to:
-            query = query.filter(Media.creation_time <= date_to)
+            query = query.filter(Media.place_id.in_(db.select(Place.id).where(db.or_(
+                Place.country_en.ilike(f'%{country}%'),
+                Place.country_zh.ilike(f'%{country}%')
+            ))))
+        if date_from or date_to:
+            # Filter by wall-clock time range on the integer epoch columns
+            try:
+                query = query.filter(local_time_filter(date_from, date_to))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
         if has_people == 'true':
             query = query.filter(Media.people_count > 0)
@@ -54,28 +151,16 @@ def get_all_media():
         elif talking == 'false':
             query = query.filter(Media.talking_detected == False)
         
-        # Order by creation_time based on order parameter
+        # Order by creation_ts (indexed) based on order parameter
         if order.lower() == 'asc':
-            query = query.order_by(Media.creation_time.asc())
+            query = query.order_by(Media.creation_ts.asc())
         else:
-            query = query.order_by(Media.creation_time.desc())  # Default DESC (newest first)
+            query = query.order_by(Media.creation_ts.desc())  # Default DESC (newest first)
         
         media_records = query.all()
         
         # Convert to list of dictionaries and parse JSON fields
-        result = []
-        for media in media_records:
-            media_dict = media.to_dict()
-            # Parse JSON strings back to lists
-            try:
-                media_dict['activities'] = json.loads(media_dict['activities']) if media_dict['activities'] else []
-            except:
-                media_dict['activities'] = []
-            try:
-                media_dict['scenery'] = json.loads(media_dict['scenery']) if media_dict['scenery'] else []
-            except:
-                media_dict['scenery'] = []
-            result.append(media_dict)
+        result = [media_to_json(media) for media in media_records]
         
         return jsonify(result)
     except Exception as e:
@@ -86,31 +171,89 @@ def get_media(media_id):
     """Get a specific media record by ID"""
     try:
         media = Media.query.get_or_404(media_id)
-        media_dict = media.to_dict()
-        
-        # Parse JSON strings back to lists
-        try:
-            media_dict['activities'] = json.loads(media_dict['activities']) if media_dict['activities'] else []
-        except:
-            media_dict['activities'] = []
-        try:
-            media_dict['scenery'] = json.loads(media_dict['scenery']) if media_dict['scenery'] else []
-        except:
-            media_dict['scenery'] = []
-        
-        return jsonify(media_dict)
+        return jsonify(media_to_json(media))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def perceptual_hash_stamp():
+    """
+    Changes whenever a perceptual hash is added, removed or rewritten by a rescan. The hashes are
+    summed in three parts of at most 22 bits, so the sums are exact and cannot overflow SQLite integers.
+    """
+    hash_column = Media.perceptual_hash
+    parts = [hash_column.op('>>')(42), hash_column.op('>>')(21).op('&')(0x1FFFFF), hash_column.op('&')(0x1FFFFF)]
+    return tuple(db.session.query(db.func.count(hash_column), db.func.max(Media.id),
+                                  *[db.func.sum(part) for part in parts]).one())
+
+@media_bp.route('/media/<int:media_id>/similar', methods=['GET'])
+def get_similar_media(media_id):
+    """Get media that look like the given one (perceptual hash within a hamming distance), nearest first"""
+    try:
+        media = Media.query.get_or_404(media_id)
+        if media.perceptual_hash is None:
+            return jsonify({'error': 'No perceptual hash for this media file yet'}), 404
+        distance = min(request.args.get('distance', 10, type=int), 32)
+        limit = request.args.get('limit', 50, type=int)
+
+        tree = current_app.extensions['similarity'].tree(
+            perceptual_hash_stamp(),
+            lambda: db.session.query(Media.id, Media.perceptual_hash).filter(Media.perceptual_hash.isnot(None)).all())
+
+        matches = [(d, other_id) for d, other_id in tree.search(media.perceptual_hash, distance)
+                   if other_id != media_id][:limit]
+        by_id = {m.id: m for m in Media.query.filter(Media.id.in_([other_id for _, other_id in matches])).all()}
+        results = []
+        for d, other_id in matches:
+            if other_id in by_id:
+                media_dict = media_to_json(by_id[other_id])
+                media_dict['distance'] = d
+                results.append(media_dict)
+        return jsonify(results)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @media_bp.route('/media/<int:media_id>/file', methods=['GET'])
 def serve_media_file(media_id):
-    """Serve the actual media file with streaming support for large files"""
+    """Serve the actual media file with streaming support for large files
+
+    Videos accept a ``rendition`` query parameter:
+      original (default) - the untouched file
+      auto               - the 720p H.264 proxy if it is cached, otherwise the original
+                           (and the proxy is queued for background generation). Small H.264
+                           videos (stored codec and size) are always served as they are.
+      720p / hls         - the requested proxy; 202 with the job status until it is ready
+    """
     try:
         media = Media.query.get_or_404(media_id)
         file_path = media.filepath
         
         if not os.path.exists(file_path):
             return jsonify({'error': 'File not found'}), 404
+
+        rendition = request.args.get('rendition', 'original').lower()
+        technical = media.technical
+        if rendition == 'auto' and technical and not needs_proxy(technical.codec, technical.width, technical.height):
+            rendition = 'original'
+        if media.file_type == 'Video' and rendition != 'original':
+            renditions = current_app.extensions['renditions']
+            profile = DEFAULT_PROFILE if rendition == 'auto' else rendition
+            if profile not in RENDITION_PROFILES:
+                return jsonify({'error': f'Unknown rendition: {rendition}'}), 400
+
+            proxy_path = renditions.get(media.id, file_path, profile)
+            if proxy_path:
+                if RENDITION_PROFILES[profile]['kind'] == 'playlist':
+                    return redirect(f'/api/media/{media.id}/hls/{os.path.basename(proxy_path)}')
+                response = send_file(proxy_path, mimetype=RENDITION_PROFILES[profile]['mimetype'],
+                                     as_attachment=False, conditional=True)
+                response.headers['Cache-Control'] = 'public, max-age=86400'
+                response.headers['X-Rendition'] = profile
+                return response
+
+            status = renditions.request(media.id, file_path, profile)
+            if rendition != 'auto':
+                return jsonify({'rendition': profile, 'status': status}), 202
+            # auto: fall back to the original while the proxy is being generated
         
         # Get file size
         file_size = os.path.getsize(file_path)
@@ -141,6 +284,50 @@ def serve_media_file(media_id):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@media_bp.route('/media/<int:media_id>/renditions', methods=['GET', 'POST'])
+def media_renditions(media_id):
+    """Report the proxy rendition status of a video. POST queues the missing ones."""
+    try:
+        media = Media.query.get_or_404(media_id)
+        file_path = media.filepath
+
+        if not os.path.exists(file_path):
+            return jsonify({'error': 'File not found'}), 404
+        if media.file_type != 'Video':
+            return jsonify({'error': 'Renditions are only available for videos'}), 400
+
+        renditions = current_app.extensions['renditions']
+        requested = request.args.get('profile')
+        profiles = [requested] if requested else list(RENDITION_PROFILES)
+
+        result = {}
+        for profile in profiles:
+            if request.method == 'POST':
+                result[profile] = renditions.request(media.id, file_path, profile)
+            else:
+                result[profile] = renditions.status(media.id, file_path, profile)
+
+        return jsonify({'id': media.id, 'renditions': result})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@media_bp.route('/media/<int:media_id>/hls/<path:segment>', methods=['GET'])
+def serve_media_hls(media_id, segment):
+    """Serve the HLS playlist and segments of a video's proxy rendition"""
+    try:
+        media = Media.query.get_or_404(media_id)
+
+        if not os.path.exists(media.filepath):
+            return jsonify({'error': 'File not found'}), 404
+
+        playlist_path = current_app.extensions['renditions'].get(media.id, media.filepath, 'hls')
+        if not playlist_path:
+            return jsonify({'error': 'HLS rendition not available'}), 404
+
+        return send_from_directory(os.path.dirname(playlist_path), segment)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @media_bp.route('/media/<int:media_id>/thumbnail', methods=['GET'])
 def serve_media_thumbnail(media_id):
     """Serve a thumbnail image for fast grid display"""
@@ -210,19 +397,18 @@ def get_locations():
     """Get all unique locations (city, country combinations) with media counts"""
     try:
         locations = db.session.query(
-            Media.city_en, 
-            Media.country_en, 
+            Place.city_en, 
+            Place.country_en, 
             Media.latitude, 
             Media.longitude,
             db.func.count(Media.id).label('count')
-        ).filter(
-            Media.city_en.isnot(None), 
-            Media.country_en.isnot(None),
+        ).join(Place, Place.id == Media.place_id).filter(
+            Place.country_en.isnot(None),
             Media.latitude.isnot(None),
             Media.longitude.isnot(None)
         ).group_by(
-            Media.city_en, 
-            Media.country_en, 
+            Place.city_en, 
+            Place.country_en, 
             Media.latitude, 
             Media.longitude
         ).all()
@@ -241,6 +427,130 @@ def get_locations():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Highest zoom level precomputed by Main_scan_media.py (CLUSTER_MAX_ZOOM)
+CLUSTER_MAX_ZOOM = 18
+
+@media_bp.route('/media/clusters', methods=['GET'])
+def get_clusters():
+    """Get precomputed map clusters inside a bounding box for a map zoom level"""
+    try:
+        bbox = request.args.get('bbox')
+        zoom = request.args.get('zoom', type=int)
+        if not bbox or zoom is None:
+            return jsonify({'error': 'bbox and zoom parameters are required'}), 400
+        try:
+            west, south, east, north = parse_bbox(bbox)
+        except ValueError:
+            return jsonify({'error': 'bbox must be "west,south,east,north"'}), 400
+        zoom = max(0, min(zoom, CLUSTER_MAX_ZOOM))
+
+        clusters = GeoCluster.query.filter(
+            GeoCluster.zoom == zoom,
+            GeoCluster.latitude.between(south, north),
+            bbox_longitude_filter(GeoCluster.longitude, west, east)
+        ).all()
+
+        return jsonify([cluster.to_dict() for cluster in clusters])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@media_bp.route('/media/bbox', methods=['GET'])
+def get_media_in_bbox():
+    """Get all media inside a 'west,south,east,north' bounding box"""
+    try:
+        bbox = request.args.get('bbox')
+        if not bbox:
+            return jsonify({'error': 'bbox parameter is required'}), 400
+        try:
+            west, south, east, north = parse_bbox(bbox)
+        except ValueError:
+            return jsonify({'error': 'bbox must be "west,south,east,north"'}), 400
+        limit = request.args.get('limit', type=int)
+
+        query = Media.query.filter(Media.id.in_(rtree_bbox_ids(west, south, east, north))) \
+            .order_by(Media.creation_ts.asc())
+        if limit:
+            query = query.limit(limit)
+
+        return jsonify([media_to_json(media) for media in query.all()])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@media_bp.route('/media/nearby', methods=['GET'])
+def get_media_nearby():
+    """Get media shot within radius_km (default 1 km) of lat/lon, nearest first"""
+    try:
+        lat = request.args.get('lat', type=float)
+        lon = request.args.get('lon', type=float)
+        radius_km = request.args.get('radius_km', 1.0, type=float)
+        limit = request.args.get('limit', type=int)
+        if lat is None or lon is None:
+            return jsonify({'error': 'lat and lon parameters are required'}), 400
+        if radius_km <= 0:
+            return jsonify({'error': 'radius_km must be positive'}), 400
+
+        # The R*Tree returns the candidates inside the radius' bounding box,
+        # the exact distance is only computed for those.
+        dlat = radius_km / 111.32
+        dlon = radius_km / (111.32 * max(math.cos(math.radians(lat)), 1e-6))
+        candidates = Media.query.filter(Media.id.in_(rtree_bbox_ids(
+            lon - dlon, max(lat - dlat, -90.0), lon + dlon, min(lat + dlat, 90.0)
+        ))).all()
+
+        result = []
+        for media in candidates:
+            distance = haversine_km(lat, lon, media.latitude, media.longitude)
+            if distance <= radius_km:
+                media_dict = media_to_json(media)
+                media_dict['distance_km'] = round(distance, 3)
+                result.append(media_dict)
+        result.sort(key=lambda m: m['distance_km'])
+        if limit:
+            result = result[:limit]
+
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@media_bp.route('/media/days', methods=['GET'])
+def get_days():
+    """Get per-day media counts by type and place, for the daily view calendar"""
+    try:
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+
+        query = DailyCount.query
+        if date_from:
+            query = query.filter(DailyCount.day >= date_from[:10])
+        if date_to:
+            query = query.filter(DailyCount.day <= date_to[:10])
+
+        days = {}
+        for row in query.order_by(DailyCount.day.asc()).all():
+            day = days.setdefault(row.day, {'day': row.day, 'total': 0, 'images': 0, 'videos': 0, 'places': {}})
+            day['total'] += row.count
+            if row.file_type == 'Image':
+                day['images'] += row.count
+            elif row.file_type == 'Video':
+                day['videos'] += row.count
+            if row.place:
+                place = day['places'].setdefault((row.place.city_en, row.place.country_en), {
+                    'city_en': row.place.city_en,
+                    'city_zh': row.place.city_zh,
+                    'country_en': row.place.country_en,
+                    'count': 0
+                })
+                place['count'] += row.count
+
+        result = []
+        for day in days.values():
+            day['places'] = sorted(day['places'].values(), key=lambda p: p['count'], reverse=True)
+            result.append(day)
+
+        return jsonify(result)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @media_bp.route('/media/stats', methods=['GET'])
 def get_stats():
     """Get statistics about the media library"""
@@ -253,11 +563,10 @@ def get_stats():
         total_with_people = Media.query.filter(Media.people_count > 0).count()
         total_with_talking = Media.query.filter(Media.talking_detected == True).count()
         
-        # Get date range from creation_time
-        date_range = db.session.query(
-            db.func.min(Media.creation_time).label('earliest'),
-            db.func.max(Media.creation_time).label('latest')
-        ).first()
+        # Get date range from the first and last media in creation_ts order (index scans), as wall-clock times
+        dated = db.session.query(Media.creation_ts, Media.tz_offset).filter(Media.creation_ts.isnot(None))
+        earliest = dated.order_by(Media.creation_ts.asc()).first()
+        latest = dated.order_by(Media.creation_ts.desc()).first()
         
         return jsonify({
             'total_media': total_media,
@@ -265,21 +574,88 @@ def get_stats():
             'total_with_people': total_with_people,
             'total_with_talking': total_with_talking,
             'date_range': {
-                'earliest': date_range.earliest,
-                'latest': date_range.latest
+                'earliest': local_time_string(*earliest) if earliest else None,
+                'latest': local_time_string(*latest) if latest else None
             }
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@media_bp.route('/media/bursts', methods=['GET'])
+def get_bursts():
+    """
+    Get bursts of near-identical shots taken within a few seconds, so a gallery can collapse
+    each burst to its first photo. Only neighbours in time are compared.
+    """
+    try:
+        distance = request.args.get('distance', 10, type=int)
+        gap = request.args.get('gap', 5, type=int)   # seconds between consecutive shots
+        date_from = request.args.get('date_from')
+        date_to = request.args.get('date_to')
+
+        query = db.session.query(Media.id, Media.creation_ts, Media.perceptual_hash).filter(
+            Media.creation_ts.isnot(None),
+            Media.perceptual_hash.isnot(None),
+            Media.file_type == 'Image'
+        )
+        if date_from or date_to:
+            try:
+                query = query.filter(local_time_filter(date_from, date_to))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        bursts = group_bursts(query.order_by(Media.creation_ts, Media.id).all(), distance, gap)
+
+        covers = {m.id: m for m in Media.query.filter(Media.id.in_([ids[0] for ids in bursts])).all()}
+        return jsonify([{
+            'cover': media_to_json(covers[ids[0]]),
+            'count': len(ids),
+            'media_ids': ids
+        } for ids in bursts if ids[0] in covers])
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@media_bp.route('/media/duplicates', methods=['GET'])
+def get_duplicates():
+    """Get groups of byte-identical media files, largest files first"""
+    try:
+        limit = request.args.get('limit', 100, type=int)
+
+        groups = db.session.query(
+            Media.content_hash, db.func.max(Media.size).label('size'), db.func.count(Media.id).label('count')
+        ).filter(
+            Media.content_hash.isnot(None)
+        ).group_by(Media.content_hash).having(
+            db.func.count(Media.id) > 1
+        ).order_by(db.desc('size')).limit(limit).all()
+
+        members = {}
+        if groups:
+            for media in Media.query.filter(
+                Media.content_hash.in_([group.content_hash for group in groups])
+            ).order_by(Media.filepath).all():
+                members.setdefault(media.content_hash, []).append(media_to_json(media))
+
+        return jsonify({
+            'groups': [{
+                'content_hash': group.content_hash,
+                'size': group.size,
+                'count': group.count,
+                'media': members.get(group.content_hash, [])
+            } for group in groups],
+            'wasted_bytes': sum((group.size or 0) * (group.count - 1) for group in groups)
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @media_bp.route('/media/cities', methods=['GET'])
 def get_cities():
     """Get all unique cities in ascending order with both English and Chinese names"""
     try:
-        cities = db.session.query(Media.city_en, Media.city_zh).filter(
-            Media.city_en.isnot(None), 
-            Media.city_en != ''
-        ).distinct().order_by(Media.city_en.asc()).all()
+        # Read the names from the places table; the place_id index tells which places still have media
+        cities = db.session.query(Place.city_en, Place.city_zh).filter(
+            Place.city_en != '',
+            Place.id.in_(db.select(Media.place_id))
+        ).distinct().order_by(Place.city_en.asc()).all()
         
         city_list = []
         for city_en, city_zh in cities:
@@ -297,10 +673,11 @@ def get_cities():
 def get_countries():
     """Get all unique countries in ascending order with both English and Chinese names"""
     try:
-        countries = db.session.query(Media.country_en, Media.country_zh).filter(
-            Media.country_en.isnot(None), 
-            Media.country_en != ''
-        ).distinct().order_by(Media.country_en.asc()).all()
+        countries = db.session.query(Place.country_en, Place.country_zh).filter(
+            Place.country_en.isnot(None), 
+            Place.country_en != '',
+            Place.id.in_(db.select(Media.place_id))
+        ).distinct().order_by(Place.country_en.asc()).all()
         
         country_list = []
         for country_en, country_zh in countries:
@@ -0,0 +1,99 @@
+"""
+Near-duplicate lookups on the 64-bit perceptual hashes (dHash) stored by Main_scan_media.py.
+
+Similar images have hashes within a small hamming distance. A BK-tree indexes the hashes by
+their distance to each node, so a "find similar" query only descends into the branches that can
+hold a hash within the requested distance instead of comparing against every media file.
+SimilarityIndex keeps one tree per process and rebuilds it when the set of hashes changed.
+
+Bursts are consecutive shots: ordered by time, a photo belongs to the previous burst when it was
+taken within a few seconds and its hash is close to the previous photo's hash.
+"""
+
+import threading
+
+HASH_MASK = (1 << 64) - 1
+
+
+def hamming(a, b):
+    return bin((a ^ b) & HASH_MASK).count('1')
+
+
+class BKTree:
+    def __init__(self):
+        self.root = None     # [hash, [ids], {distance: child node}]
+        self.size = 0
+
+    def add(self, value, item):
+        value &= HASH_MASK
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def search(self, value, max_distance):
+        """Return [(distance, item)] of all items within max_distance, nearest first"""
+        value &= HASH_MASK
+        results = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= max_distance:
+                results.extend((distance, item) for item in node[1])
+            for child_distance, child in node[2].items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda result: result[0])
+        return results
+
+
+class SimilarityIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._tree = None
+
+    def tree(self, stamp, load_rows):
+        """
+        Return the BK-tree of (media_id, hash) rows from load_rows(). The tree is rebuilt only
+        when stamp (e.g. count, max id and sums of the hashes) differs from the last build.
+        """
+        with self._lock:
+            if self._tree is None or stamp != self._stamp:
+                tree = BKTree()
+                for media_id, value in load_rows():
+                    tree.add(value, media_id)
+                self._tree = tree
+                self._stamp = stamp
+            return self._tree
+
+
+def group_bursts(rows, max_distance, max_gap_seconds):
+    """Group time-ordered (media_id, creation_ts, hash) rows into bursts, returns lists of media ids"""
+    bursts = []
+    current = []
+    previous_ts = previous_hash = None
+    for media_id, creation_ts, value in rows:
+        if (current and creation_ts - previous_ts <= max_gap_seconds
+                and hamming(value, previous_hash) <= max_distance):
+            current.append(media_id)
+        else:
+            if len(current) > 1:
+                bursts.append(current)
+            current = [media_id]
+        previous_ts, previous_hash = creation_ts, value
+    if len(current) > 1:
+        bursts.append(current)
+    return bursts
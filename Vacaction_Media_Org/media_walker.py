@@ -0,0 +1,146 @@
+"""
+Parallel media file walker for Main_scan_media.py.
+
+The top-level subdirectories of the scan root are walked concurrently with os.scandir and the
+media files are yielded as soon as they are found, so extraction starts before the walk is done.
+Directory mtimes recorded by the previous run (MediaOrganizerDB.get_directory_cache) let the
+walker skip unchanged directories: a directory whose mtime did not change has the same entries,
+so only its (already known) subdirectories are visited.
+"""
+
+import logging
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+MEDIA_EXTENSIONS = frozenset(('.jpg', '.jpeg', '.png', '.heic', '.mp4', '.mov'))
+THUMBNAIL_SUFFIX = '_thumb.jpg'
+
+_SUBTREE_DONE = object()
+
+
+def is_media_file(name):
+    """True for non-hidden media files that are not generated thumbnails"""
+    if name.startswith('.') or name.endswith(THUMBNAIL_SUFFIX):
+        return False
+    dot = name.rfind('.')
+    return dot > 0 and name[dot:].lower() in MEDIA_EXTENSIONS
+
+
+def build_dir_cache(dirs):
+    """Turn (directory, parent, mtime_ns) rows into the {directory: (mtime_ns, [subdirectories])} walker cache"""
+    cache = {path: (mtime_ns, []) for path, _, mtime_ns in dirs}
+    for path, parent, _ in dirs:
+        if parent in cache:
+            cache[parent][1].append(path)
+    return cache
+
+
+class DirectoryWalker:
+    def __init__(self, root, dir_cache=None, workers=8, with_stats=False):
+        """
+        root       : directory to scan
+        dir_cache  : {directory: (mtime_ns, [subdirectories])} from the previous run, None walks everything
+        workers    : number of top-level subtrees walked at the same time
+        with_stats : yield (filepath, size, mtime) instead of just the file path
+        """
+        self.root = os.path.abspath(root)
+        self.dir_cache = dir_cache or {}
+        self.workers = workers
+        self.with_stats = with_stats
+
+        # Filled while iterating
+        self.thumbnails = set()      # existing <name>_thumb.jpg files in the listed directories
+        self.visited_dirs = []       # (directory, parent, mtime_ns) of every directory reached
+        self.listed_dirs = []        # new or changed directories whose entries were read
+        self.skipped_dirs = []       # unchanged directories whose files were not listed
+        self.file_count = 0
+
+    def __iter__(self):
+        logging.info(f"Starting recursive scan of: {self.root}")
+        results = queue.Queue()
+        root_files = []
+        subtrees = self._scan_dir(self.root, None, root_files.append)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='walker') as executor:
+            for subtree in subtrees:
+                executor.submit(self._walk_subtree, subtree, self.root, results)
+
+            for item in root_files:
+                self.file_count += 1
+                yield item
+            remaining = len(subtrees)
+            while remaining:
+                item = results.get()
+                if item is _SUBTREE_DONE:
+                    remaining -= 1
+                    continue
+                self.file_count += 1
+                yield item
+
+        logging.info(f"Found {self.file_count} files in total "
+                     f"({len(self.listed_dirs)} directories listed, {len(self.skipped_dirs)} unchanged).")
+
+    def _walk_subtree(self, top, parent, results):
+        try:
+            stack = [(top, parent)]
+            while stack:
+                path, parent = stack.pop()
+                for subdir in self._scan_dir(path, parent, results.put):
+                    stack.append((subdir, path))
+        except Exception as e:
+            logging.error(f"Error walking {top}: {e}")
+        finally:
+            results.put(_SUBTREE_DONE)
+
+    def _scan_dir(self, path, parent, emit):
+        """Emit the media files of one directory and return its subdirectories."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError as e:
+            logging.warning(f"Cannot access directory {path}: {e}")
+            return []
+
+        cached = self.dir_cache.get(path)
+        if cached and cached[0] == mtime_ns:
+            self.visited_dirs.append((path, parent, mtime_ns))
+            self.skipped_dirs.append(path)
+            return list(cached[1])
+
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    name = entry.name
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+
+                    # Thumbnail files (<name>_thumb.jpg) are remembered but not scanned
+                    if name.endswith(THUMBNAIL_SUFFIX):
+                        self.thumbnails.add(entry.path)
+                        continue
+                    # Skip hidden files and non-media files
+                    if not is_media_file(name):
+                        continue
+
+                    if self.with_stats:
+                        try:
+                            stat_info = entry.stat()
+                        except OSError:
+                            continue
+                        emit((entry.path, stat_info.st_size, int(stat_info.st_mtime)))
+                    else:
+                        emit(entry.path)
+        except OSError as e:
+            # Not recorded, so the directory is listed again on the next run
+            logging.warning(f"Cannot list directory {path}: {e}")
+            return subdirs
+        self.visited_dirs.append((path, parent, mtime_ns))
+        self.listed_dirs.append(path)
+        return subdirs
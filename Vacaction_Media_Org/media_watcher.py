@@ -0,0 +1,180 @@
+"""
+Watch mode for Main_scan_media.py.
+
+MediaWatcher reports the media files created, changed or deleted below a directory. File system
+events come from watchdog (inotify on Linux, FSEvents on macOS) when it is installed; otherwise,
+or with polling=True (e.g. for network shares), the tree is re-walked every poll_interval seconds
+and compared with the previous snapshot. Unchanged directories are not listed again (their mtime
+says no file was added, renamed or removed), but their known files are stat'ed on every poll, as
+a file still being copied or edited in place does not change its directory's mtime. A polled file
+is reported once its size and mtime are the same in two consecutive polls.
+
+Events are debounced: a batch is handed over once no new event arrived for `debounce` seconds
+(or at the latest after `max_delay` seconds), so an SD-card import is processed as one batch
+after the copy has finished.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from media_walker import DirectoryWalker, build_dir_cache, is_media_file
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    WATCHDOG_AVAILABLE = True
+except ImportError:
+    FileSystemEventHandler = object
+    WATCHDOG_AVAILABLE = False
+
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        # A 'modified' directory only means its entries changed, and those have their own events
+        if event.is_directory and event.event_type == 'modified':
+            return
+        if event.event_type in ('created', 'modified', 'closed'):
+            self.watcher.record(event.src_path, event.is_directory, deleted=False)
+        elif event.event_type == 'deleted':
+            self.watcher.record(event.src_path, event.is_directory, deleted=True)
+        elif event.event_type == 'moved':
+            self.watcher.record(event.src_path, event.is_directory, deleted=True)
+            self.watcher.record(event.dest_path, event.is_directory, deleted=False)
+
+
+class MediaWatcher:
+    def __init__(self, root, debounce=5.0, max_delay=300.0, polling=False, poll_interval=30.0):
+        self.root = os.path.abspath(root)
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.polling = polling or not WATCHDOG_AVAILABLE
+        self.poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._paths = set()          # files and directories with events since the last batch
+        self._first_event = None
+        self._last_event = None
+        self._observer = None
+
+        # Polling snapshot: {directory: {filepath: (size, mtime)}}, the walker's directory cache and
+        # the files that changed in the last poll and are reported when the next one sees them unchanged
+        self._snapshot = {}
+        self._dir_cache = {}
+        self._settling = set()
+
+    def record(self, path, is_directory=False, deleted=False):
+        # Directory events matter when a folder is copied, moved in or removed as a whole
+        if is_directory:
+            if not deleted and not os.path.isdir(path):
+                return
+        elif not is_media_file(os.path.basename(path)):
+            return
+        now = time.monotonic()
+        with self._lock:
+            self._paths.add(path)
+            if self._first_event is None:
+                self._first_event = now
+            self._last_event = now
+
+    def _poll(self, report=True):
+        walker = DirectoryWalker(self.root, dir_cache=self._dir_cache, workers=4, with_stats=True)
+        snapshot = {}
+        for filepath, size, mtime in walker:
+            snapshot.setdefault(os.path.dirname(filepath), {})[filepath] = (size, mtime)
+        for path in walker.skipped_dirs:
+            if path in self._snapshot:
+                snapshot[path] = self._stat_files(self._snapshot[path])
+        self._dir_cache = build_dir_cache(walker.visited_dirs)
+
+        if report:
+            for directory in set(self._snapshot) | set(snapshot):
+                old_files = self._snapshot.get(directory, {})
+                new_files = snapshot.get(directory, {})
+                for filepath, state in new_files.items():
+                    if old_files.get(filepath) != state:
+                        # New or still being written: wait for a poll that sees it unchanged
+                        self._settling.add(filepath)
+                    elif filepath in self._settling:
+                        self._settling.discard(filepath)
+                        self.record(filepath)
+                for filepath in old_files.keys() - new_files.keys():
+                    self._settling.discard(filepath)
+                    self.record(filepath, deleted=True)
+        self._snapshot = snapshot
+
+    @staticmethod
+    def _stat_files(files):
+        """Current (size, mtime) of the files of an unchanged directory, in the walker's format"""
+        states = {}
+        for filepath in files:
+            try:
+                stat_info = os.stat(filepath)
+            except OSError:
+                continue
+            states[filepath] = (stat_info.st_size, int(stat_info.st_mtime))
+        return states
+
+    def _take_batch(self):
+        """Return the pending paths once the burst of events is over, else None."""
+        now = time.monotonic()
+        with self._lock:
+            if not self._paths:
+                return None
+            if now - self._last_event < self.debounce and now - self._first_event < self.max_delay:
+                return None
+            paths = self._paths
+            self._paths = set()
+            self._first_event = self._last_event = None
+
+        # Events only say that something happened; the current state decides what to do.
+        changed, deleted, deleted_dirs = set(), set(), set()
+        for path in paths:
+            if os.path.isdir(path):
+                # A directory that appeared: its files may not have produced their own events
+                changed.update(DirectoryWalker(path, workers=2))
+            elif os.path.isfile(path):
+                changed.add(path)
+            elif is_media_file(os.path.basename(path)):
+                deleted.add(path)
+            else:
+                deleted_dirs.add(path)
+        return sorted(changed), sorted(deleted), sorted(deleted_dirs)
+
+    def run(self, handle_batch):
+        """
+        Watch until interrupted (Ctrl-C). handle_batch(changed, deleted, deleted_dirs) is called from
+        this thread with the absolute paths of new or modified files, deleted files and deleted directories.
+        """
+        if self.polling:
+            if not WATCHDOG_AVAILABLE:
+                logging.warning("watchdog is not installed, watching by polling the directory tree.")
+            logging.info(f"Watching {self.root} by polling every {self.poll_interval:.0f} seconds.")
+            self._poll(report=False)
+            next_poll = time.monotonic() + self.poll_interval
+        else:
+            self._observer = Observer()
+            self._observer.schedule(_EventHandler(self), self.root, recursive=True)
+            self._observer.start()
+            logging.info(f"Watching {self.root} for file system events.")
+
+        try:
+            while True:
+                time.sleep(1)
+                if self.polling and time.monotonic() >= next_poll:
+                    self._poll()
+                    next_poll = time.monotonic() + self.poll_interval
+                batch = self._take_batch()
+                if batch:
+                    handle_batch(*batch)
+        except KeyboardInterrupt:
+            logging.info("Watch mode stopped.")
+        finally:
+            if self._observer:
+                self._observer.stop()
+                self._observer.join()
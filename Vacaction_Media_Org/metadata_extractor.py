@@ -1,6 +1,5 @@
 
 from importlib.metadata import metadata
-from math import radians, sin, cos, sqrt, atan2
 import os
 import subprocess
 import json
@@ -9,48 +8,81 @@ from datetime import datetime
 import pickle
 from pathlib import Path
 
+from exif_reader import read_exif
+from video_reader import read_video_metadata
+from geo_cache import GeoCache, GEO_CACHE_GRID
+from geo_shards import GeoShards, GEO_MEMORY_MB, haversine_km
+
+# ExifTool tags (-n) that carry the technical metadata, read in the same pass as the date and GPS
+TECHNICAL_TAGS = ('ImageWidth', 'ImageHeight', 'Orientation', 'Rotation', 'Duration', 'VideoFrameRate',
+                  'CompressorID', 'Make', 'Model')
+# Columns of the media_technical table
+TECHNICAL_FIELDS = ('width', 'height', 'orientation', 'duration', 'fps', 'codec', 'make', 'model')
+# Video rotation (degrees) as the equivalent EXIF orientation, so images and videos share one column
+ROTATION_ORIENTATION = {0: 1, 90: 6, 180: 3, 270: 8}
+
+def technical_metadata(exif_data):
+    """Map the ExifTool-named technical tags of an exif_data dict to the TECHNICAL_FIELDS"""
+    def number(tag, kind):
+        try:
+            return kind(exif_data[tag]) if exif_data.get(tag) not in (None, '') else None
+        except (TypeError, ValueError):
+            return None
+
+    def text(tag):
+        value = exif_data.get(tag)
+        if value is None:
+            return None
+        return str(value).strip() or None
+
+    orientation = number('Orientation', int)
+    rotation = number('Rotation', int)
+    if orientation is None and rotation is not None:
+        orientation = ROTATION_ORIENTATION.get(rotation % 360)
+    return {
+        'width': number('ImageWidth', int),
+        'height': number('ImageHeight', int),
+        'orientation': orientation,
+        'duration': number('Duration', float),
+        'fps': number('VideoFrameRate', float),
+        'codec': text('CompressorID'),
+        'make': text('Make'),
+        'model': text('Model'),
+    }
+
 class MetadataExtractor:
-    def __init__(self, geo_list_path='geo_chinese_.list'):
+    def __init__(self, geo_list_path='geo_chinese_.list', native_exif=True, geo_cache_grid=GEO_CACHE_GRID,
+                 geo_memory_mb=GEO_MEMORY_MB):
 
-        self.city_dict: dict[str, str] = {}
+        self._city_dict = None
+        # Read JPEG/HEIC EXIF and MP4/MOV boxes natively, ExifTool is only started for the other files
+        self.native_exif = native_exif
 
         self.geo_list_path = geo_list_path
+        self.geo_shards = None
         if not os.path.exists(self.geo_list_path):
             logging.warning(f"File {self.geo_list_path} not found. Geolocation enhancement will be disabled.")
             self.geo_list_path = None
         else:
-            # Read and parse geo.list comma separator CSV file and store in memory as a list of tuples
+            # The geo.list comma separator CSV file is split into grid-cell shards that are loaded on demand.
             # This is the first line of the CSV file:
             #   City_en,City_zn,Region_en,Region_zn,Subregion_en,Subregion_zn,CountryCode,Country_en,Country_zn,TimeZone,Latitude,Longitude
-            self.geo_data = []
-            with open(self.geo_list_path, 'r', encoding='utf-8') as f:
-                # Skip header line
-                next(f)
-                for line in f:
-                    # Each line is comma-separated values and values are
-                    #  0:City_en,1:City_zn,2:Region_en,3:Region_zn,4:Subregion_en,5:Subregion_zn,6:CountryCode,7:Country_en,8:Country_zn,9:TimeZone,10:Latitude,11:Longitude
-                    # logging.info(f"Parsing line in geo.list: {line.strip()}")
-                    parts = line.strip().split(',')
-                    try:
-                        city_en = parts[0]
-                        city_zn = parts[1]
-                        region_en = parts[2]
-                        region_zn = parts[3]
-                        subregion_en = parts[4]
-                        subregion_zn = parts[5]
-                        country_code = parts[6]
-                        country_en = parts[7]
-                        country_zn = parts[8]
-                        timezone = parts[9]
-                        lat = float(parts[10])
-                        lon = float(parts[11])
-                        # Save city translation mapping for quick lookup
-                        self.city_dict[city_en] = city_zn
-                        self.geo_data.append((lat, lon, city_en, city_zn, region_en, region_zn, subregion_en, subregion_zn, country_code, country_en, country_zn, timezone))
-                    except ValueError:
-                        logging.error(f"Error parsing line in geo.list: {line}")
-                        continue
-            logging.info(f"Loaded {len(self.geo_data)} entries from {self.geo_list_path}")
+            self.geo_shards = GeoShards(self.geo_list_path, memory_mb=geo_memory_mb)
+            logging.info(f"Indexed {self.geo_shards.count} entries of {self.geo_list_path} "
+                         f"in {len(self.geo_shards.index['shards'])} shards")
+
+        # Nearest place per grid cell, in memory and (after geo_cache.attach()) in the scanner database
+        self.geo_cache = GeoCache(self.geo_shards.version if self.geo_shards else '', grid=geo_cache_grid)
+
+    @property
+    def city_dict(self) -> dict[str, str]:
+        """City translations City_en -> City_zn, read from the geo list on first use"""
+        if self._city_dict is None:
+            self._city_dict = {}
+            if self.geo_shards:
+                for row in self.geo_shards.iter_rows():
+                    self._city_dict[row[2]] = row[3]
+        return self._city_dict
 
     def _get_city_translation(self, city_name: str) -> str:
         #print(f"> DBG: Looking up city translation for: {city_name}")
@@ -119,8 +151,24 @@ class MetadataExtractor:
             "Longitude": Longitude,
             "CreateDate": CreateDate,
         }
+        dummy_exif_data.update({tag: metadata[0][tag] for tag in TECHNICAL_TAGS if tag in metadata[0]})
         return dummy_exif_data
 
+    def _read_exif(self, filepath):
+        if self.native_exif:
+            native = read_exif(filepath) or read_video_metadata(filepath)
+            if native:
+                exif_data = dict(native)
+                exif_data.update({
+                    "SourceFile": filepath,
+                    "FileName": os.path.basename(filepath),
+                    "FileTypeExtension": os.path.splitext(filepath)[1].lstrip(".").lower(),
+                    # Same YYYY-MM-DD HH:MM:SS format as the ExifTool path
+                    "CreateDate": native["CreateDate"].replace(":", "-", 2),
+                })
+                return exif_data
+        return self._run_exiftool(filepath)
+
     def extract_metadata(self, filepath):
         fileType = 'Undefined'
         extension = os.path.splitext(filepath)[1].lower()
@@ -132,7 +180,7 @@ class MetadataExtractor:
             logging.warning(f"Unsupported file type for {filepath}. Skipping.")
             return None
         
-        exif_data = self._run_exiftool(filepath)
+        exif_data = self._read_exif(filepath)
         if not exif_data:
             return None
 
@@ -143,19 +191,17 @@ class MetadataExtractor:
             "file_extension": exif_data.get("FileTypeExtension", extension),
             "file_type": fileType,
             "size": stat_info.st_size,
+            "mtime": int(stat_info.st_mtime),
             "creation_time": exif_data.get("CreateDate", None),
             "latitude": exif_data.get("Latitude", None),
             "longitude": exif_data.get("Longitude", None),
         }
+        # Size, orientation, duration, frame rate, codec and camera, so nothing has to probe the file again
+        base_metadata.update(technical_metadata(exif_data))
         return base_metadata
 
     def haversine(self, lat1, lon1, lat2, lon2):
-        R = 6371  # Earth radius in km
-        dlat = radians(lat2 - lat1)
-        dlon = radians(lon2 - lon1)
-        a = sin(dlat/2)**2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon/2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        return R * c
+        return haversine_km(lat1, lon1, lat2, lon2)
 
     def get_geo_from_coordinates(self, latitude, longitude):
         if not self.geo_list_path:
@@ -170,9 +216,14 @@ class MetadataExtractor:
 
             # This is a placeholder for what would be a call to a geo lookup function.
             # e.g., return self._find_location_in_geolist(latitude, longitude)
-            logging.debug(f"Looking up geo data for lat={latitude}, lon={longitude}")
-            closest = min(self.geo_data, key=lambda g: self.haversine(latitude, longitude, g[0], g[1]))
-            logging.info(f"Closest geo data found: {closest}")
+            logging.debug("Looking up geo data for lat=%s, lon=%s", latitude, longitude)
+            closest = self.geo_cache.get(latitude, longitude)
+            if closest is None:
+                closest, _ = self.geo_shards.nearest(latitude, longitude)
+                if closest is None:
+                    return None
+                logging.info(f"Closest geo data found: {closest}")
+                self.geo_cache.put(latitude, longitude, closest)
 
             # 0:lat, 1:lon, 2:city_en, 3:city_zn, 4:region_en, 5:region_zn, 6:subregion_en, 7:subregion_zn, 8:country_code, 9:country_en, 10:country_zn, 11:timezone
             return {
@@ -0,0 +1,161 @@
+"""
+Process-wide registry of the semantic analysis models.
+
+Every model is loaded once per process, on first use, and shared by all later analyses:
+
+  yolo   ultralytics YOLO people detector, from MODELS_DIR/yolov8n.pt
+  vad    Silero VAD, from the silero-vad package (the model file ships with it), a local clone in
+         MODELS_DIR/silero-vad, or the torch hub cache - the hub is never forced to reload
+  pose   MediaPipe pose
+
+MODELS_DIR is ./models next to this file unless MEDIA_MODELS_DIR is set. A model whose package is
+missing is None, and analyses skip that step. configure_threads() sets the torch thread counts,
+use it on CPU-only machines and in pool workers so processes do not oversubscribe the cores.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+from importlib import metadata
+
+try:
+    import torch
+    TORCH_AVAILABLE = True
+except ImportError:
+    TORCH_AVAILABLE = False
+
+try:
+    from ultralytics import YOLO
+    YOLO_AVAILABLE = True
+except ImportError:
+    YOLO_AVAILABLE = False
+
+try:
+    import silero_vad
+    SILERO_PACKAGE_AVAILABLE = True
+except ImportError:
+    SILERO_PACKAGE_AVAILABLE = False
+
+try:
+    import mediapipe as mp
+    MEDIAPIPE_AVAILABLE = True
+except ImportError:
+    MEDIAPIPE_AVAILABLE = False
+
+MODELS_DIR = os.environ.get('MEDIA_MODELS_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+YOLO_WEIGHTS = 'yolov8n.pt'
+SILERO_REPO = 'snakers4/silero-vad'
+
+
+def _package_version(name):
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return 'unknown'
+
+
+def configure_threads(threads):
+    """Limit torch intra-op threads (and inter-op threads to one) for this process"""
+    if not TORCH_AVAILABLE or not threads:
+        return
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only possible before the first parallel torch operation of the process
+        pass
+
+
+class ModelRegistry:
+    def __init__(self, models_dir=MODELS_DIR):
+        self.models_dir = models_dir
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, loader):
+        with self._lock:
+            if name not in self._models:
+                start = time.perf_counter()
+                try:
+                    self._models[name] = loader()
+                except Exception as e:
+                    # Cached as unavailable, so a broken model is not reloaded for every video
+                    logging.error(f"Could not load the {name} model: {e}")
+                    self._models[name] = None
+                if self._models[name] is not None:
+                    logging.info(f"Loaded {name} model in {time.perf_counter() - start:.1f}s")
+            return self._models[name]
+
+    def stamp(self):
+        """
+        Identity of the models an analysis would use, without loading them. It changes when the
+        weights, a model package or the set of available models changes.
+        """
+        parts = []
+        weights = os.path.join(self.models_dir, YOLO_WEIGHTS)
+        if not YOLO_AVAILABLE:
+            parts.append('yolo:none')
+        elif os.path.exists(weights):
+            with open(weights, 'rb') as f:
+                parts.append('yolo:' + hashlib.blake2b(f.read(), digest_size=8).hexdigest())
+        else:
+            parts.append(f"yolo:{YOLO_WEIGHTS}:{_package_version('ultralytics')}")
+        if SILERO_PACKAGE_AVAILABLE:
+            parts.append('vad:' + _package_version('silero-vad'))
+        elif TORCH_AVAILABLE:
+            local = os.path.isdir(os.path.join(self.models_dir, 'silero-vad'))
+            parts.append('vad:local' if local else 'vad:hub')
+        else:
+            parts.append('vad:none')
+        parts.append('pose:' + (_package_version('mediapipe') if MEDIAPIPE_AVAILABLE else 'none'))
+        return ' '.join(parts)
+
+    def yolo(self):
+        """The YOLO detector, or None if ultralytics is not installed"""
+        return self._get('yolo', self._load_yolo)
+
+    def vad(self):
+        """The Silero VAD model, or None if neither silero-vad nor torch is installed"""
+        return self._get('vad', self._load_vad)
+
+    def pose(self):
+        """A MediaPipe Pose instance, or None if mediapipe is not installed"""
+        return self._get('pose', self._load_pose)
+
+    def _load_yolo(self):
+        if not YOLO_AVAILABLE:
+            logging.warning("ultralytics not available, people detection is skipped.")
+            return None
+        weights = os.path.join(self.models_dir, YOLO_WEIGHTS)
+        if not os.path.exists(weights):
+            logging.warning(f"{weights} not found, ultralytics downloads {YOLO_WEIGHTS} to its own cache.")
+            weights = YOLO_WEIGHTS
+        return YOLO(weights)
+
+    def _load_vad(self):
+        if SILERO_PACKAGE_AVAILABLE:
+            return silero_vad.load_silero_vad()
+        if not TORCH_AVAILABLE:
+            logging.warning("silero-vad / torch not available, voice activity detection is skipped.")
+            return None
+        local_repo = os.path.join(self.models_dir, 'silero-vad')
+        if os.path.isdir(local_repo):
+            model, _ = torch.hub.load(repo_or_dir=local_repo, model='silero_vad', source='local')
+        else:
+            # Downloaded once into the torch hub cache, later loads are offline
+            model, _ = torch.hub.load(repo_or_dir=SILERO_REPO, model='silero_vad', trust_repo=True)
+        return model
+
+    def _load_pose(self):
+        if not MEDIAPIPE_AVAILABLE:
+            logging.warning("mediapipe not available, activity recognition is skipped.")
+            return None
+        # The instance is shared by all videos of the process and gets about one frame per second, so
+        # every frame is detected on its own instead of tracked from the previous (unrelated) one
+        return mp.solutions.pose.Pose(static_image_mode=True, min_detection_confidence=0.5)
+
+
+# Shared by all analyses of the process (and each pool worker has its own)
+registry = ModelRegistry()
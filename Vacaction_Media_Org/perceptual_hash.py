@@ -0,0 +1,56 @@
+"""
+Perceptual hashing for near-duplicate detection (burst shots, re-encoded or resized copies).
+
+dhash is the 64-bit difference hash: the image is reduced to 9x8 grey pixels and every bit tells
+whether a pixel is brighter than its right neighbour. It is computed on the thumbnail that was just
+generated (or on the saved thumbnail for videos), so the extra cost per file is a few microseconds.
+Similar images differ in a few bits; the web API compares hashes by their hamming distance.
+
+SQLite integers are signed, so the unsigned 64-bit hash is stored in two's complement.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+HASH_SIZE = 8
+
+
+def to_signed64(value):
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def dhash(img):
+    """Difference hash of a PIL image as a signed 64-bit integer"""
+    pixels = list(img.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BILINEAR).getdata())
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return to_signed64(value)
+
+
+def dhash_file(image_path):
+    """Difference hash of an image file (e.g. a thumbnail), None if it cannot be read"""
+    if not PIL_AVAILABLE:
+        return None
+    try:
+        with Image.open(image_path) as img:
+            img.draft('L', (64, 64))   # JPEG: decode at reduced size
+            return dhash(img)
+    except Exception as e:
+        logging.warning(f"Cannot compute perceptual hash of {image_path}: {e}")
+        return None
+
+
+def dhash_files(image_paths, workers=4):
+    """Hash image files in parallel, returns {image_path: hash or None}"""
+    image_paths = list(image_paths)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dhash') as executor:
+        return dict(zip(image_paths, executor.map(dhash_file, image_paths)))
@@ -0,0 +1,208 @@
+"""
+--profile mode for Main_scan_media.py.
+
+The scan code marks its stages with `with profiler.stage('extract', filepath):` (walk, hash,
+extract, geocode, db, thumbnail, sync, share_geo, aggregates, ...). When profiling is off,
+a stage costs one attribute check. When it is on, each stage collects:
+
+  * wall time and CPU time. CPU time is this thread's CPU plus the CPU of the child processes that
+    finished inside the stage (exiftool, ffprobe, ffmpeg), so a subprocess-bound stage shows up;
+  * self time, which excludes nested stages (e.g. thumbnail inside db when files are added one by one);
+  * per file type (extension) counts, totals and a latency histogram for stages run per file.
+
+The slowest files over all stages are kept as well. The report is written as <name>.json plus a
+flat <name>.csv, and cProfile can be limited to one stage and dumped to <name>.<stage>.prof.
+"""
+
+import cProfile
+import csv
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets, the last bucket is open-ended
+HISTOGRAM_BUCKETS = (0.001, 0.01, 0.1, 1.0, 10.0)
+
+
+def _bucket_labels():
+    labels = [f"<{bound * 1000:g}ms" if bound < 1 else f"<{bound:g}s" for bound in HISTOGRAM_BUCKETS]
+    return labels + [f">={HISTOGRAM_BUCKETS[-1]:g}s"]
+
+
+class _StageStats:
+    __slots__ = ('calls', 'wall', 'self_wall', 'cpu', 'by_type')
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.self_wall = 0.0
+        self.cpu = 0.0
+        self.by_type = {}   # {file type: [count, total wall, max wall, histogram counts]}
+
+    def add_file(self, file_type, wall):
+        stats = self.by_type.get(file_type)
+        if stats is None:
+            stats = self.by_type[file_type] = [0, 0.0, 0.0, [0] * (len(HISTOGRAM_BUCKETS) + 1)]
+        stats[0] += 1
+        stats[1] += wall
+        stats[2] = max(stats[2], wall)
+        bucket = 0
+        while bucket < len(HISTOGRAM_BUCKETS) and wall >= HISTOGRAM_BUCKETS[bucket]:
+            bucket += 1
+        stats[3][bucket] += 1
+
+
+class ScanProfiler:
+    def __init__(self):
+        self.enabled = False
+        self.cprofile_stage = None
+        self.slowest_count = 20
+        self._stages = {}
+        self._file_times = {}       # {filepath: total wall seconds over all stages}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cprofile = None
+        self._started = None
+
+    def enable(self, cprofile_stage=None, slowest_count=20):
+        self.enabled = True
+        self.cprofile_stage = cprofile_stage
+        self.slowest_count = slowest_count
+        self._started = (time.perf_counter(), time.process_time())
+        if cprofile_stage:
+            self._cprofile = cProfile.Profile()
+
+    @contextmanager
+    def stage(self, name, filepath=None):
+        if not self.enabled:
+            yield
+            return
+
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        frame = [0.0]                           # wall time of nested stages
+        stack.append(frame)
+        # cProfile follows the thread that enabled it, so only the main thread's stage is profiled
+        profile = None
+        if (name == self.cprofile_stage and not getattr(self._local, 'profiling', False)
+                and threading.current_thread() is threading.main_thread()):
+            profile = self._cprofile
+            self._local.profiling = True
+            profile.enable()
+
+        children_before = os.times()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall_start
+            cpu = time.thread_time() - cpu_start
+            if profile is not None:
+                profile.disable()
+                self._local.profiling = False
+            children_after = os.times()
+            cpu += (children_after.children_user - children_before.children_user
+                    + children_after.children_system - children_before.children_system)
+            stack.pop()
+            if stack:
+                stack[-1][0] += wall
+
+            with self._lock:
+                stats = self._stages.get(name)
+                if stats is None:
+                    stats = self._stages[name] = _StageStats()
+                stats.calls += 1
+                stats.wall += wall
+                stats.self_wall += wall - frame[0]
+                stats.cpu += cpu
+                if filepath:
+                    stats.add_file(os.path.splitext(filepath)[1].lower() or '(none)', wall)
+                    self._file_times[filepath] = self._file_times.get(filepath, 0.0) + wall - frame[0]
+
+    def iterate(self, name, iterable):
+        """Yield from iterable, timing how long each item takes to arrive (e.g. the directory walk)"""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def report(self):
+        total_wall = time.perf_counter() - self._started[0]
+        total_cpu = time.process_time() - self._started[1]
+        labels = _bucket_labels()
+        stages = {}
+        for name, stats in sorted(self._stages.items(), key=lambda item: -item[1].self_wall):
+            stages[name] = {
+                'calls': stats.calls,
+                'wall_s': round(stats.wall, 6),
+                'self_wall_s': round(stats.self_wall, 6),
+                'cpu_s': round(stats.cpu, 6),
+                'share_of_run': round(stats.self_wall / total_wall, 4) if total_wall else None,
+                'file_types': {
+                    file_type: {
+                        'count': count,
+                        'total_s': round(total, 6),
+                        'mean_ms': round(total / count * 1000, 3),
+                        'max_ms': round(maximum * 1000, 3),
+                        'histogram': dict(zip(labels, histogram)),
+                    }
+                    for file_type, (count, total, maximum, histogram) in sorted(stats.by_type.items())
+                },
+            }
+        slowest = heapq.nlargest(self.slowest_count, self._file_times.items(), key=lambda item: item[1])
+        return {
+            'wall_s': round(total_wall, 6),
+            'process_cpu_s': round(total_cpu, 6),
+            'stages': stages,
+            'slowest_files': [{'filepath': path, 'wall_s': round(wall, 6)} for path, wall in slowest],
+        }
+
+    def write_report(self, name):
+        """Write <name>.json and <name>.csv (and <name>.<stage>.prof), print a summary, return the report"""
+        report = self.report()
+        with open(f"{name}.json", 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+        labels = _bucket_labels()
+        with open(f"{name}.csv", 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['stage', 'file_type', 'calls', 'wall_s', 'self_wall_s', 'cpu_s', 'mean_ms', 'max_ms'] + labels)
+            for stage_name, stage in report['stages'].items():
+                writer.writerow([stage_name, '*', stage['calls'], stage['wall_s'], stage['self_wall_s'], stage['cpu_s'],
+                                 '', ''] + [''] * len(labels))
+                for file_type, stats in stage['file_types'].items():
+                    writer.writerow([stage_name, file_type, stats['count'], stats['total_s'], '', '',
+                                     stats['mean_ms'], stats['max_ms']] + list(stats['histogram'].values()))
+
+        if self._cprofile is not None:
+            prof_path = f"{name}.{self.cprofile_stage}.prof"
+            self._cprofile.dump_stats(prof_path)
+            logging.info(f"cProfile output of stage '{self.cprofile_stage}' written to {prof_path} "
+                         f"(view with: python -m pstats {prof_path})")
+
+        print(f"\nScan profile: {report['wall_s']:.2f}s wall, {report['process_cpu_s']:.2f}s CPU")
+        print(f"  {'stage':<14}{'calls':>8}{'wall s':>10}{'self s':>10}{'cpu s':>10}{'share':>8}")
+        for stage_name, stage in report['stages'].items():
+            share = f"{stage['share_of_run'] * 100:.1f}%" if stage['share_of_run'] is not None else ''
+            print(f"  {stage_name:<14}{stage['calls']:>8}{stage['wall_s']:>10.2f}{stage['self_wall_s']:>10.2f}"
+                  f"{stage['cpu_s']:>10.2f}{share:>8}")
+        if report['slowest_files']:
+            print("  Slowest files:")
+            for item in report['slowest_files'][:10]:
+                print(f"    {item['wall_s']:8.3f}s  {item['filepath']}")
+        logging.info(f"Scan profile written to {name}.json and {name}.csv")
+        return report
+
+
+# Shared by all scan modules, enabled by Main_scan_media.py --profile
+profiler = ScanProfiler()
@@ -4,143 +4,514 @@ This script will contain the functions for semantic video analysis, including:
 - Activity recognition (walking) - placeholder for now
 - Scenery classification - placeholder for now
 - Voice activity detection (talking) (using Silero VAD)
+
+The video is decoded once. ffmpeg samples frames at SAMPLE_FPS (or on scene changes), scales them
+down to ANALYSIS_WIDTH inside the decoder and pipes them as PPM images; every sampled frame is handed
+to each frame analyzer (people, pose, scenery), so the cost follows the number of sampled frames
+instead of the length and resolution of the clip. At a fixed rate only keyframes are decoded by
+default (phones and action cameras write one about every second), which skips decoding almost all of
+a 4K clip. Without ffmpeg, OpenCV decodes the video and only the sampled frames are converted and scaled.
+
+The soundtrack is decoded by a second ffmpeg process straight to 16 kHz mono PCM on a pipe and fed
+to Silero VAD in AUDIO_CHUNK_SECONDS chunks; once vad_prefilter.py has been calibrated, windows its
+NumPy pre-filter rules out as silence or steady noise never reach the model. Decoding stops as soon as MIN_SPEECH_MS of continuous
+speech is found, so a clip with talking near the start is not read to the end, and nothing is written
+to disk.
 '''
 
 import cv2
-from ultralytics import YOLO
-from pydub import AudioSegment
-import torch
+import numpy as np
+import functools
+import hashlib
+import json
+import logging
 import os
+import shutil
+import subprocess
+import tempfile
+import threading
+
+from model_registry import registry, configure_threads, TORCH_AVAILABLE, MEDIAPIPE_AVAILABLE
+from vad_prefilter import VoicePrefilter, load_thresholds, is_calibrated
+
+if TORCH_AVAILABLE:
+    import torch
+if MEDIAPIPE_AVAILABLE:
+    import mediapipe as mp
+
+# Bump when the analysis code changes its results, so the scanner's --analyze runs it again on every video
+ANALYZER_VERSION = 2
+# Decoder threads of the ffmpeg processes, 0 lets ffmpeg decide (set per pool worker by init_worker)
+FFMPEG_THREADS = 0
+# Seconds ffmpeg may take to deliver the next frame or audio chunk before it is killed (stalled
+# network share, decoder stuck on a broken file); the time the analyzers spend on a frame does not count
+FFMPEG_TIMEOUT = 300
+
+# analysis_status of a video: all steps ran, some step failed (the others' results are kept),
+# or the video could not be decoded (no results, retried by the next --analyze run)
+ANALYSIS_DONE = 'done'
+ANALYSIS_PARTIAL = 'partial'
+ANALYSIS_FAILED = 'failed'
+
+# Frames per YOLO call, stacked into one batch
+YOLO_BATCH = 8
+# Sampled frames per second of video, and their width in pixels (YOLO works at 640 anyway)
+SAMPLE_FPS = 1.0
+ANALYSIS_WIDTH = 640
+# Decode only the keyframes when sampling at a fixed rate
+KEYFRAMES_ONLY = True
+# Scene-change score (0-1) above which ffmpeg samples a frame, in scene sampling mode
+SCENE_THRESHOLD = 0.3
+# Voice activity detection: Silero VAD works on 512-sample windows of 16 kHz audio
+AUDIO_RATE = 16000
+VAD_WINDOW = 512
+VAD_THRESHOLD = 0.5
+# Continuous speech that counts as talking, and the audio read from the pipe at a time
+MIN_SPEECH_MS = 250
+AUDIO_CHUNK_SECONDS = 2
+# Skip the windows the NumPy pre-filter rules out (silence, steady noise) instead of running VAD on them.
+# None uses it only when vad_prefilter.json holds thresholds calibrated on labelled clips, as the
+# defaults are not tuned for any camera; True or False turn it on or off regardless
+VAD_PREFILTER = None
+
+
+def _read_ppm(stream):
+    """Read one binary PPM (P6) image from the pipe as an RGB array, None at the end of the stream"""
+    fields = []
+    while len(fields) < 4:
+        line = stream.readline()
+        if not line:
+            return None
+        fields.extend(line.split(b'#')[0].split())
+    width, height = int(fields[1]), int(fields[2])
+    data = stream.read(width * height * 3)
+    if len(data) < width * height * 3:
+        return None
+    return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+
+
+class _Watchdog:
+    """Kills the process when a read inside `with watchdog:` takes longer than FFMPEG_TIMEOUT"""
+
+    def __init__(self, process):
+        self.process = process
+        self.fired = False
+        self._timer = None
+
+    def _kill(self):
+        self.fired = True
+        # A killed ffmpeg closes its end of the pipe, so the blocked read returns
+        self.process.kill()
+
+    def __enter__(self):
+        self._timer = threading.Timer(FFMPEG_TIMEOUT, self._kill)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def __exit__(self, *exc):
+        self._timer.cancel()
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def _vfr_args(ffmpeg):
+    """Variable frame rate output: -fps_mode needs ffmpeg 5.1 or newer, older builds only know -vsync"""
+    try:
+        options = subprocess.run([ffmpeg, '-hide_banner', '-h', 'long'], capture_output=True, timeout=30).stdout
+    except (OSError, subprocess.SubprocessError):
+        options = b''
+    return ['-fps_mode', 'vfr'] if b'-fps_mode' in options else ['-vsync', 'vfr']
+
+
+def _ffmpeg_frames(ffmpeg, video_path, sample_fps, scene_threshold, keyframes, width):
+    decode = []
+    if scene_threshold:
+        # First frame, then every frame that differs enough from the previous one
+        sampler = f"select='eq(n\\,0)+gt(scene\\,{scene_threshold})'"
+    elif keyframes:
+        # The decoder skips all but the keyframes, of which one per 1/sample_fps seconds at most is kept
+        decode = ['-skip_frame', 'nokey']
+        sampler = f"select='isnan(prev_selected_t)+gte(t-prev_selected_t\\,{1 / sample_fps})'"
+    else:
+        sampler = f"fps={sample_fps}"
+    cmd = [ffmpeg, '-v', 'error', '-nostdin', '-threads', str(FFMPEG_THREADS)] + decode + [
+           '-i', video_path, '-an', '-sn', '-dn',
+           '-vf', f"{sampler},scale={width}:-2"] + _vfr_args(ffmpeg) + ['-f', 'image2pipe', '-vcodec', 'ppm', '-']
+    # stderr goes to a file: a pipe nobody reads while stdout is consumed would fill up and block ffmpeg
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=errors)
+        watchdog = _Watchdog(process)
+        try:
+            while True:
+                with watchdog:
+                    frame = _read_ppm(process.stdout)
+                if frame is None:
+                    break
+                yield frame
+        finally:
+            process.stdout.close()
+            process.kill()
+            process.wait()
+            if watchdog.fired:
+                logging.warning(f"ffmpeg stalled for {FFMPEG_TIMEOUT}s decoding {video_path} and was stopped, "
+                                f"only the frames read until then are analyzed.")
+            elif process.returncode not in (0, -9):
+                errors.seek(0)
+                stderr = errors.read().decode(errors='replace').strip()
+                if stderr:
+                    logging.warning(f"ffmpeg could not decode all of {video_path}: {stderr}")
+
+
+def _opencv_frames(video_path, sample_fps, width):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        step = max(1, round((cap.get(cv2.CAP_PROP_FPS) or 30) / sample_fps))
+        index = 0
+        # grab() only decodes; the conversion to BGR and the resize are done for the sampled frames
+        while cap.grab():
+            if index % step == 0:
+                ret, frame = cap.retrieve()
+                if not ret:
+                    break
+                height = round(frame.shape[0] * width / frame.shape[1] / 2) * 2
+                frame = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+                yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            index += 1
+    finally:
+        cap.release()
+
+
+def sample_frames(video_path, sample_fps=SAMPLE_FPS, scene_threshold=None, keyframes=KEYFRAMES_ONLY,
+                  width=ANALYSIS_WIDTH):
+    """
+    Yield the sampled frames of the video as RGB arrays ANALYSIS_WIDTH wide: up to sample_fps frames
+    per second (keyframes only if keyframes is set), or the frames of the scene changes when
+    scene_threshold is set (ffmpeg only).
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg:
+        return _ffmpeg_frames(ffmpeg, video_path, sample_fps, scene_threshold, keyframes, width)
+    if scene_threshold:
+        logging.warning("ffmpeg not found, frames are sampled at a fixed rate instead of on scene changes.")
+    return _opencv_frames(video_path, sample_fps, width)
+
+
+class PeopleAnalyzer:
+    """Largest number of people (YOLO, COCO class 0) in one sampled frame"""
+    name = 'people detection'
+
+    def __init__(self, video_path):
+        self.model = registry.yolo()  # Pre-trained YOLO model, loaded once per process
+        self.available = self.model is not None
+        self.max_people = 0
+        self.batch = []
+
+    def update(self, frame):
+        # ultralytics expects BGR arrays
+        self.batch.append(frame[:, :, ::-1])
+        if len(self.batch) == YOLO_BATCH:
+            self._detect()
+
+    def _detect(self):
+        # Perform object detection on the stacked frames
+        results = self.model(self.batch, classes=[0], verbose=False) # Class 0 is 'person' in COCO dataset
+        self.batch = []
+        self.max_people = max([self.max_people] + [len(result.boxes) for result in results])
+
+    def finish(self, analysis_results):
+        if self.batch:
+            self._detect()
+        analysis_results["people_count"] = self.max_people
+
+
+class PoseAnalyzer:
+    """Walking, from the hip/knee landmarks of the sampled frames"""
+    name = 'activity recognition'
+
+    def __init__(self, video_path):
+        self.pose = registry.pose()  # MediaPipe pose, created once per process
+        self.available = self.pose is not None
+        self.frame_count = 0
+        self.walking_frames = 0
+
+    def update(self, frame):
+        self.frame_count += 1
+        results = self.pose.process(frame)
+        if results.pose_landmarks:
+            # Simple heuristic for walking: check for movement in hip/knee landmarks
+            # This is a very basic placeholder and would need more sophisticated logic
+            # for accurate walking detection.
+            landmarks = results.pose_landmarks.landmark
+            landmark = mp.solutions.pose.PoseLandmark
+            left_hip, right_hip = landmarks[landmark.LEFT_HIP], landmarks[landmark.RIGHT_HIP]
+            left_knee, right_knee = landmarks[landmark.LEFT_KNEE], landmarks[landmark.RIGHT_KNEE]
+
+            # Check for vertical movement of hips or knees as a proxy for walking
+            # This is highly simplified and would need state tracking over frames for real detection
+            if (abs(left_hip.y - right_hip.y) > 0.01 or
+                abs(left_knee.y - right_knee.y) > 0.01): # Arbitrary threshold
+                self.walking_frames += 1
+
+    def finish(self, analysis_results):
+        if self.frame_count > 0 and (self.walking_frames / self.frame_count) > 0.1: # If walking detected in >10% of frames
+            analysis_results["activities"].append("walking")
+
+
+class SceneryAnalyzer:
+    """
+    Scenery classification (placeholder). This would require more complex models and training data;
+    for now the file name decides, a keyframe classifier would go into update().
+    """
+    name = 'scenery classification'
+    available = True
+    needs_frames = False
+
+    def __init__(self, video_path):
+        self.video_path = video_path
 
-def analyze_video(video_path):
+    def update(self, frame):
+        pass
+
+    def finish(self, analysis_results):
+        if "city" in self.video_path.lower():
+            analysis_results["scenery"].append("city_walk")
+        elif "mountain" in self.video_path.lower() or "hiking" in self.video_path.lower():
+            analysis_results["scenery"].append("hiking")
+        else:
+            analysis_results["scenery"].append("general_scenery")
+
+
+# Every sampled frame is passed to each of these
+FRAME_ANALYZERS = [PeopleAnalyzer, PoseAnalyzer, SceneryAnalyzer]
+
+
+def audio_chunks(video_path, chunk_seconds=AUDIO_CHUNK_SECONDS):
+    """
+    Yield the soundtrack as float32 arrays of chunk_seconds of 16 kHz mono audio (the last one shorter),
+    decoded by ffmpeg onto a pipe. Closing the generator stops ffmpeg.
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        logging.warning("ffmpeg not found, voice activity detection is skipped.")
+        return
+    cmd = [ffmpeg, '-v', 'error', '-nostdin', '-threads', str(FFMPEG_THREADS), '-i', video_path,
+           '-vn', '-sn', '-dn', '-ac', '1', '-ar', str(AUDIO_RATE), '-f', 's16le', '-']
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    watchdog = _Watchdog(process)
+    chunk_bytes = int(chunk_seconds * AUDIO_RATE) * 2
+    try:
+        while True:
+            with watchdog:
+                data = process.stdout.read(chunk_bytes)
+            if len(data) < 2:
+                break
+            yield np.frombuffer(data[:len(data) // 2 * 2], dtype=np.int16).astype(np.float32) / 32768.0
+    finally:
+        process.stdout.close()
+        process.kill()
+        process.wait()
+
+
+def speech_windows():
+    """Consecutive VAD windows that make MIN_SPEECH_MS"""
+    return max(1, MIN_SPEECH_MS * AUDIO_RATE // 1000 // VAD_WINDOW)
+
+
+def prefilter_enabled():
+    """Whether detect_speech() runs the pre-filter, see VAD_PREFILTER"""
+    return is_calibrated() if VAD_PREFILTER is None else VAD_PREFILTER
+
+
+def _vad_windows(chunks, voice_prefilter):
+    """(window, send to the model) of the VAD_WINDOW windows of the audio chunks, in order"""
+    pending = np.zeros(0, dtype=np.float32)
+    for chunk in chunks:
+        pending = np.concatenate((pending, chunk))
+        usable = len(pending) // VAD_WINDOW * VAD_WINDOW
+        windows = pending[:usable].reshape(-1, VAD_WINDOW)
+        if voice_prefilter:
+            yield from zip(*voice_prefilter.candidates(windows))
+        else:
+            yield from ((window, True) for window in windows)
+        pending = pending[usable:]
+    if voice_prefilter:
+        yield from zip(*voice_prefilter.flush())
+
+
+def detect_speech(video_path, model, prefilter=None):
+    """
+    True once MIN_SPEECH_MS of continuous speech is found in the soundtrack, reading no further.
+    With prefilter (default: prefilter_enabled()), only the windows VoicePrefilter lets through are
+    run through the model.
+    """
+    if prefilter is None:
+        prefilter = prefilter_enabled()
+    needed = speech_windows()
+    voice_prefilter = VoicePrefilter() if prefilter else None
+    model.reset_states()
+    fresh = True
+    run = 0
+    chunks = audio_chunks(video_path)
+    try:
+        with torch.inference_mode():
+            for window, sent in _vad_windows(chunks, voice_prefilter):
+                if not sent:
+                    run = 0
+                    fresh = False
+                    continue
+                if not fresh:
+                    # The model keeps context between windows; start over after a skipped stretch
+                    model.reset_states()
+                    fresh = True
+                if model(torch.from_numpy(window), AUDIO_RATE).item() >= VAD_THRESHOLD:
+                    run += 1
+                    if run >= needed:
+                        return True
+                else:
+                    run = 0
+    finally:
+        chunks.close()
+        if voice_prefilter:
+            logging.debug("%s: %d of %d audio windows sent to VAD", video_path, voice_prefilter.sent,
+                          voice_prefilter.windows)
+    return False
+
+
+def analyze_video(video_path, sample_fps=SAMPLE_FPS, scene_threshold=None, keyframes=KEYFRAMES_ONLY,
+                  width=ANALYSIS_WIDTH):
     """
     Performs semantic analysis on a video file.
 
     Args:
         video_path (str): The path to the video file.
+        sample_fps (float): Frames per second handed to the frame analyzers.
+        scene_threshold (float): Sample on scene changes above this score instead, e.g. SCENE_THRESHOLD.
+        keyframes (bool): Decode only keyframes when sampling at a fixed rate.
+        width (int): Width the sampled frames are scaled to.
 
     Returns:
-        dict: A dictionary containing the analysis results.
+        dict: A dictionary containing the analysis results, plus the number of frames decoded
+        ("sampled_frames") and the names of the analysis steps that failed ("errors").
     """
     analysis_results = {
         "people_count": 0,
         "activities": [],
         "scenery": [],
-        "talking_detected": False
+        "talking_detected": False,
+        "sampled_frames": 0,
+        "errors": []
     }
 
-    # --- People Detection ---
-    try:
-        model = YOLO('yolov8n.pt')  # Load a pre-trained YOLO model
-        cap = cv2.VideoCapture(video_path)
-        max_people = 0
+    # --- People Detection, Activity Recognition (Walking) and Scenery Classification ---
+    analyzers = []
+    for analyzer_class in FRAME_ANALYZERS:
+        try:
+            analyzer = analyzer_class(video_path)
+            if analyzer.available:
+                analyzers.append(analyzer)
+        except Exception as e:
+            logging.error(f"Error during {analyzer_class.name} for {video_path}: {e}")
+            analysis_results["errors"].append(analyzer_class.name)
 
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
+    # One decode of the video for all analyzers. When none of them looks at the frames, the first
+    # frame is still decoded, so an unreadable video is not reported as analyzed.
+    frame_analyzers = any(getattr(analyzer, 'needs_frames', True) for analyzer in analyzers)
+    try:
+        frames = sample_frames(video_path, sample_fps, scene_threshold, keyframes, width)
+        for frame in frames:
+            analysis_results["sampled_frames"] += 1
+            if not frame_analyzers:
+                frames.close()
                 break
-
-            # Perform object detection on the frame
-            results = model(frame, classes=[0]) # Class 0 is 'person' in COCO dataset
-            
-            # Get the number of detected people in the current frame
-            num_people = len(results[0].boxes)
-            if num_people > max_people:
-                max_people = num_people
-
-        analysis_results["people_count"] = max_people
-        cap.release()
-
+            for analyzer in list(analyzers):
+                try:
+                    analyzer.update(frame)
+                except Exception as e:
+                    # One failing analyzer does not stop the others
+                    logging.error(f"Error during {analyzer.name} for {video_path}: {e}")
+                    analysis_results["errors"].append(analyzer.name)
+                    analyzers.remove(analyzer)
     except Exception as e:
-        print(f"Error during people detection for {video_path}: {e}")
+        logging.error(f"Error decoding {video_path}: {e}")
+    if not analysis_results["sampled_frames"]:
+        logging.error(f"No frame could be decoded from {video_path}")
+
+    for analyzer in analyzers:
+        try:
+            analyzer.finish(analysis_results)
+        except Exception as e:
+            logging.error(f"Error during {analyzer.name} for {video_path}: {e}")
+            analysis_results["errors"].append(analyzer.name)
 
     # --- Voice Activity Detection (Talking) ---
     try:
-        # Extract audio from video
-        audio = AudioSegment.from_file(video_path, format=video_path.split('.')[-1])
-        audio.export("temp_audio.wav", format="wav")
+        # Silero VAD model, loaded once per process
+        model = registry.vad()
+        if model is not None:
+            analysis_results["talking_detected"] = detect_speech(video_path, model)
+
+    except Exception as e:
+        logging.error(f"Error during voice activity detection for {video_path}: {e}")
+        analysis_results["errors"].append('voice activity detection')
 
-        # Load Silero VAD model
-        model, utils = torch.hub.load(repo_or_dir='snakers4/silero-vad', model='silero_vad', force_reload=True)
-        (get_speech_timestamps, _, read_audio, _, _) = utils
+    return analysis_results
 
-        wav = read_audio("temp_audio.wav", sampling_rate=16000)
-        speech_timestamps = get_speech_timestamps(wav, model, sampling_rate=16000)
+def analysis_version(sample_fps=SAMPLE_FPS, scene_threshold=None, keyframes=KEYFRAMES_ONLY):
+    """
+    Version stamp of the analysis results: ANALYZER_VERSION plus a hash of the models and the
+    sampling (analyze_video() arguments) / voice detection settings. Rows analyzed under another
+    stamp are analyzed again.
+    """
+    settings = {
+        'models': registry.stamp(),
+        'frames': [sample_fps, keyframes, ANALYSIS_WIDTH],
+        'vad': [VAD_THRESHOLD, MIN_SPEECH_MS, prefilter_enabled() and load_thresholds()],
+    }
+    if scene_threshold:
+        # Scene sampling ignores the rate and keyframe settings
+        settings['frames'] = ['scene', scene_threshold, ANALYSIS_WIDTH]
+    digest = hashlib.blake2b(json.dumps(settings, sort_keys=True).encode('utf-8'), digest_size=6).hexdigest()
+    return f"{ANALYZER_VERSION}:{digest}"
 
-        if speech_timestamps:
-            analysis_results["talking_detected"] = True
 
-        os.remove("temp_audio.wav")
+def init_worker(threads, log_level=logging.INFO):
+    """Process pool initializer: limit the torch, OpenCV and ffmpeg threads of the worker to threads"""
+    global FFMPEG_THREADS
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    FFMPEG_THREADS = threads
+    configure_threads(threads)
+    cv2.setNumThreads(threads)
 
-    except Exception as e:
-        print(f"Error during voice activity detection for {video_path}: {e}")
 
-    # --- Activity Recognition (Walking) and Scenery Classification (Placeholders) ---
-    # These would require more complex models and training data.
-    # For now, we'll add placeholder logic.
-    # --- Activity Recognition (Walking) ---
-    try:
-        mp_pose = mp.solutions.pose
-        pose = mp_pose.Pose(min_detection_confidence=0.5, min_tracking_confidence=0.5)
-
-        cap = cv2.VideoCapture(video_path)
-        frame_count = 0
-        walking_frames = 0
-        
-        while cap.isOpened():
-            ret, frame = cap.read()
-            if not ret:
-                break
-            frame_count += 1
-
-            # Convert the BGR image to RGB.
-            image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            image.flags.writeable = False
-
-            # Process the image and find poses.
-            results = pose.process(image)
-
-            # Draw the pose annotation on the image.
-            image.flags.writeable = True
-            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
-
-            if results.pose_landmarks:
-                # Simple heuristic for walking: check for movement in hip/knee landmarks
-                # This is a very basic placeholder and would need more sophisticated logic
-                # for accurate walking detection.
-                left_hip = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_HIP]
-                right_hip = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_HIP]
-                left_knee = results.pose_landmarks.landmark[mp_pose.PoseLandmark.LEFT_KNEE]
-                right_knee = results.pose_landmarks.landmark[mp_pose.PoseLandmark.RIGHT_KNEE]
-
-                # Check for vertical movement of hips or knees as a proxy for walking
-                # This is highly simplified and would need state tracking over frames for real detection
-                if (abs(left_hip.y - right_hip.y) > 0.01 or 
-                    abs(left_knee.y - right_knee.y) > 0.01): # Arbitrary threshold
-                    walking_frames += 1
-        
-        cap.release()
+def analysis_status(analysis_results):
+    """ANALYSIS_FAILED if nothing could be decoded, ANALYSIS_PARTIAL if an analysis step failed, else ANALYSIS_DONE"""
+    if not analysis_results["sampled_frames"]:
+        return ANALYSIS_FAILED
+    return ANALYSIS_PARTIAL if analysis_results["errors"] else ANALYSIS_DONE
 
-        if frame_count > 0 and (walking_frames / frame_count) > 0.1: # If walking detected in >10% of frames
-            analysis_results["activities"].append("walking")
 
+def analyze_file(task, sample_fps=SAMPLE_FPS, scene_threshold=None, keyframes=KEYFRAMES_ONLY):
+    """
+    Pool task: (media_id, video_path) -> (media_id, analysis results or None, status, error or None).
+    The sampling arguments are passed on to analyze_video(). The results of a failed analysis are None.
+    """
+    media_id, video_path = task
+    try:
+        analysis_results = analyze_video(video_path, sample_fps, scene_threshold, keyframes)
     except Exception as e:
-        print(f"Error during activity recognition for {video_path}: {e}")
-
-    # --- Scenery Classification (Placeholder) ---
-    # This would require more complex models and training data.
-    # For now, we'll add a placeholder based on file name or other simple heuristics.
-    # In a real scenario, this would involve image classification on keyframes.
-    if "city" in video_path.lower():
-        analysis_results["scenery"].append("city_walk")
-    elif "mountain" in video_path.lower() or "hiking" in video_path.lower():
-        analysis_results["scenery"].append("hiking")
-    else:
-        analysis_results["scenery"].append("general_scenery")
+        return media_id, None, ANALYSIS_FAILED, str(e)
+    status = analysis_status(analysis_results)
+    if status == ANALYSIS_FAILED:
+        return media_id, None, status, "no frame could be decoded"
+    if status == ANALYSIS_PARTIAL:
+        return media_id, analysis_results, status, f"failed steps: {', '.join(analysis_results['errors'])}"
+    return media_id, analysis_results, status, None
 
-    return analysis_results
 
 if __name__ == '__main__':
+    # CPU-only machine: one torch thread per core
+    configure_threads(os.cpu_count())
+
     # Example Usage (replace with an actual video file path)
     # Create a dummy video file for testing purposes
     dummy_video_path = "test_video.mp4"
@@ -148,7 +519,7 @@ if __name__ == '__main__':
     with open(dummy_video_path, "w") as f:
         pass # Create an empty file
 
-    # Since we can't run a full analysis on a dummy file, 
+    # Since we can't run a full analysis on a dummy file,
     # this will likely error out, but it demonstrates the structure.
     try:
         video_analysis = analyze_video(dummy_video_path)
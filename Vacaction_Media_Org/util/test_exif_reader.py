@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test the native EXIF reader on JPEG and HEIC files written by Pillow / pillow-heif:
+GPS hemisphere references, orientation, size and camera fields, and the ExifTool fallback
+(read_exif() returns None) for files without EXIF. The HEIC cases need pillow-heif to write the
+test files and are skipped without it.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+from PIL import Image
+from PIL.TiffImagePlugin import IFDRational
+
+# The scanner modules are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exif_reader import read_exif
+
+CREATE_DATE = '2024:07:14 09:30:15'
+
+
+def dms(value):
+    """Degrees as the (degrees, minutes, seconds) rationals of a GPS coordinate"""
+    degrees = int(value)
+    minutes = int((value - degrees) * 60)
+    seconds = round(((value - degrees) * 60 - minutes) * 60 * 100)
+    return (IFDRational(degrees, 1), IFDRational(minutes, 1), IFDRational(seconds, 100))
+
+
+def build_exif(latitude=None, longitude=None, orientation=1):
+    exif = Image.Exif()
+    exif[0x010F] = 'TestMake'                   # Make
+    exif[0x0110] = 'TestModel'                  # Model
+    exif[0x0112] = orientation                  # Orientation
+    exif.get_ifd(0x8769)[0x9004] = CREATE_DATE  # CreateDate (DateTimeDigitized)
+    if latitude is not None:
+        gps = exif.get_ifd(0x8825)
+        gps[1] = 'S' if latitude < 0 else 'N'
+        gps[2] = dms(abs(latitude))
+        gps[3] = 'W' if longitude < 0 else 'E'
+        gps[4] = dms(abs(longitude))
+    return exif
+
+
+def heif_writer():
+    """Let Pillow save .heic files (skips the test when pillow-heif is not installed)"""
+    pytest.importorskip("pillow_heif").register_heif_opener()
+
+
+def write_image(directory, name, exif=None, size=(128, 64)):
+    path = os.path.join(directory, name)
+    image = Image.new('RGB', size, (200, 120, 40))
+    if exif is None:
+        image.save(path)
+    else:
+        image.save(path, exif=exif.tobytes())
+    return path
+
+
+def check_fields(path, latitude, longitude, orientation, size):
+    fields = read_exif(path)
+    assert fields is not None, f"native reader failed on {path}"
+    assert fields['CreateDate'] == CREATE_DATE, fields
+    assert fields['Make'] == 'TestMake' and fields['Model'] == 'TestModel', fields
+    assert fields['Orientation'] == orientation, fields
+    assert (fields['ImageWidth'], fields['ImageHeight']) == size, fields
+    if latitude is None:
+        assert fields['Latitude'] is None and fields['Longitude'] is None, fields
+    else:
+        assert abs(fields['Latitude'] - latitude) < 1e-5, fields
+        assert abs(fields['Longitude'] - longitude) < 1e-5, fields
+
+
+def check_gps_references(extension):
+    """Southern and western coordinates are negative, northern and eastern positive"""
+    with tempfile.TemporaryDirectory() as directory:
+        for latitude, longitude in ((-33.856784, 151.215297), (40.689247, -74.044502),
+                                    (-22.951916, -43.210487), (22.302711, 114.177216)):
+            name = f"gps_{latitude}_{longitude}{extension}"
+            path = write_image(directory, name, build_exif(latitude, longitude))
+            check_fields(path, latitude, longitude, 1, (128, 64))
+    print(f"GPS references ({extension}): OK")
+
+
+def check_orientation(extension):
+    with tempfile.TemporaryDirectory() as directory:
+        for orientation in (1, 3, 6, 8):
+            path = write_image(directory, f"orientation_{orientation}{extension}",
+                               build_exif(orientation=orientation))
+            check_fields(path, None, None, orientation, (128, 64))
+    print(f"Orientation ({extension}): OK")
+
+
+def check_no_exif_fallback(extension):
+    """Files without EXIF (or without CreateDate) are left to ExifTool"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_image(directory, f"plain{extension}")
+        assert read_exif(path) is None, path
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        path = write_image(directory, f"no_date{extension}", exif)
+        assert read_exif(path) is None, path
+    print(f"No EXIF fallback ({extension}): OK")
+
+
+def test_jpeg():
+    check_gps_references('.jpg')
+    check_orientation('.jpg')
+    check_no_exif_fallback('.jpg')
+
+
+def test_heic():
+    heif_writer()
+    check_gps_references('.heic')
+    check_orientation('.heic')
+    check_no_exif_fallback('.heic')
+
+
+def test_other_formats():
+    """Only JPEG and HEIC are read natively"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = write_image(directory, "other.png", build_exif())
+        assert read_exif(path) is None, path
+    print("Other formats: OK")
+
+
+if __name__ == "__main__":
+    test_jpeg()
+    test_heic()
+    test_other_formats()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Test that GeoShards.nearest() finds the same place as a brute-force search of the whole geo list,
+on a random list with clusters, poles and places on both sides of the antimeridian. The memory cap
+is small enough that shards are evicted and loaded again during the run.
+"""
+import os
+import random
+import sys
+import tempfile
+
+# The scanner modules are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo_shards import GeoShards, haversine_km
+
+HEADER = ('City_en,City_zn,Region_en,Region_zn,Subregion_en,Subregion_zn,CountryCode,Country_en,Country_zn,'
+          'TimeZone,Latitude,Longitude')
+PLACES = 3000
+QUERIES = 300
+
+
+def random_places(rng):
+    places = []
+    # A few dense clusters (cities), and places spread over the globe
+    centers = [(22.3, 114.2), (-33.9, 151.2), (51.5, -0.1), (64.1, -21.9), (-17.7, 178.0), (65.0, -179.5)]
+    for i in range(PLACES):
+        if i % 3 == 0:
+            lat, lon = rng.choice(centers)
+            lat, lon = lat + rng.gauss(0, 0.5), lon + rng.gauss(0, 0.5)
+        else:
+            lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        lat = max(-90.0, min(90.0, lat))
+        lon = (lon + 180) % 360 - 180
+        places.append((round(lat, 5), round(lon, 5)))
+    # Both sides of the antimeridian and the poles
+    places += [(0.0, 179.999), (0.0, -179.999), (89.99, 10.0), (-89.99, -170.0)]
+    return places
+
+
+def write_geo_list(path, places):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(HEADER + '\n')
+        for i, (lat, lon) in enumerate(places):
+            f.write(f"City{i},城市{i},Reg,区,Sub,次,CC,Country,国,UTC,{lat},{lon}\n")
+
+
+def brute_force(places, lat, lon):
+    return min(haversine_km(lat, lon, place_lat, place_lon) for place_lat, place_lon in places)
+
+
+def test_nearest_matches_brute_force():
+    rng = random.Random(45)
+    places = random_places(rng)
+    with tempfile.TemporaryDirectory() as directory:
+        geo_list = os.path.join(directory, 'geo_test.list')
+        write_geo_list(geo_list, places)
+        shards = GeoShards(geo_list, memory_mb=0.02, shard_degrees=10)
+        assert shards.count == len(places), shards.count
+
+        queries = [(rng.uniform(-90, 90), rng.uniform(-180, 180)) for _ in range(QUERIES)]
+        queries += [(0.0, 180.0), (0.0, -180.0), (90.0, 0.0), (-90.0, 0.0), (22.3, 114.2), (65.0, 179.9)]
+        for lat, lon in queries:
+            row, distance = shards.nearest(lat, lon)
+            expected = brute_force(places, lat, lon)
+            assert row is not None, (lat, lon)
+            assert abs(distance - expected) < 1e-6, (lat, lon, row, distance, expected)
+            assert abs(haversine_km(lat, lon, row[0], row[1]) - distance) < 1e-6, (lat, lon, row)
+        assert shards.evictions > 0, shards.summary()
+        print(f"{len(queries)} lookups match the brute-force search. {shards.summary()}")
+
+
+def test_index_reused_and_rebuilt():
+    """The shards are built once, and again when the geo list changes"""
+    rng = random.Random(7)
+    places = random_places(rng)[:200]
+    with tempfile.TemporaryDirectory() as directory:
+        geo_list = os.path.join(directory, 'geo_test.list')
+        write_geo_list(geo_list, places)
+        version = GeoShards(geo_list).version
+        assert GeoShards(geo_list).version == version
+
+        write_geo_list(geo_list, places + [(10.0, 10.0)])
+        shards = GeoShards(geo_list)
+        assert shards.version != version
+        assert shards.count == len(places) + 1
+        row, distance = shards.nearest(10.0, 10.0)
+        assert distance < 1e-6, (row, distance)
+    print("Geo shard index reuse and rebuild: OK")
+
+
+if __name__ == "__main__":
+    test_nearest_matches_brute_force()
+    test_index_reused_and_rebuilt()
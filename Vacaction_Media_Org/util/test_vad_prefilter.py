@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Test that the streamed VAD pre-filter sends the same windows as the pre-filter run on the whole clip
+at once, in particular the CONTEXT_WINDOWS around a speech window that sits on a chunk boundary.
+The thresholds only keep the energy test, so a loud window in a silent clip is the speech window.
+"""
+import os
+import sys
+
+import numpy as np
+
+# The scanner modules are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vad_prefilter import (CONTEXT_WINDOWS, WINDOW, VoicePrefilter, candidate_mask, window_features)
+
+THRESHOLDS = {'silence_db': -30.0, 'zcr_max': 1.0, 'flux_min': 0.0}
+CLIP_WINDOWS = 24
+
+
+def clip(loud):
+    """Silent clip of CLIP_WINDOWS windows with noise in the windows listed in loud"""
+    rng = np.random.default_rng(49)
+    windows = np.zeros((CLIP_WINDOWS, WINDOW), dtype=np.float32)
+    for index in loud:
+        windows[index] = rng.uniform(-0.5, 0.5, WINDOW)
+    return windows
+
+
+def streamed(windows, chunk_sizes):
+    """Run VoicePrefilter over windows split into chunks, returns (windows, mask) in stream order"""
+    prefilter = VoicePrefilter(THRESHOLDS)
+    sent_windows, masks = [], []
+    start = 0
+    for size in chunk_sizes:
+        released, mask = prefilter.candidates(windows[start:start + size])
+        sent_windows.append(released)
+        masks.append(mask)
+        start += size
+    released, mask = prefilter.flush()
+    sent_windows.append(released)
+    masks.append(mask)
+    assert prefilter.windows == len(windows), prefilter.windows
+    return np.concatenate(sent_windows), np.concatenate(masks)
+
+
+def test_speech_on_chunk_boundary():
+    """A speech window on either side of a chunk boundary widens into the other chunk"""
+    chunk_sizes = [10, 10, 4]
+    for loud in ([9], [10], [0], [23], [8, 11]):
+        windows = clip(loud)
+        expected = candidate_mask(*window_features(windows)[:3], THRESHOLDS)
+        sent_windows, mask = streamed(windows, chunk_sizes)
+        assert np.array_equal(sent_windows, windows), loud
+        assert np.array_equal(mask, expected), (loud, mask.astype(int), expected.astype(int))
+        for index in loud:
+            context = range(max(0, index - CONTEXT_WINDOWS), min(CLIP_WINDOWS, index + CONTEXT_WINDOWS + 1))
+            assert mask[list(context)].all(), (loud, mask.astype(int))
+    print("Speech on a chunk boundary: OK")
+
+
+def test_chunks_smaller_than_context():
+    windows = clip([5, 6, 17])
+    expected = candidate_mask(*window_features(windows)[:3], THRESHOLDS)
+    for chunk_sizes in ([1] * CLIP_WINDOWS, [3, 1, 2, 7, 1, 10], [CLIP_WINDOWS]):
+        sent_windows, mask = streamed(windows, chunk_sizes)
+        assert np.array_equal(sent_windows, windows), chunk_sizes
+        assert np.array_equal(mask, expected), (chunk_sizes, mask.astype(int), expected.astype(int))
+    print("Chunks smaller than the context: OK")
+
+
+if __name__ == "__main__":
+    test_speech_on_chunk_boundary()
+    test_chunks_smaller_than_context()
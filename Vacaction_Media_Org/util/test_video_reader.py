@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+Test the native MP4/MOV reader on small box trees built in memory: mvhd and mdhd in version 0 and 1,
+the tkhd rotation matrix, the frame rate from stts, ©xyz and meta/keys + ilst locations, QuickTime
+and MP4 'meta' boxes, and files whose boxes run past their parent (read_video_metadata() returns None).
+"""
+import math
+import os
+import struct
+import sys
+import tempfile
+from datetime import datetime
+
+# The scanner modules are in the parent directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from video_reader import ISO6709_KEY, read_video_metadata
+
+CREATE_DATE = '2024:07:14 09:30:15'
+# Seconds since 1904-01-01, the QuickTime epoch
+CREATED = int((datetime(2024, 7, 14, 9, 30, 15) - datetime(1904, 1, 1)).total_seconds())
+
+
+def box(box_type, *children):
+    payload = b''.join(children)
+    return struct.pack('>L4s', 8 + len(payload), box_type) + payload
+
+
+def full_box(box_type, version, *children):
+    return box(box_type, bytes([version, 0, 0, 0]), *children)
+
+
+def mvhd(version=0, timescale=1000, duration=12500):
+    if version == 1:
+        times = struct.pack('>QQLQ', CREATED, CREATED, timescale, duration)
+    else:
+        times = struct.pack('>LLLL', CREATED, CREATED, timescale, duration)
+    # rate, volume, reserved, matrix, pre_defined, next track id
+    return full_box(b'mvhd', version, times, bytes(80))
+
+
+def tkhd(rotation=0, width=1920, height=1080, version=0):
+    if version == 1:
+        times = struct.pack('>QQLLQ', CREATED, CREATED, 1, 0, 12500)
+    else:
+        times = struct.pack('>LLLLL', CREATED, CREATED, 1, 0, 12500)
+    cos = round(math.cos(math.radians(rotation)) * 65536)
+    sin = round(math.sin(math.radians(rotation)) * 65536)
+    matrix = struct.pack('>9l', cos, sin, 0, -sin, cos, 0, 0, 0, 1 << 30)
+    return full_box(b'tkhd', version, times, bytes(16), matrix, struct.pack('>LL', width << 16, height << 16))
+
+
+def hdlr(handler):
+    return full_box(b'hdlr', 0, bytes(4), handler, bytes(12), b'\x00')
+
+
+def mdhd(version=0, timescale=30000, duration=375000):
+    if version == 1:
+        times = struct.pack('>QQLQ', CREATED, CREATED, timescale, duration)
+    else:
+        times = struct.pack('>LLLL', CREATED, CREATED, timescale, duration)
+    return full_box(b'mdhd', version, times, bytes(4))
+
+
+def stsd(codec):
+    return full_box(b'stsd', 0, struct.pack('>L', 1), box(codec, bytes(78)))
+
+
+def stts(*entries):
+    return full_box(b'stts', 0, struct.pack('>L', len(entries)),
+                    b''.join(struct.pack('>LL', count, delta) for count, delta in entries))
+
+
+def video_track(rotation=0, tkhd_version=0, mdhd_version=0, samples=((375, 1000),)):
+    stbl = box(b'stbl', stsd(b'avc1'), stts(*samples))
+    mdia = box(b'mdia', mdhd(mdhd_version), hdlr(b'vide'), box(b'minf', stbl))
+    return box(b'trak', tkhd(rotation, version=tkhd_version), mdia)
+
+
+def sound_track():
+    stbl = box(b'stbl', stsd(b'mp4a'), stts((587, 1024)))
+    mdia = box(b'mdia', mdhd(timescale=48000, duration=600000), hdlr(b'soun'), box(b'minf', stbl))
+    return box(b'trak', tkhd(width=0, height=0), mdia)
+
+
+def quicktime_string(box_type, text):
+    value = text.encode('utf-8')
+    return box(box_type, struct.pack('>HH', len(value), 0x15c7), value)
+
+
+def data(text):
+    # Type indicator 1 (UTF-8), locale 0
+    return box(b'data', struct.pack('>LL', 1, 0), text.encode('utf-8'))
+
+
+def quicktime_meta(items):
+    """QuickTime 'meta' (no version/flags) with meta/keys + ilst, items are (key, value)"""
+    keys = b''.join(struct.pack('>L4s', 8 + len(key), b'mdta') + key.encode('utf-8') for key, _ in items)
+    ilst = box(b'ilst', *(box(struct.pack('>L', index), data(value))
+                          for index, (_, value) in enumerate(items, 1)))
+    return box(b'meta', hdlr(b'mdta'), full_box(b'keys', 0, struct.pack('>L', len(items)), keys), ilst)
+
+
+def mp4_meta(make, model):
+    """MP4 'meta' full box with ©mak / ©mod ilst items"""
+    ilst = box(b'ilst', box(b'\xa9mak', data(make)), box(b'\xa9mod', data(model)))
+    return full_box(b'meta', 0, hdlr(b'mdir'), ilst)
+
+
+def movie(*moov_children, brand=b'qt  '):
+    ftyp = box(b'ftyp', brand, struct.pack('>L', 0), brand)
+    return ftyp + box(b'moov', *moov_children) + box(b'mdat', bytes(64))
+
+
+def read(data_bytes, extension='.mov'):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'clip' + extension)
+        with open(path, 'wb') as f:
+            f.write(data_bytes)
+        return read_video_metadata(path)
+
+
+def test_movie_header_versions():
+    for version, timescale, duration in ((0, 1000, 12500), (1, 90000, 1125000)):
+        for track_version in (0, 1):
+            fields = read(movie(mvhd(version, timescale, duration),
+                                video_track(tkhd_version=track_version, mdhd_version=track_version),
+                                sound_track()))
+            assert fields is not None, (version, track_version)
+            assert fields['CreateDate'] == CREATE_DATE, fields
+            assert fields['Duration'] == 12.5, fields
+            assert (fields['ImageWidth'], fields['ImageHeight']) == (1920, 1080), fields
+            assert fields['VideoFrameRate'] == 30.0, fields
+            assert fields['CompressorID'] == 'avc1' and fields['HasVideo'], fields
+            assert fields['Latitude'] is None and fields['Make'] is None, fields
+    print("mvhd / tkhd / mdhd versions: OK")
+
+
+def test_frame_rate_from_stts_entries():
+    fields = read(movie(mvhd(), video_track(samples=((100, 1000), (150, 1001), (125, 999)))))
+    assert fields['VideoFrameRate'] == 30.0, fields
+    print("stts sample count: OK")
+
+
+def test_rotation():
+    for rotation in (0, 90, 180, 270):
+        fields = read(movie(mvhd(), video_track(rotation)))
+        assert fields['Rotation'] == rotation, (rotation, fields)
+        assert (fields['ImageWidth'], fields['ImageHeight']) == (1920, 1080), fields
+    print("tkhd rotation: OK")
+
+
+def test_udta_location_and_camera():
+    udta = box(b'udta', quicktime_string(b'\xa9xyz', '-33.8568+151.2153+010.000/'),
+               quicktime_string(b'\xa9mak', 'DJI'), quicktime_string(b'\xa9mod', 'Osmo'))
+    fields = read(movie(mvhd(), video_track(), udta))
+    assert (fields['Latitude'], fields['Longitude']) == (-33.8568, 151.2153), fields
+    assert (fields['Make'], fields['Model']) == ('DJI', 'Osmo'), fields
+    print("udta ©xyz / ©mak / ©mod: OK")
+
+
+def test_keys_location_preferred():
+    """The meta/keys location and camera win over udta, whichever comes first in moov"""
+    udta = box(b'udta', quicktime_string(b'\xa9xyz', '+10.0000+010.0000/'), quicktime_string(b'\xa9mak', 'Other'))
+    meta = quicktime_meta([('com.apple.quicktime.make', 'Apple'),
+                           (ISO6709_KEY, '+22.3027+114.1772+005.000/'),
+                           ('com.apple.quicktime.model', 'iPhone 15')])
+    for children in ((udta, meta), (meta, udta)):
+        fields = read(movie(mvhd(), video_track(), *children))
+        assert (fields['Latitude'], fields['Longitude']) == (22.3027, 114.1772), fields
+        assert (fields['Make'], fields['Model']) == ('Apple', 'iPhone 15'), fields
+    print("keys / ilst preferred over ©xyz: OK")
+
+
+def test_quicktime_and_mp4_meta():
+    """The QuickTime 'meta' has no version/flags, the MP4 one is a full box"""
+    fields = read(movie(mvhd(), video_track(), quicktime_meta([(ISO6709_KEY, '+40.6892-074.0445/')])))
+    assert (fields['Latitude'], fields['Longitude']) == (40.6892, -74.0445), fields
+
+    fields = read(movie(mvhd(), video_track(), box(b'udta', mp4_meta('GoPro', 'HERO12')), brand=b'isom'),
+                  '.mp4')
+    assert (fields['Make'], fields['Model']) == ('GoPro', 'HERO12'), fields
+    assert fields['Latitude'] is None, fields
+    print("QuickTime / MP4 meta: OK")
+
+
+def test_broken_boxes():
+    """A box running past its parent or the end of the file is left to ExifTool"""
+    good = movie(mvhd(), video_track())
+    assert read(good) is not None
+
+    moov = good.index(b'moov') - 4
+    oversized = bytearray(good)
+    struct.pack_into('>L', oversized, moov, len(good))
+    assert read(bytes(oversized)) is None
+
+    child = bytearray(good)
+    mvhd_at = good.index(b'mvhd') - 4
+    struct.pack_into('>L', child, mvhd_at, struct.unpack_from('>L', good, mvhd_at)[0] + 4096)
+    assert read(bytes(child)) is None
+
+    truncated = good[:good.index(b'tkhd') + 40]
+    assert read(truncated) is None
+    assert read(good[:good.index(b'mvhd') + 20]) is None
+    print("Oversized / truncated boxes: OK")
+
+
+if __name__ == "__main__":
+    test_movie_header_versions()
+    test_frame_rate_from_stts_entries()
+    test_rotation()
+    test_udta_location_and_camera()
+    test_keys_location_preferred()
+    test_quicktime_and_mp4_meta()
+    test_broken_boxes()
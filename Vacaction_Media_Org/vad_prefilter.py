@@ -0,0 +1,231 @@
+"""
+Cheap voice pre-filter in front of Silero VAD.
+
+Most action-camera clips carry only wind and ambient noise. The pre-filter looks at every 512-sample
+window of the 16 kHz soundtrack with three vectorized NumPy features:
+
+  energy   window level in dBFS; below silence_db the window is silent
+  zcr      zero-crossing rate; above zcr_max the window is hiss, rain or broadband wind noise
+  flux     voice-band spectral flux: mean rise in dB of the 300-3400 Hz sub-band energies from the
+           previous window, averaged over FLUX_WINDOWS. Syllables switch on and off several times a
+           second, wind and ambient noise change slowly
+
+Only windows that pass all three (plus CONTEXT_WINDOWS on either side) are sent to the neural model;
+a clip without any such window is decided as "no talking" without running it.
+
+The scanner only uses the pre-filter once vad_prefilter.json exists next to this file (the defaults are
+a starting point, not tuned for any camera). It is written by calibration on a labelled sample set:
+
+  python vad_prefilter.py labels.csv [--target-recall 1.0]
+
+labels.csv has one "path,talking" line per clip (talking 1 or 0). Every combination of the
+threshold grids is scored at clip level; the most selective one that still passes target_recall of
+the talking clips is saved together with its precision and recall.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+WINDOW = 512
+VOICE_BAND = (300, 3400)
+SUB_BANDS = 16
+# Windows (about 256 ms) the spectral flux is averaged over
+FLUX_WINDOWS = 8
+# Windows around a candidate that are sent to the model too, so it sees the speech onset
+CONTEXT_WINDOWS = 2
+THRESHOLDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vad_prefilter.json')
+DEFAULT_THRESHOLDS = {'silence_db': -50.0, 'zcr_max': 0.35, 'flux_min': 2.5}
+# Calibration grids
+GRID = {
+    'silence_db': [-60.0, -55.0, -50.0, -45.0, -40.0, -35.0],
+    'zcr_max': [0.25, 0.3, 0.35, 0.45, 1.0],
+    'flux_min': [0.0, 1.5, 2.0, 2.5, 3.0, 3.5, 4.0, 5.0],
+}
+
+_thresholds = None
+
+
+def load_thresholds(path=THRESHOLDS_FILE):
+    """Calibrated thresholds from path, DEFAULT_THRESHOLDS for the missing ones"""
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            calibrated = json.load(f)
+        thresholds.update({key: float(calibrated[key]) for key in DEFAULT_THRESHOLDS if key in calibrated})
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, TypeError) as e:
+        logging.warning(f"Could not read {path}, using the default VAD pre-filter thresholds: {e}")
+    return thresholds
+
+
+def is_calibrated(path=THRESHOLDS_FILE):
+    """True when calibrated thresholds were saved to path"""
+    return os.path.isfile(path)
+
+
+def _band_edges():
+    bins = np.fft.rfftfreq(WINDOW, 1 / SAMPLE_RATE)
+    low, high = np.searchsorted(bins, VOICE_BAND)
+    return np.linspace(low, high, SUB_BANDS + 1).astype(int)
+
+
+_EDGES = _band_edges()
+_HANN = np.hanning(WINDOW).astype(np.float32)
+
+
+def window_features(windows, state=None):
+    """
+    Features of an (n, WINDOW) float array of windows in [-1, 1]: (energy_db, zcr, flux, state).
+    state is the one returned by the preceding call, so the flux continues across chunks.
+    """
+    energy_db = 10 * np.log10(np.mean(windows ** 2, axis=1) + 1e-10)
+    signs = np.signbit(windows)
+    zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+
+    power = np.abs(np.fft.rfft(windows * _HANN, axis=1)) ** 2
+    bands = 10 * np.log10(np.add.reduceat(power[:, _EDGES[0]:_EDGES[-1]], _EDGES[:-1] - _EDGES[0], axis=1) + 1e-10)
+    previous_bands, previous_flux = state if state is not None else (bands[0], np.zeros(0))
+    rise = np.diff(np.vstack((previous_bands[None, :], bands)), axis=0)
+    # A single window's flux is dominated by the noise of the spectrum estimate; averaged over
+    # FLUX_WINDOWS (a syllable) it follows the on/off pattern of speech
+    history = np.concatenate((previous_flux, np.mean(np.maximum(rise, 0), axis=1)))
+    totals = np.concatenate(([0.0], np.cumsum(history)))
+    ends = np.arange(len(previous_flux), len(history)) + 1
+    starts = np.maximum(0, ends - FLUX_WINDOWS)
+    flux = (totals[ends] - totals[starts]) / (ends - starts)
+    return energy_db, zcr, flux, (bands[-1], history[-(FLUX_WINDOWS - 1):])
+
+
+def voice_windows(energy_db, zcr, flux, thresholds):
+    """Windows that pass all three features"""
+    return ((energy_db >= thresholds['silence_db']) & (zcr <= thresholds['zcr_max'])
+            & (flux >= thresholds['flux_min']))
+
+
+def widen(mask):
+    """mask widened by CONTEXT_WINDOWS on either side"""
+    if CONTEXT_WINDOWS and mask.any():
+        mask = np.convolve(mask, np.ones(2 * CONTEXT_WINDOWS + 1), mode='same') > 0
+    return mask
+
+
+def candidate_mask(energy_db, zcr, flux, thresholds):
+    """Windows of a whole clip that may hold speech, widened by CONTEXT_WINDOWS on either side"""
+    return widen(voice_windows(energy_db, zcr, flux, thresholds))
+
+
+class VoicePrefilter:
+    """
+    Per-clip pre-filter state; candidates() is called with consecutive chunks of windows and flush()
+    at the end of the clip. The last CONTEXT_WINDOWS windows of a chunk are held back until the next
+    chunk shows whether speech starts right after them, so the widening crosses chunk boundaries.
+    """
+
+    def __init__(self, thresholds=None):
+        global _thresholds
+        if thresholds is None:
+            if _thresholds is None:
+                _thresholds = load_thresholds()
+            thresholds = _thresholds
+        self.thresholds = thresholds
+        self.state = None
+        self.windows = self.sent = 0
+        self._held = np.zeros((0, WINDOW), dtype=np.float32)
+        # voice_windows() flags of up to CONTEXT_WINDOWS released windows, then of the held ones
+        self._flags = np.zeros(0, dtype=bool)
+
+    def candidates(self, windows):
+        """
+        Windows to send on from an (n, WINDOW) array, as (windows, mask): the held windows of the
+        previous chunk and this chunk's up to its last CONTEXT_WINDOWS, in stream order
+        """
+        energy_db, zcr, flux, self.state = window_features(windows, self.state)
+        return self._release(windows, voice_windows(energy_db, zcr, flux, self.thresholds), final=False)
+
+    def flush(self):
+        """The held windows at the end of the clip, as (windows, mask)"""
+        return self._release(np.zeros((0, WINDOW), dtype=np.float32), np.zeros(0, dtype=bool), final=True)
+
+    def _release(self, windows, flags, final):
+        held = np.concatenate((self._held, windows))
+        flags = np.concatenate((self._flags, flags))
+        context = len(flags) - len(held)
+        ready = len(held) if final else max(0, len(held) - CONTEXT_WINDOWS)
+        mask = widen(flags)[context:context + ready]
+        keep = max(0, context + ready - CONTEXT_WINDOWS)
+        self._held = held[ready:]
+        self._flags = flags[keep:]
+        self.windows += ready
+        self.sent += int(mask.sum())
+        return held[:ready], mask
+
+
+def _longest_run(mask):
+    if not mask.any():
+        return 0
+    padded = np.concatenate(([0], mask.astype(np.int8), [0]))
+    changes = np.flatnonzero(np.diff(padded))
+    return int((changes[1::2] - changes[::2]).max())
+
+
+def calibrate(labels_path, target_recall=1.0, output=THRESHOLDS_FILE):
+    """Pick the thresholds from the GRID on the labelled clips of labels_path and save them to output"""
+    from semantic_analyzer import audio_chunks, speech_windows
+
+    # A clip passes when it has a candidate run long enough for the model to confirm speech
+    min_speech_windows = speech_windows()
+
+    clips = []
+    with open(labels_path, 'r', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or row[0].startswith('#') or row[1].strip() not in ('0', '1'):
+                continue
+            audio = np.concatenate(list(audio_chunks(row[0])) or [np.zeros(0, dtype=np.float32)])
+            usable = len(audio) // WINDOW * WINDOW
+            features = window_features(audio[:usable].reshape(-1, WINDOW))[:3] if usable else None
+            clips.append((row[0], row[1].strip() == '1', features))
+    talking = sum(1 for _, label, _ in clips if label)
+    logging.info(f"Calibrating on {len(clips)} clips, {talking} with talking")
+    if not talking or talking == len(clips):
+        raise ValueError("The labelled set needs clips with and without talking")
+
+    best = None
+    for values in itertools.product(*GRID.values()):
+        thresholds = dict(zip(GRID.keys(), values))
+        passed = [features is not None and _longest_run(candidate_mask(*features, thresholds)) >= min_speech_windows
+                  for _, _, features in clips]
+        true_positives = sum(1 for (_, label, _), sent in zip(clips, passed) if label and sent)
+        recall = true_positives / talking
+        precision = true_positives / sum(passed) if any(passed) else 0.0
+        if recall >= target_recall and (best is None or precision > best['precision']):
+            best = dict(thresholds, precision=round(precision, 4), recall=round(recall, 4),
+                        skipped=round(1 - sum(passed) / len(clips), 4), clips=len(clips))
+    if best is None:
+        raise ValueError(f"No threshold combination reaches a recall of {target_recall}")
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(best, f, indent=2)
+    logging.info(f"Pre-filter thresholds saved to {output}: silence {best['silence_db']} dB, "
+                 f"ZCR <= {best['zcr_max']}, flux >= {best['flux_min']} dB")
+    logging.info(f"Precision {best['precision']:.3f}, recall {best['recall']:.3f}, "
+                 f"{best['skipped']:.1%} of the clips decided without the model")
+    return best
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description='Calibrate the VAD pre-filter thresholds on labelled clips')
+    parser.add_argument('labels', help='CSV file with one "path,talking" line per clip (talking 1 or 0)')
+    parser.add_argument('--target-recall', type=float, default=1.0,
+                        help='Share of the talking clips the pre-filter must pass to the model (default 1.0)')
+    parser.add_argument('--output', default=THRESHOLDS_FILE, help=f'Thresholds file (default {THRESHOLDS_FILE})')
+    args = parser.parse_args()
+    calibrate(args.labels, target_recall=args.target_recall, output=args.output)
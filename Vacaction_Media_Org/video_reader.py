@@ -0,0 +1,230 @@
+"""
+Native MP4/MOV (ISO base media file format) reader for the video fields the scanner uses.
+
+The file is walked box by box: only box headers are read and the `mdat` media data and the large
+sample tables are skipped with seeks. The few small boxes that matter are read completely:
+
+  moov/mvhd                       creation time and duration
+  moov/trak/tkhd                  track dimensions and rotation matrix
+  moov/trak/mdia/hdlr             track type (video / sound)
+  moov/trak/mdia/mdhd             track timescale and duration
+  moov/trak/mdia/minf/stbl/stsd   codec (sample entry four-character code)
+  moov/trak/mdia/minf/stbl/stts   sample count, for the frame rate
+  moov/udta/©xyz                  location as ISO 6709 (DJI, Android, older iPhones)
+  moov/udta/©mak, ©mod            camera make and model (QuickTime), also as ilst items
+  moov/meta/keys + ilst           com.apple.quicktime.location.ISO6709, .make and .model (iPhone)
+
+read_video_metadata() returns the fields in ExifTool's naming (CreateDate in UTC as stored in mvhd,
+like ExifTool without -api QuickTimeUTC), or None when the layout is not understood, in which case
+the caller falls back to ExifTool / ffprobe.
+"""
+
+import logging
+import math
+import os
+import re
+import struct
+from datetime import datetime, timedelta
+
+from exif_reader import read_box_header
+
+# Boxes that only contain other boxes
+CONTAINER_BOXES = {b'moov', b'trak', b'mdia', b'minf', b'stbl', b'udta', b'meta', b'edts', b'ilst'}
+# Boxes whose payload is read (anything else is skipped, as is a variable frame rate stts above MAX_LEAF_SIZE)
+LEAF_BOXES = {b'mvhd', b'tkhd', b'hdlr', b'mdhd', b'stsd', b'stts', b'\xa9xyz', b'\xa9mak', b'\xa9mod',
+              b'keys', b'data'}
+MAX_LEAF_SIZE = 64 * 1024
+MAX_BOXES = 10000
+
+QUICKTIME_EPOCH = datetime(1904, 1, 1)
+ISO6709_KEY = 'com.apple.quicktime.location.ISO6709'
+# meta/keys names and udta / ilst ©-tags of the camera make and model
+CAMERA_KEYS = {'com.apple.quicktime.make': 'make', 'com.apple.quicktime.model': 'model'}
+CAMERA_TAGS = {b'\xa9mak': 'make', b'\xa9mod': 'model'}
+ISO6709_PATTERN = re.compile(r'([+-]\d+(?:\.\d*)?)([+-]\d+(?:\.\d*)?)')
+
+
+class _UnknownLayout(Exception):
+    pass
+
+
+def parse_iso6709(text):
+    """'+25.0330+121.5654+010.000/' -> (25.033, 121.5654); ±DDMM(SS) forms are converted too"""
+    match = ISO6709_PATTERN.match(text.strip())
+    if not match:
+        return None
+
+    def degrees(value, degree_digits):
+        sign = -1 if value[0] == '-' else 1
+        integer, _, fraction = value[1:].partition('.')
+        if len(integer) <= degree_digits:
+            result = float(value[1:])
+        elif len(integer) == degree_digits + 2:
+            result = int(integer[:degree_digits]) + float(integer[degree_digits:] + '.' + fraction) / 60
+        else:
+            result = (int(integer[:degree_digits]) + int(integer[degree_digits:degree_digits + 2]) / 60
+                      + float(integer[degree_digits + 2:] + '.' + fraction) / 3600)
+        return sign * result
+
+    return degrees(match.group(1), 2), degrees(match.group(2), 3)
+
+
+def _quicktime_date(seconds):
+    if not seconds:
+        return '0000:00:00 00:00:00'
+    return (QUICKTIME_EPOCH + timedelta(seconds=seconds)).strftime('%Y:%m:%d %H:%M:%S')
+
+
+class _BoxWalker:
+    def __init__(self, f):
+        self.f = f
+        self.boxes = 0
+        self.create_date = None
+        self.duration = None
+        self.tracks = []
+        self.location = None
+        self.camera = {}         # {'make': ..., 'model': ...}
+        self.keys = []           # meta/keys names, ilst items refer to them by index (1-based)
+        self._track = None
+        self._item = None        # ilst item name (key index or ©-tag) while walking its 'data' box
+
+    def walk(self, end, parent=None):
+        f = self.f
+        while f.tell() + 8 <= end:
+            self.boxes += 1
+            if self.boxes > MAX_BOXES:
+                raise _UnknownLayout("too many boxes")
+            start = f.tell()
+            header = read_box_header(f)
+            if not header:
+                return
+            box_type, size, header_size = header
+            box_end = start + header_size + size
+            if box_end > end or size < 0:
+                raise _UnknownLayout(f"box {box_type!r} exceeds its parent")
+
+            if parent == b'ilst':
+                # ilst items are named by their index into 'keys' (or a ©-tag) and hold 'data' boxes
+                self._item = box_type
+                self.walk(box_end, b'item')
+                self._item = None
+            elif box_type in CONTAINER_BOXES:
+                if box_type == b'trak':
+                    self._track = {}
+                if box_type == b'meta':
+                    # MP4 'meta' is a full box (4 bytes version/flags), the QuickTime one is not
+                    peek = f.read(8)
+                    f.seek(start + header_size + (0 if peek[4:8] == b'hdlr' else 4))
+                self.walk(box_end, box_type)
+                if box_type == b'trak':
+                    self.tracks.append(self._track)
+                    self._track = None
+            elif box_type in LEAF_BOXES and size <= MAX_LEAF_SIZE:
+                self._leaf(box_type, f.read(size), parent)
+            f.seek(box_end)
+
+    def _leaf(self, box_type, payload, parent):
+        if box_type == b'mvhd':
+            if payload[0] == 1:
+                created, _, timescale, duration = struct.unpack_from('>QQLQ', payload, 4)
+            else:
+                created, _, timescale, duration = struct.unpack_from('>LLLL', payload, 4)
+            self.create_date = _quicktime_date(created)
+            self.duration = duration / timescale if timescale else None
+        elif box_type == b'tkhd' and self._track is not None:
+            matrix_offset = 4 + (32 if payload[0] == 1 else 20) + 16
+            a, b = struct.unpack_from('>ll', payload, matrix_offset)
+            width, height = struct.unpack_from('>LL', payload, matrix_offset + 36)
+            self._track['width'] = width >> 16
+            self._track['height'] = height >> 16
+            self._track['rotation'] = round(math.degrees(math.atan2(b, a))) % 360
+        elif box_type == b'hdlr' and self._track is not None and parent == b'mdia':
+            self._track['handler'] = payload[8:12]
+        elif box_type == b'mdhd' and self._track is not None:
+            if payload[0] == 1:
+                timescale, duration = struct.unpack_from('>LQ', payload, 20)
+            else:
+                timescale, duration = struct.unpack_from('>LL', payload, 12)
+            self._track['timescale'] = timescale
+            self._track['duration'] = duration
+        elif box_type == b'stsd' and self._track is not None:
+            # First sample entry: size, then its format (avc1, hvc1, mp4a, ...)
+            if struct.unpack_from('>L', payload, 4)[0]:
+                self._track['codec'] = payload[12:16].decode('latin-1').strip()
+        elif box_type == b'stts' and self._track is not None:
+            count = struct.unpack_from('>L', payload, 4)[0]
+            self._track['samples'] = sum(struct.unpack_from(f'>{2 * count}L', payload, 8)[::2])
+        elif box_type == b'\xa9xyz' and self.location is None:
+            length = struct.unpack_from('>H', payload)[0]
+            self.location = parse_iso6709(payload[4:4 + length].decode('utf-8', 'replace'))
+        elif box_type in CAMERA_TAGS and parent == b'udta':
+            length = struct.unpack_from('>H', payload)[0]
+            self.camera.setdefault(CAMERA_TAGS[box_type], payload[4:4 + length].decode('utf-8', 'replace').strip())
+        elif box_type == b'keys':
+            count = struct.unpack_from('>L', payload, 4)[0]
+            offset = 8
+            for _ in range(count):
+                key_size = struct.unpack_from('>L', payload, offset)[0]
+                self.keys.append(payload[offset + 8:offset + key_size].decode('utf-8', 'replace'))
+                offset += key_size
+        elif box_type == b'data' and parent == b'item' and self._item:
+            # data: type indicator, locale, then the value
+            if self._item in CAMERA_TAGS:
+                self.camera.setdefault(CAMERA_TAGS[self._item], payload[8:].decode('utf-8', 'replace').strip())
+                return
+            index = struct.unpack('>L', self._item)[0] - 1
+            key = self.keys[index] if 0 <= index < len(self.keys) else None
+            if key == ISO6709_KEY:
+                # The keys location is preferred over ©xyz
+                location = parse_iso6709(payload[8:].decode('utf-8', 'replace'))
+                if location:
+                    self.location = location
+            elif key in CAMERA_KEYS:
+                # The keys make and model are preferred over the udta ones
+                self.camera[CAMERA_KEYS[key]] = payload[8:].decode('utf-8', 'replace').strip()
+
+
+def read_video_metadata(filepath):
+    """
+    Return {'CreateDate', 'Latitude', 'Longitude', 'Duration', 'ImageWidth', 'ImageHeight', 'Rotation',
+    'VideoFrameRate', 'CompressorID', 'Make', 'Model', 'HasVideo'} of an MP4/MOV file without spawning
+    a process, or None if it cannot be read.
+    """
+    if os.path.splitext(filepath)[1].lower() not in ('.mp4', '.mov', '.m4v'):
+        return None
+    try:
+        with open(filepath, 'rb') as f:
+            file_size = f.seek(0, os.SEEK_END)
+            f.seek(0)
+            first = read_box_header(f)
+            if not first or first[0] not in (b'ftyp', b'wide', b'free', b'moov', b'mdat', b'skip'):
+                raise _UnknownLayout("not an ISO-BMFF file")
+            f.seek(0)
+            walker = _BoxWalker(f)
+            walker.walk(file_size)
+    except (_UnknownLayout, struct.error, IndexError, ValueError, OSError, OverflowError) as e:
+        logging.debug("Native video reader falls back to ExifTool for %s: %s", filepath, e)
+        return None
+
+    if walker.create_date is None:
+        return None
+    video = next((track for track in walker.tracks
+                  if track.get('handler') == b'vide' or (not track.get('handler') and track.get('width'))), None)
+    latitude, longitude = walker.location or (None, None)
+    frame_rate = None
+    if video and video.get('samples') and video.get('duration') and video.get('timescale'):
+        frame_rate = round(video['samples'] * video['timescale'] / video['duration'], 3)
+    return {
+        'CreateDate': walker.create_date,
+        'Latitude': latitude,
+        'Longitude': longitude,
+        'Duration': walker.duration,
+        'ImageWidth': video.get('width') if video else None,
+        'ImageHeight': video.get('height') if video else None,
+        'Rotation': video.get('rotation') if video else None,
+        'VideoFrameRate': frame_rate,
+        'CompressorID': video.get('codec') if video else None,
+        'Make': walker.camera.get('make') or None,
+        'Model': walker.camera.get('model') or None,
+        'HasVideo': video is not None,
+    }